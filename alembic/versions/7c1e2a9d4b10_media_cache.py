@@ -0,0 +1,31 @@
+"""Media file_id cache
+
+Revision ID: 7c1e2a9d4b10
+Revises: 40f368a8f801
+Create Date: 2026-10-18 10:12:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e2a9d4b10'
+down_revision = '40f368a8f801'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('media_cache',
+    sa.Column('file_path', sa.String(), nullable=False),
+    sa.Column('content_hash', sa.String(), nullable=False),
+    sa.Column('media_type', sa.String(), nullable=False),
+    sa.Column('file_id', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('file_path', 'content_hash')
+    )
+
+
+def downgrade():
+    op.drop_table('media_cache')
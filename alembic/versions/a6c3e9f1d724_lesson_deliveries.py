@@ -0,0 +1,65 @@
+"""Compact lesson delivery plan (replaces scheduled_files)
+
+Revision ID: a6c3e9f1d724
+Revises: f2b8d6a4c951
+Create Date: 2026-10-18 21:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c3e9f1d724'
+down_revision = 'f2b8d6a4c951'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'lesson_deliveries',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('course_id', sa.String(), nullable=False),
+        sa.Column('lesson', sa.Integer(), nullable=False),
+        sa.Column('starts_at', sa.DateTime(), nullable=False),
+        sa.Column('next_file', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('next_send_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('user_id', 'course_id', 'lesson')
+    )
+    op.create_index('ix_lesson_deliveries_due', 'lesson_deliveries', ['next_send_at'],
+                    sqlite_where=sa.text('next_send_at IS NOT NULL'))
+
+    if 'scheduled_files' not in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    # Недоставленные уроки переносим в план: файлы уходили по порядку манифеста,
+    # поэтому курсор = число уже отправленных, старт — время самого раннего файла
+    op.execute('''
+        INSERT INTO lesson_deliveries (user_id, course_id, lesson, starts_at, next_file, next_send_at)
+        SELECT user_id, course_id, lesson, MIN(send_at),
+               SUM(COALESCE(sent, 0)), MIN(CASE WHEN COALESCE(sent, 0) = 0 THEN send_at END)
+        FROM scheduled_files
+        GROUP BY user_id, course_id, lesson
+        HAVING MIN(COALESCE(sent, 0)) = 0
+    ''')
+    op.drop_table('scheduled_files')
+
+
+def downgrade():
+    # Файлы уроков в процессе доставки при откате не восстанавливаются
+    op.create_table(
+        'scheduled_files',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('course_id', sa.String(), nullable=False),
+        sa.Column('lesson', sa.Integer(), nullable=False),
+        sa.Column('file_name', sa.String(), nullable=False),
+        sa.Column('send_at', sa.DateTime(), nullable=False),
+        sa.Column('sent', sa.Boolean(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_scheduled_files_due', 'scheduled_files',
+                    ['user_id', 'course_id', 'lesson', 'send_at'], sqlite_where=sa.text('sent = 0'))
+    op.drop_index('ix_lesson_deliveries_due', table_name='lesson_deliveries')
+    op.drop_table('lesson_deliveries')
@@ -0,0 +1,25 @@
+"""Media cache verification timestamp
+
+Revision ID: b3f5d8e2c6a1
+Revises: 7c1e2a9d4b10
+Create Date: 2026-10-18 11:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f5d8e2c6a1'
+down_revision = '7c1e2a9d4b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('media_cache', sa.Column('verified_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('media_cache') as batch_op:
+        batch_op.drop_column('verified_at')
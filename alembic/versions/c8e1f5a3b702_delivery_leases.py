@@ -0,0 +1,31 @@
+"""Lease columns for the lesson delivery cursor
+
+Revision ID: c8e1f5a3b702
+Revises: a6c3e9f1d724
+Create Date: 2026-10-18 23:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e1f5a3b702'
+down_revision = 'a6c3e9f1d724'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('lesson_deliveries', sa.Column('lease_owner', sa.String(), nullable=True))
+    op.add_column('lesson_deliveries', sa.Column('lease_until', sa.DateTime(), nullable=True))
+    # «Урок отправлен» теперь — конец плана в lesson_deliveries, дедлайны из homeworks не читаются
+    op.drop_index('ix_homeworks_next_lesson_due', table_name='homeworks')
+
+
+def downgrade():
+    op.create_index('ix_homeworks_next_lesson_due', 'homeworks', ['next_lesson_at'],
+                    sqlite_where=sa.text("status = 'approved' AND next_lesson_sent = 0"))
+    with op.batch_alter_table('lesson_deliveries') as batch_op:
+        batch_op.drop_column('lease_until')
+        batch_op.drop_column('lease_owner')
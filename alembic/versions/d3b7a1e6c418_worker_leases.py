@@ -0,0 +1,31 @@
+"""Worker leases for scheduler shards and polling (replaces bot.lock)
+
+Revision ID: d3b7a1e6c418
+Revises: c8e1f5a3b702
+Create Date: 2026-10-19 00:20:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3b7a1e6c418'
+down_revision = 'c8e1f5a3b702'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Строки шардов и поллинга заводит сам процесс при старте (WorkerLeases.start)
+    op.create_table(
+        'worker_leases',
+        sa.Column('name', sa.String(), nullable=False),
+        sa.Column('owner', sa.String(), nullable=True),
+        sa.Column('lease_until', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('worker_leases')
@@ -0,0 +1,35 @@
+"""Single-use activation codes
+
+Revision ID: d91a4c7e2f35
+Revises: b3f5d8e2c6a1
+Create Date: 2026-10-18 14:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91a4c7e2f35'
+down_revision = 'b3f5d8e2c6a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'activation_codes',
+        sa.Column('code', sa.String(), nullable=False),
+        sa.Column('course_id', sa.String(), nullable=False),
+        sa.Column('version_id', sa.String(), nullable=False),
+        sa.Column('is_used', sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('used_at', sa.DateTime(), nullable=True),
+        sa.Column('used_by', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['used_by'], ['users.user_id']),
+        sa.PrimaryKeyConstraint('code')
+    )
+
+
+def downgrade():
+    op.drop_table('activation_codes')
@@ -0,0 +1,45 @@
+"""Persistent FSM storage (replaces user_states)
+
+Revision ID: e4a7c2b9f013
+Revises: d91a4c7e2f35
+Create Date: 2026-10-18 18:30:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7c2b9f013'
+down_revision = 'd91a4c7e2f35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'fsm_storage',
+        sa.Column('key', sa.String(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('destiny', sa.String(), nullable=False),
+        sa.Column('state', sa.String(), nullable=True),
+        sa.Column('data', sa.Text(), nullable=False, server_default='{}'),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('key')
+    )
+    op.create_index('ix_fsm_storage_user_id', 'fsm_storage', ['user_id'])
+
+    # Прогресс учеников переезжает из старой таблицы user_states (если она есть)
+    if 'user_states' in sa.inspect(op.get_bind()).get_table_names():
+        op.execute('''
+            INSERT INTO fsm_storage (key, user_id, destiny, state, data, updated_at)
+            SELECT 'fsm:' || user_id || ':' || user_id || ':course', user_id, 'course', current_state,
+                   json_object('course_id', current_course, 'lesson', current_lesson), datetime('now')
+            FROM user_states
+            WHERE current_state IS NOT NULL
+        ''')
+
+
+def downgrade():
+    op.drop_index('ix_fsm_storage_user_id', table_name='fsm_storage')
+    op.drop_table('fsm_storage')
@@ -0,0 +1,41 @@
+"""Indexes for scheduler and review queries
+
+Revision ID: f2b8d6a4c951
+Revises: e4a7c2b9f013
+Create Date: 2026-10-18 20:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8d6a4c951'
+down_revision = 'e4a7c2b9f013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tables = sa.inspect(op.get_bind()).get_table_names()
+
+    # Частичный индекс видит только next_lesson_sent = 0, NULL туда не попадёт
+    op.execute('UPDATE homeworks SET next_lesson_sent = 0 WHERE next_lesson_sent IS NULL')
+    op.create_index('ix_homeworks_user_lesson', 'homeworks', ['user_id', 'course_id', 'lesson'])
+    op.create_index('ix_homeworks_pending', 'homeworks', ['submission_time'],
+                    sqlite_where=sa.text("status = 'pending'"))
+    op.create_index('ix_homeworks_next_lesson_due', 'homeworks', ['next_lesson_at'],
+                    sqlite_where=sa.text("status = 'approved' AND next_lesson_sent = 0"))
+
+    # scheduled_files создаётся create_all, в старых базах её может не быть
+    if 'scheduled_files' in tables:
+        op.create_index('ix_scheduled_files_due', 'scheduled_files',
+                        ['user_id', 'course_id', 'lesson', 'send_at'], sqlite_where=sa.text('sent = 0'))
+
+
+def downgrade():
+    if 'scheduled_files' in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_index('ix_scheduled_files_due', table_name='scheduled_files')
+    op.drop_index('ix_homeworks_next_lesson_due', table_name='homeworks')
+    op.drop_index('ix_homeworks_pending', table_name='homeworks')
+    op.drop_index('ix_homeworks_user_lesson', table_name='homeworks')
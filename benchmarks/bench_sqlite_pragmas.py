@@ -0,0 +1,60 @@
+"""Бенчмарк профиля SQLite: много мелких commit'ов из параллельных задач.
+
+Сравниваем настройки SQLite по умолчанию (rollback journal, synchronous=FULL)
+с профилем из src/utils/engine.py (WAL, synchronous=NORMAL, busy_timeout...).
+
+Запуск: python -m benchmarks.bench_sqlite_pragmas
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.utils.engine import create_engine, sqlite_pragmas
+
+WORKERS = 8
+COMMITS_PER_WORKER = 100
+PROFILES = {
+    'default': {'busy_timeout': 5000},  # без ожидания блокировки default просто падает с "database is locked"
+    'tuned': sqlite_pragmas(),
+}
+
+
+async def run_profile(path: str, pragmas: dict) -> float:
+    engine = create_engine(f"sqlite+aiosqlite:///{path}", pragmas=pragmas)
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "CREATE TABLE user_states (user_id INTEGER PRIMARY KEY, current_state TEXT, updated_at TEXT)"
+        ))
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def worker(n: int):
+        for i in range(COMMITS_PER_WORKER):
+            async with factory() as session:
+                await session.execute(text(
+                    "INSERT INTO user_states VALUES (:user_id, :state, datetime('now')) "
+                    "ON CONFLICT(user_id) DO UPDATE SET current_state = excluded.current_state"
+                ), {'user_id': n * COMMITS_PER_WORKER + i % 10, 'state': f'state{i}'})
+                await session.commit()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(WORKERS)))
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    return elapsed
+
+
+async def main():
+    total = WORKERS * COMMITS_PER_WORKER
+    print(f"{'profile':>8} {'seconds':>8} {'commits/s':>10}")
+    for name, pragmas in PROFILES.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            elapsed = await run_profile(os.path.join(tmp, 'bench.db'), pragmas)
+        print(f"{name:>8} {elapsed:>8.2f} {total / elapsed:>10.0f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+"""Бенчмарк рендеринга уроков: время должно расти линейно с размером текста.
+
+Запуск: python -m benchmarks.bench_text_processor
+"""
+import timeit
+
+from src.utils.text_processor import process_markdown, process_markdown_simple
+
+PARAGRAPH = (
+    "<p><b>Урок дыхания.</b> Сделай *глубокий* вдох_и_выдох — 3 раза!</p>\n"
+    "— Пункт списка (важно): [заметка] ~почти~ готово.\n"
+    "1. Первый шаг; 2. второй шаг + #хэштег = {итог}!\n\n\n"
+)
+SIZES_KB = (10, 25, 50, 100)
+
+
+def make_text(size_kb: int) -> str:
+    size = size_kb * 1024
+    return (PARAGRAPH * (size // len(PARAGRAPH) + 1))[:size]
+
+
+def bench(func, text: str, repeat: int = 5) -> float:
+    return min(timeit.repeat(lambda: func(text), number=1, repeat=repeat))
+
+
+def main():
+    print(f"{'size':>8} {'MarkdownV2, ms':>15} {'per KB':>8} {'Markdown, ms':>13} {'per KB':>8}")
+    for size_kb in SIZES_KB:
+        text = make_text(size_kb)
+        v2 = bench(process_markdown, text) * 1000
+        v1 = bench(process_markdown_simple, text) * 1000
+        print(f"{size_kb:>6}KB {v2:>15.2f} {v2 / size_kb:>8.3f} {v1:>13.2f} {v1 / size_kb:>8.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Бенчмарк апдейта: отдельная сессия и commit на каждую утилиту против одной сессии на апдейт.
+
+Типичный апдейт (как process_code): проверка курсов, проверка кода, запись на курс, состояние.
+Запуск: python -m benchmarks.bench_update_session
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.utils.engine import create_engine
+from src.utils.models import Base
+from src.utils.session import DbSessionMiddleware
+
+UPDATES = 2000
+STEPS = (
+    "SELECT course_id FROM user_courses WHERE user_id = :user_id",
+    "SELECT code FROM activation_codes WHERE code = :code",
+    "INSERT OR REPLACE INTO user_courses (user_id, course_id, version_id, current_lesson) "
+    "VALUES (:user_id, 'femininity', 'self_check', 1)",
+    "INSERT OR REPLACE INTO users (user_id, name) VALUES (:user_id, 'bench')",
+)
+
+
+async def session_per_call(factory, user_id: int):
+    for sql in STEPS:
+        async with factory() as session:
+            await session.execute(text(sql), {'user_id': user_id, 'code': 'роза'})
+            await session.commit()
+
+
+async def session_per_update(middleware, user_id: int):
+    async def handler(event, data):
+        for sql in STEPS:
+            await data['session'].execute(text(sql), {'user_id': user_id, 'code': 'роза'})
+
+    await middleware(handler, None, {})
+
+
+async def measure(run) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+        started = time.perf_counter()
+        await run(factory)
+        elapsed = time.perf_counter() - started
+        await engine.dispose()
+    return elapsed / UPDATES * 1000
+
+
+async def main():
+    async def per_call(factory):
+        for user_id in range(UPDATES):
+            await session_per_call(factory, user_id)
+
+    async def per_update(factory):
+        middleware = DbSessionMiddleware(factory)
+        for user_id in range(UPDATES):
+            await session_per_update(middleware, user_id)
+
+    print(f"{'strategy':>20} {'ms/update':>10}")
+    print(f"{'session per call':>20} {await measure(per_call):>10.3f}")
+    print(f"{'session per update':>20} {await measure(per_update):>10.3f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,69 @@
+"""Бенчмарк group commit: каждый хендлер со своим commit'ом против общего писателя.
+
+Запуск: python -m benchmarks.bench_write_queue
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.utils.engine import create_engine
+from src.utils.write_queue import WriteQueue
+
+UPSERT = text('''
+    INSERT INTO user_states (user_id, current_state) VALUES (:user_id, :state)
+    ON CONFLICT(user_id) DO UPDATE SET current_state = excluded.current_state
+''')
+CONCURRENCY = (1, 10, 100, 500)
+WRITES = 2000
+
+
+async def per_handler_commit(engine, concurrency: int):
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def handler(i: int):
+        async with semaphore, factory() as session:
+            await session.execute(UPSERT, {'user_id': i, 'state': 'waiting_homework'})
+            await session.commit()
+
+    await asyncio.gather(*(handler(i) for i in range(WRITES)))
+
+
+async def group_commit(engine, concurrency: int):
+    queue = WriteQueue(engine)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def handler(i: int):
+        async with semaphore:
+            await queue.execute(UPSERT, {'user_id': i, 'state': 'waiting_homework'})
+
+    await asyncio.gather(*(handler(i) for i in range(WRITES)))
+    await queue.stop()
+
+
+async def measure(strategy, concurrency: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE TABLE user_states (user_id INTEGER PRIMARY KEY, current_state TEXT)"))
+        started = time.perf_counter()
+        await strategy(engine, concurrency)
+        elapsed = time.perf_counter() - started
+        await engine.dispose()
+    return WRITES / elapsed
+
+
+async def main():
+    print(f"{'handlers':>9} {'commit each, w/s':>17} {'group commit, w/s':>18}")
+    for concurrency in CONCURRENCY:
+        each = await measure(per_handler_commit, concurrency)
+        group = await measure(group_commit, concurrency)
+        print(f"{concurrency:>9} {each:>17.0f} {group:>18.0f}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,12 +1,6 @@
-import os, sys, pytest
+import os, sys
 
 # Добавляем корневую директорию в PYTHONPATH
 # (чтобы Python не заблудился в трёх соснах 🌲🌲🌲)
+# Фикстуры (в том числе db_session) — в tests/conftest.py
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
-
-
-@pytest.fixture
-async def db_session():
-    """Фикстура для тестовой сессии БД (наше спасение!)"""
-    async with AsyncSessionFactory() as session:
-        yield session
\ No newline at end of file
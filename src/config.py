@@ -1,5 +1,6 @@
 import os
 import re
+import socket
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,6 +14,33 @@ TEST_LESSON_DELAY = 5*60  # 5 минут в секундах
 TEST_FILE_DELAY = 30  # 30 секунд между файлами
 NORMAL_LESSON_DELAY = 24*60*60  # 24 часа в секундах (было в минутах)
 
+# Каталог курсов
+COURSES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'courses.json')
+CATALOG_CHECK_INTERVAL = 5  # не чаще раза в N секунд проверяем mtime courses.json
+LESSON_CHECK_INTERVAL = 5  # не чаще раза в N секунд сверяем папку урока с манифестом (mtime/размер файлов)
+
+# Планировщик уроков
+LESSON_QUEUE_RESYNC = 60*60  # раз в час сверяем очередь дедлайнов с БД (страховка)
+DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', '16'))  # параллельных воркеров доставки
+DELIVERY_QUEUE_SIZE = int(os.getenv('DELIVERY_QUEUE_SIZE', '1000'))  # лимит очереди на воркер
+DELIVERY_LEASE = int(os.getenv('DELIVERY_LEASE', '300'))  # сек: аренда урока на время отправки, потом его подхватят заново
+WORKER_ID = os.getenv('WORKER_ID') or f"{socket.gethostname()}:{os.getpid()}"  # владелец аренд в lesson_deliveries
+SCHEDULER_SHARDS = int(os.getenv('SCHEDULER_SHARDS', '16'))  # шардов планировщика (user_id % N), делятся между процессами
+WORKER_LEASE = int(os.getenv('WORKER_LEASE', '30'))  # сек: аренда шарда / поллинга, продлевается каждую треть срока
+
+# Лимиты Telegram Bot API (https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this)
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))  # запросов в секунду на бота
+TELEGRAM_CHAT_RATE = 1.0  # сообщений в секунду в один личный чат
+TELEGRAM_CHAT_BURST = 3  # короткий всплеск в личный чат
+TELEGRAM_GROUP_RATE = 20 / 60  # 20 сообщений в минуту в группу
+
+# Повторы запросов к Telegram
+TELEGRAM_RETRY_ATTEMPTS = 4  # всего попыток, включая первую
+TELEGRAM_RETRY_BASE_DELAY = 1.0  # базовая задержка backoff, секунды
+TELEGRAM_RETRY_MAX_DELAY = 30.0  # потолок backoff, секунды
+TELEGRAM_RETRY_MAX_WAIT = 60  # RetryAfter дольше этого не ждём, сдаёмся
+TELEGRAM_RETRY_BUDGET = 2.0  # не больше N повторов в секунду на весь бот
+
 def is_test_mode():
     return bool(TEST_LESSON_DELAY)
 
@@ -52,8 +80,38 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_GROUP_ID = int(os.getenv('ADMIN_GROUP_ID'))  # Convert to int for Telegram API
 ADMIN_IDS = [int(id_) for id_ in os.getenv('ADMIN_IDS', '').split(',') if id_]  # List of admin IDs
 
+# Прогрев кэша медиа при старте
+MEDIA_WARMUP_CONCURRENCY = int(os.getenv('MEDIA_WARMUP_CONCURRENCY', '4'))  # параллельных загрузок
+MEDIA_WARMUP_CHAT_ID = int(os.getenv('MEDIA_WARMUP_CHAT_ID') or ADMIN_GROUP_ID)  # куда грузить файлы
+MEDIA_REVERIFY_AGE = 7*24*60*60  # file_id старше недели перепроверяем в фоне
+MEDIA_REVERIFY_INTERVAL = 6*60*60  # как часто запускать перепроверку
+MEDIA_REVERIFY_BATCH = 50  # сколько записей проверять за раз
+MEDIA_CACHE_FLUSH_INTERVAL = 5  # раз в N секунд пишем новые file_id в БД пачкой
+MEDIA_CACHE_FLUSH_BATCH = 100  # или сразу, если набралось столько записей
+
+# Кэш отрендеренных текстов уроков
+RENDER_CACHE_MAX_CHARS = int(os.getenv('RENDER_CACHE_MAX_CHARS', str(8 * 1024 * 1024)))  # потолок памяти, символов
+
+# Хранилище состояний (FSM aiogram + курс/урок ученика), см. src/utils/fsm_storage.py
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', '50000'))  # записей в LRU
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', '0.5'))  # сек, изменения пишутся пачкой
+FSM_FLUSH_BATCH = 500  # или сразу, если набралось столько изменённых ключей
+
 # Database configuration
 DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'bot.db')
+DATABASE_URL = os.getenv('DATABASE_URL', f"sqlite+aiosqlite:///{DB_PATH}")
+
+# Профиль SQLite: применяется к каждому новому соединению (см. src/utils/engine.py)
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')  # читатели не блокируют писателя
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')  # в WAL безопасно и без fsync на каждый commit
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000'))  # мс ждём блокировку вместо "database is locked"
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', '-65536'))  # отрицательное — в КиБ (64 МБ)
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))  # байт
+SQLITE_TEMP_STORE = os.getenv('SQLITE_TEMP_STORE', 'MEMORY')
+
+# Group commit: все записи идут через одного писателя (см. src/utils/write_queue.py)
+WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', '200'))  # не больше N записей в одном commit
+WRITE_BATCH_DELAY = float(os.getenv('WRITE_BATCH_DELAY', '0'))  # сек ждём попутчиков; 0 — берём тех, кто уже в очереди
 
 
 
@@ -1,24 +1,28 @@
 from src.keyboards.admin import get_hw_review_kb
 from src.keyboards.user import get_main_keyboard
-from src.utils.db import safe_db_operation,  get_next_lesson, get_pending_homeworks
-from src.utils.course_cache import get_courses_data  # ✅ Правильно
-from src.config import  get_lesson_delay,  is_test_mode,   TEST_MODE,   extract_delay_from_filename
+from src.utils.db import safe_db_operation, get_pending_homeworks
+from src.utils.course_cache import catalog
+from src.config import  is_test_mode,   TEST_MODE
 from aiogram import Router, F, Bot  # Added Bot to imports
 from aiogram.filters import Command
 from aiogram.types import Message, CallbackQuery
-import os
-import glob
 import logging
-from datetime import datetime
 import pytz
-from src.utils.db import safe_db_operation, get_pending_homeworks
-from src.config import DB_PATH  # Import DB_PATH from config instead
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.utils.models import Homework
+from src.utils.user_state import user_states
+from src.utils.write_queue import write_queue
+from src.utils.lesson_queue import DB_TIME_FORMAT, parse_db_time
 #from src.utils.requests import  approve_homework,  reject_homework,  get_pending_homeworks
 from src.utils.course_service import get_course_progress
+from src.services import approval as approval_service
 
 
 logger = logging.getLogger(__name__)
 
+MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+
 def parse_callback_data(callback_data: str) -> tuple[int, str, int]:
     """Parse callback data in format 'hw_approve_user_id_course_id_lesson'"""
     try:
@@ -51,84 +55,26 @@ async def handle_admin_test(callback: CallbackQuery):
 async def approve_homework(callback: CallbackQuery, bot: Bot):  # Добавляем bot в параметры
     try:
         user_id, course_id, lesson = parse_callback_data(callback.data)
-        next_lesson = await get_next_lesson(user_id, course_id)
-        
-        moscow_tz = pytz.timezone('Europe/Moscow')
-        current_time = datetime.now(moscow_tz)
         
-        # Calculate next lesson time
-        result = await safe_db_operation(
-            'SELECT datetime(?, "+" || ? || " seconds")',
-            (current_time.strftime('%Y-%m-%d %H:%M:%S'), str(get_lesson_delay()))
+        # Одна транзакция: статус ДЗ, файлы следующего урока, прогресс и состояние
+        approval = await approval_service.approve_homework(
+            user_id, course_id, lesson, admin_id=callback.from_user.id
         )
-        next_time = await result.fetchone()
-        
-        if not next_time:
-            logger.error("1002 | Failed to calculate next lesson time")
+        if approval is None:
+            await callback.answer("⚠️ Домашняя работа уже проверена")
             return
+        if not approval.files:
+            logger.error(f"1004 | Lesson manifest not found: {course_id}/lesson{approval.next_lesson}")
             
-        next_lesson_time = next_time[0]
-        logger.info(f"1003 | Next lesson scheduled for: {next_lesson_time}")
-        
-        next_lesson = lesson + 1
-        
-        project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-        base_path = os.path.join(project_root, 'data', 'courses', course_id, f'lesson{next_lesson}')
+        logger.info(f"1003 | Next lesson scheduled for: {approval.next_lesson_at}")
         
-        if not os.path.exists(base_path):
-            logger.error(f"1004 | Lesson directory not found: {base_path}")
-            raise FileNotFoundError(f"1005 | Lesson {next_lesson} directory not found")
-            
-        lesson_files = glob.glob(os.path.join(base_path, '*.*'))
-        logger.info(f"1006 | Found {len(lesson_files)} files in lesson {next_lesson}")
-        
-        for file_path in lesson_files:
-            file_name = os.path.basename(file_path)
-            delay = extract_delay_from_filename(file_name)  # This already handles test mode!
-            
-            # Simply store course-relative path
-            course_path = f"courses/{course_id}/lesson{next_lesson}/{file_name}"
-            db_path = course_path.replace('\\', '/')
-            
-            # In approve_homework function:
-            # Simply store file name without path
-            db_path = os.path.basename(file_name)
-            
-            logger.debug(f"1007 | Scheduling file: {db_path} with delay {delay}s")
-            
-            # Используем safe_db_operation для всех операций с БД
-            await safe_db_operation('''
-                INSERT INTO scheduled_files (user_id, course_id, lesson, file_name, send_at)
-                VALUES (?, ?, ?, ?, datetime('now', '+' || ? || ' seconds'))
-            ''', (user_id, course_id, next_lesson, db_path, str(delay)))
-            
-            # Обновляем статус домашки через safe_db_operation
-            await safe_db_operation('''
-                UPDATE homeworks 
-                SET status = 'approved',
-                    approval_time = datetime('now'),
-                    next_lesson_at = ?
-                WHERE user_id = ? AND course_id = ? AND lesson = ? AND status = 'pending'
-            ''', (next_lesson_time, user_id, course_id, lesson))
-            
-            # И состояние пользователя тоже
-            await safe_db_operation('''
-                UPDATE user_states 
-                SET current_state = 'waiting_next_lesson',
-                    current_lesson = ?
-                WHERE user_id = ?
-            ''', (lesson + 1, user_id))
-            
-            # Уведомляем пользователя
-            # После цикла с файлами
-            from src.keyboards.user import get_main_keyboard  # Добавить импорт вверху файла
-            
-            await bot.send_message(
-                user_id,
-                "✅ Домашняя работа принята! Следующий урок будет доступен позже.",
-                reply_markup=get_main_keyboard()
-            )
-            logger.info(f"1008 | Homework approved for user {user_id}")
+        # Уведомляем пользователя
+        await bot.send_message(
+            user_id,
+            "✅ Домашняя работа принята! Следующий урок будет доступен позже.",
+            reply_markup=get_main_keyboard()
+        )
+        logger.info(f"1008 | Homework approved for user {user_id}")
         logger.info(f"1008 | Database updated for user {user_id}, course {course_id}, lesson {lesson}")
                 
     except Exception as e:
@@ -185,44 +131,51 @@ async def reject_homework(callback: CallbackQuery, bot):
 
 
 @router.message(Command("progress", "status"))
-async def show_progress(message: Message):
+async def show_progress(message: Message, session: AsyncSession):
     try:
         # Remove duplicate query
         # result = await safe_db_operation...
         
         user_id = message.from_user.id
         
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute('''
-                SELECT us.current_lesson, us.current_state, 
-                       c.course_name, h.next_lesson_at,
-                       COUNT(CASE WHEN h.status = 'pending' THEN 1 END) as pending_hw
-                FROM user_states us
-                JOIN courses c ON us.course_id = c.course_id
-                LEFT JOIN homeworks h ON us.user_id = h.user_id 
-                WHERE us.user_id = ?
-                GROUP BY us.user_id
-            ''', (user_id,))
-            result = await cursor.fetchone()
-            
-            if not result:
-                await message.answer("❌ У вас пока нет активного курса")
-                return
-                
-            lesson, state, course_name, next_lesson, pending_hw = result
-            
-            # Format next lesson time
-            next_lesson_text = "доступен" if state == 'active' else \
-                             f"будет доступен {next_lesson}" if next_lesson else \
-                             "ожидает проверки домашнего задания"
-            
-            await message.answer(
-                f"📊 Ваш прогресс:\n\n"
-                f"📚 Курс: {course_name}\n"
-                f"📝 Текущий урок: {lesson}\n"
-                f"📅 Следующий урок: {next_lesson_text}\n"
-                f"📋 Непроверенных домашних заданий: {pending_hw}"
+        # Состояние и курс — из памяти, из БД (сессия апдейта) только сводка по ДЗ
+        user_state = await user_states.get(user_id)
+        if not user_state or not user_state.course_id:
+            await message.answer("❌ У вас пока нет активного курса")
+            return
+        
+        result = await session.execute(
+            select(
+                func.max(Homework.next_lesson_at),
+                func.count().filter(Homework.status == 'pending')
+            ).where(
+                Homework.user_id == user_id,
+                Homework.course_id == user_state.course_id
             )
+        )
+        next_lesson, pending_hw = result.one()
+        
+        course = catalog.get(user_state.course_id)
+        course_name = course.name if course else user_state.course_id
+        lesson, state = user_state.lesson, user_state.state
+        
+        # В БД время в UTC, показываем московское
+        next_lesson = parse_db_time(next_lesson)
+        if next_lesson:
+            next_lesson = pytz.utc.localize(next_lesson).astimezone(MOSCOW_TZ).strftime(DB_TIME_FORMAT)
+        
+        # Format next lesson time
+        next_lesson_text = "доступен" if state == 'active' else \
+                         f"будет доступен {next_lesson}" if next_lesson else \
+                         "ожидает проверки домашнего задания"
+        
+        await message.answer(
+            f"📊 Ваш прогресс:\n\n"
+            f"📚 Курс: {course_name}\n"
+            f"📝 Текущий урок: {lesson}\n"
+            f"📅 Следующий урок: {next_lesson_text}\n"
+            f"📋 Непроверенных домашних заданий: {pending_hw}"
+        )
             
     except Exception as e:
         logger.error(f"28 Error in progress command: {e}")
@@ -232,18 +185,19 @@ async def show_progress(message: Message):
 # Переименовываем функцию и исправляем параметры
 async def process_homework_status(user_id: int, course_id: str, lesson: int, status: str, admin_id: int) -> bool:
     try:
-        await safe_db_operation('''
+        updated = await write_queue.execute('''
             UPDATE homeworks 
-            SET status = ?,
-                admin_id = ?,
+            SET status = :status,
+                admin_id = :admin_id,
                 approval_time = datetime('now')
-            WHERE user_id = ? 
-            AND course_id = ? 
-            AND lesson = ?
+            WHERE user_id = :user_id 
+            AND course_id = :course_id 
+            AND lesson = :lesson
             AND status = 'pending'
-        ''', (status, admin_id, user_id, course_id, lesson))
+        ''', {'status': status, 'admin_id': admin_id, 'user_id': user_id,
+              'course_id': course_id, 'lesson': lesson})
         
-        return True
+        return updated > 0
         
     except Exception as e:
         logger.error(f"42 | Error processing homework status: {e}", exc_info=True)
@@ -284,6 +238,10 @@ async def show_other_homeworks(callback: CallbackQuery, bot: Bot):
         # Отправляем галерею работ
         for hw in homeworks:
             file_id, student_id, approved_at = hw
+            # В БД время в UTC, показываем московское
+            approved_at = parse_db_time(approved_at)
+            if approved_at:
+                approved_at = pytz.utc.localize(approved_at).astimezone(MOSCOW_TZ).strftime(DB_TIME_FORMAT)
             caption = f"👤 Ученик: {student_id}\n📅 Одобрено: {approved_at}"
             try:
                 await bot.send_photo(
@@ -338,7 +296,7 @@ async def get_course_statistics(course_id: str) -> str:
 async def show_course_stats(message: Message):
     """Показываем статистику по курсам 📊"""
     try:
-        courses = get_courses_data()
+        courses = catalog.courses
         stats_text = "📊 Статистика по курсам:\n\n"
         
         for course_id in courses:
@@ -352,35 +310,34 @@ async def show_course_stats(message: Message):
 
 
 @router.callback_query(F.data.startswith("hw_"))
-async def handle_hw_review(callback: CallbackQuery):
+async def handle_hw_review(callback: CallbackQuery, session: AsyncSession):
     action, user_id, course_id, lesson = callback.data.split("_")[1:]
     
-    async with AsyncSessionFactory() as session:
-        # Находим ДЗ
-        hw = await session.execute(
-            select(Homework).where(
-                Homework.user_id == user_id,
-                Homework.course_id == course_id,
-                Homework.lesson == lesson
-            )
+    # Находим ДЗ
+    hw = await session.execute(
+        select(Homework).where(
+            Homework.user_id == user_id,
+            Homework.course_id == course_id,
+            Homework.lesson == lesson
         )
-        hw = hw.scalar()
+    )
+    hw = hw.scalar()
         
-        if not hw:
-            await callback.answer("ДЗ не найдено! Возможно, уже проверено.")
-            return
+    if not hw:
+        await callback.answer("ДЗ не найдено! Возможно, уже проверено.")
+        return
             
-        if action == "approve":
-            hw.status = "approved"
-            await schedule_next_lesson(user_id, course_id, lesson + 1)
-            await callback.message.edit_text(
-                f"✅ ДЗ одобрено! Следующий урок запланирован."
-            )
-        else:
-            hw.status = "rejected"
-            await callback.message.edit_text(
-                f"❌ ДЗ отклонено. Ожидаем исправленную версию."
-            )
+    if action == "approve":
+        hw.status = "approved"
+        await schedule_next_lesson(user_id, course_id, lesson + 1)
+        await callback.message.edit_text(
+            f"✅ ДЗ одобрено! Следующий урок запланирован."
+        )
+    else:
+        hw.status = "rejected"
+        await callback.message.edit_text(
+            f"❌ ДЗ отклонено. Ожидаем исправленную версию."
+        )
         
-        await session.commit()
-        await callback.answer()
+    await callback.answer()
+
@@ -4,18 +4,18 @@ import logging
 import os
 import pytz
 import random
-from datetime import datetime
-import glob
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
 from src.utils.db import (
-    safe_db_operation, submit_homework, get_user_state, 
-    set_user_state, get_next_lesson, get_admin_ids
+    safe_db_operation, submit_homework, get_next_lesson, get_admin_ids
 )
-from src.config import get_lesson_delay, extract_delay_from_filename
+from src.utils.requests import get_user_state, set_user_state
 from src.keyboards.admin import get_hw_review_kb, get_rejection_reasons_kb
 from src.keyboards.markup import create_main_menu
+from src.services import approval as approval_service
+from src.utils.write_queue import write_queue
+from src.utils.lesson_queue import DB_TIME_FORMAT, utc_now
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -33,13 +33,13 @@ async def handle_homework(message: Message, bot: Bot):
         logger.debug(f"Получено домашнее задание. Состояние пользователя: {state}")
         
         # Проверяем, что пользователь находится в состоянии ожидания домашнего задания
-        if not state or state[1] != 'waiting_homework':
+        if not state or state.state != 'waiting_homework':
             logger.debug(f"Игнорируем файл - неверное состояние: {state}")
             return
             
         # Получаем информацию о курсе и уроке
-        course_id = state[0]
-        current_lesson = state[2]
+        course_id = state.course_id
+        current_lesson = state.lesson
         
         # Получаем file_id в зависимости от типа сообщения
         if message.photo:
@@ -142,83 +142,23 @@ async def approve_homework(callback: CallbackQuery, bot: Bot):
         
         logger.info(f"Админ {callback.from_user.id} одобряет домашнее задание пользователя {user_id} по курсу {course_id}, урок {lesson}")
         
-        # Получаем следующий урок
-        next_lesson = lesson + 1
-        
-        # Устанавливаем московское время
-        moscow_tz = pytz.timezone('Europe/Moscow')
-        current_time = datetime.now(moscow_tz)
-        
-        # Рассчитываем время следующего урока
-        delay = get_lesson_delay()
-        result = await safe_db_operation(
-            'SELECT datetime(?, "+" || ? || " seconds")',
-            (current_time.strftime('%Y-%m-%d %H:%M:%S'), str(delay))
+        # Всё одобрение — одна транзакция (статус, файлы урока, прогресс, состояние)
+        approval = await approval_service.approve_homework(
+            user_id, course_id, lesson, admin_id=callback.from_user.id, state='waiting_lesson'
         )
-        
-        # Исправляем ошибку с fetchone для списка
-        if result and len(result) > 0:
-            next_time = result[0]
-        else:
-            logger.error("❌ Не удалось рассчитать время следующего урока")
-            await callback.answer("❌ Ошибка при расчете времени следующего урока")
+        if approval is None:
+            await callback.answer("⚠️ Домашнее задание уже проверено")
             return
             
-        next_lesson_time = next_time[0]
+        next_lesson = approval.next_lesson
+        # В БД время в UTC, пользователю показываем московское
+        moscow_tz = pytz.timezone('Europe/Moscow')
+        next_lesson_time = pytz.utc.localize(approval.next_lesson_at).astimezone(moscow_tz).strftime('%Y-%m-%d %H:%M:%S')
         logger.info(f"Следующий урок запланирован на: {next_lesson_time}")
         
-        # Проверяем существование директории следующего урока
-        project_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-        base_path = os.path.join(project_root, 'data', 'courses', course_id, f'lesson{next_lesson}')
-        
-        if not os.path.exists(base_path):
-            logger.warning(f"Директория урока {next_lesson} не найдена: {base_path}")
+        if not approval.files:
+            logger.warning(f"Урок {next_lesson} курса {course_id} не найден")
             await callback.answer(f"⚠️ Урок {next_lesson} не найден, но домашнее задание принято")
-        else:
-            # Находим файлы для следующего урока
-            lesson_files = glob.glob(os.path.join(base_path, '*.*'))
-            logger.info(f"Найдено {len(lesson_files)} файлов в уроке {next_lesson}")
-            
-            # Планируем отправку файлов
-            for file_path in lesson_files:
-                file_name = os.path.basename(file_path)
-                delay = extract_delay_from_filename(file_name)
-                
-                # Сохраняем только имя файла без пути
-                await safe_db_operation(
-                    '''
-                    INSERT INTO scheduled_files 
-                    (user_id, course_id, lesson, file_name, send_at)
-                    VALUES (?, ?, ?, ?, datetime(?, "+" || ? || " seconds"))
-                    ''',
-                    (user_id, course_id, next_lesson, file_name, 
-                     current_time.strftime('%Y-%m-%d %H:%M:%S'), str(delay))
-                )
-        
-        # Обновляем статус домашнего задания
-        await safe_db_operation(
-            '''
-            UPDATE homeworks
-            SET status = 'approved', 
-                approval_time = ?,
-                next_lesson_at = ?,
-                admin_id = ?
-            WHERE user_id = ? AND course_id = ? AND lesson = ? AND status = 'pending'
-            ''',
-            (current_time.strftime('%Y-%m-%d %H:%M:%S'), 
-             next_lesson_time, callback.from_user.id, 
-             user_id, course_id, lesson)
-        )
-        
-        # Обновляем текущий урок пользователя
-        await safe_db_operation(
-            '''
-            UPDATE user_courses
-            SET current_lesson = ?
-            WHERE user_id = ? AND course_id = ?
-            ''',
-            (next_lesson, user_id, course_id)
-        )
         
         # Уведомляем пользователя об одобрении домашнего задания
         await bot.send_message(
@@ -226,14 +166,6 @@ async def approve_homework(callback: CallbackQuery, bot: Bot):
             text=f"✅ Ваше домашнее задание по уроку {lesson} одобрено! Следующий урок будет отправлен {next_lesson_time}."
         )
         
-        # Обновляем состояние пользователя
-        await set_user_state(
-            user_id=user_id,
-            course_id=course_id,
-            state='waiting_lesson',
-            lesson=next_lesson
-        )
-        
         # Обновляем сообщение с клавиатурой
         await callback.message.edit_text(
             f"✅ Домашнее задание пользователя {user_id} по курсу {course_id}, урок {lesson} одобрено!\n"
@@ -399,22 +331,21 @@ async def reject_homework_with_comment(user_id, course_id, lesson, admin_id, com
                                       callback=None, message=None, bot=None):
     """Функция для отклонения домашнего задания с комментарием и картинкой"""
     try:
-        # Устанавливаем московское время
-        moscow_tz = pytz.timezone('Europe/Moscow')
-        current_time = datetime.now(moscow_tz)
+        # approval_time в UTC, как и при одобрении (см. src/services/approval.py)
+        current_time = utc_now()
         
         # Обновляем статус домашнего задания с комментарием
-        await safe_db_operation(
+        await write_queue.execute(
             '''
             UPDATE homeworks
             SET status = 'rejected', 
-                approval_time = ?,
-                admin_id = ?,
-                admin_comment = ?
-            WHERE user_id = ? AND course_id = ? AND lesson = ? AND status = 'pending'
+                approval_time = :approval_time,
+                admin_id = :admin_id,
+                admin_comment = :comment
+            WHERE user_id = :user_id AND course_id = :course_id AND lesson = :lesson AND status = 'pending'
             ''',
-            (current_time.strftime('%Y-%m-%d %H:%M:%S'), 
-             admin_id, comment, user_id, course_id, lesson)
+            {'approval_time': current_time.strftime(DB_TIME_FORMAT), 'admin_id': admin_id,
+             'comment': comment, 'user_id': user_id, 'course_id': course_id, 'lesson': lesson}
         )
         
         # Подготавливаем сообщение для пользователя
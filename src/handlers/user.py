@@ -1,5 +1,5 @@
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command, StateFilter
 import logging
 from aiogram.fsm.context import FSMContext
@@ -11,13 +11,12 @@ from src.keyboards.user import get_main_keyboard  # Добавили импор
 from src.utils.lessons import get_lesson_materials
 from src.utils.db import safe_db_operation  # Устаревший импорт
 from src.utils.requests import get_user  # 2-04
-from src.utils.text_processor import process_markdown_simple
 from src.utils.db import AsyncSessionFactory
 from src.utils.requests import (
     get_user, add_user, verify_course_code, get_user_info
 )
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command, StateFilter
 import logging
 from aiogram.fsm.context import FSMContext
@@ -29,7 +28,6 @@ from src.keyboards.user import get_main_keyboard  # Добавили импор
 from src.utils.lessons import get_lesson_materials
 from src.utils.db import safe_db_operation  # Устаревший импорт
 from src.utils.requests import get_user  # 2-04
-from src.utils.text_processor import process_markdown_simple
 from src.utils.db import AsyncSessionFactory
 from src.utils.requests import (
     get_user, add_user, verify_course_code, get_user_info
@@ -39,7 +37,7 @@ from src.utils.requests import (
     submit_homework, set_user_state, get_user_state  # Added get_user_state
 )
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command, StateFilter
 import logging
 from aiogram.fsm.context import FSMContext
@@ -51,37 +49,39 @@ from src.keyboards.user import get_main_keyboard  # Добавили импор
 from src.utils.lessons import get_lesson_materials
 from src.utils.db import safe_db_operation  # Устаревший импорт
 from src.utils.requests import get_user  # 2-04
-from src.utils.text_processor import process_markdown_simple
 from src.utils.db import AsyncSessionFactory
 from src.utils.requests import (
     get_user, add_user, verify_course_code, get_user_info
 )
 from sqlalchemy import select
-from src.models import UserCourse, UserState  # Add these model imports
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.utils.models import UserCourse
 # Заменяем в импортах
 from src.utils.requests import get_user as get_user_db
 from src.utils.db import AsyncSessionFactory as get_async_session
+from src.utils.media_cache import group_media, media_cache
+from src.utils.render_cache import render_cache
+from src.utils.requests import register_user
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 @router.callback_query(F.data == "resend_lesson")
-async def resend_lesson(callback: CallbackQuery, state: FSMContext):
+async def resend_lesson(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
     try:
         # Replace safe_db_operation with SQLAlchemy query
-        async with AsyncSessionFactory() as session:
-            result = await session.execute(
-                select(UserCourse.course_id, UserCourse.current_lesson)
-                .where(UserCourse.user_id == callback.from_user.id)
-            )
-            course_data = result.first()
+        result = await session.execute(
+            select(UserCourse.course_id, UserCourse.current_lesson)
+            .where(UserCourse.user_id == callback.from_user.id)
+        )
+        course_data = result.first()
             
-            if not course_data:
-                await callback.answer("❌ У вас нет активных курсов")
-                return
+        if not course_data:
+            await callback.answer("❌ У вас нет активных курсов")
+            return
                 
-            course_id, lesson = course_data
-            logger.info(f"User {callback.from_user.id} requesting materials for {course_id}:{lesson}")
+        course_id, lesson = course_data
+        logger.info(f"User {callback.from_user.id} requesting materials for {course_id}:{lesson}")
             
         # Остальной код без изменений
         materials = await get_lesson_materials(course_id, lesson)
@@ -91,31 +91,33 @@ async def resend_lesson(callback: CallbackQuery, state: FSMContext):
             return
             
         sent_count = 0
-        for material in materials:
+        batches = group_media(materials, path=lambda m: m['file_path'])
+        for material in (b[0] if len(b) == 1 else {'type': 'album', 'items': b} for b in batches):
             try:
                 if material['type'] == 'text':
                     logger.debug(f"Sending text content, length: {len(material['content'])}")
                     try:
-                        text = process_markdown_simple(material['content'])
-                        await callback.message.answer(
-                            text,
-                            parse_mode='Markdown'
+                        # Разметка уже разобрана в entities — Telegram ничего не парсит
+                        messages = render_cache.render_messages(
+                            material['content'], material.get('content_hash')
                         )
+                        for text, entities in messages:
+                            await callback.message.answer(text, entities=entities, parse_mode=None)
                         sent_count += 1
                     except Exception as e:
                         logger.error(f"Failed to send text: {e}")
                     
-                elif material['type'] == 'photo':
-                    logger.debug(f"Sending photo: {material['file_path']}")
-                    photo = FSInputFile(material['file_path'])
-                    await callback.message.answer_photo(photo)
+                elif material['type'] in ('photo', 'video'):
+                    logger.debug(f"Sending {material['type']}: {material['file_path']}")
+                    await media_cache.send(callback.bot, callback.message.chat.id, material['file_path'])
                     sent_count += 1
                     
-                elif material['type'] == 'video':
-                    logger.debug(f"Sending video: {material['file_path']}")
-                    video = FSInputFile(material['file_path'])
-                    await callback.message.answer_video(video)
-                    sent_count += 1
+                elif material['type'] == 'album':
+                    # Подряд идущие фото/видео — одним sendMediaGroup
+                    paths = [item['file_path'] for item in material['items']]
+                    logger.debug(f"Sending album: {paths}")
+                    await media_cache.send_group(callback.bot, callback.message.chat.id, paths)
+                    sent_count += len(paths)
                     
             except Exception as e:
                 logger.error(f"Failed to send {material['type']}: {str(e)}", exc_info=True)
@@ -159,43 +161,42 @@ async def start_handler(message: Message, state: FSMContext):
 
     
 @router.message(F.text, StateFilter("waiting_code"))
-async def process_code(message: Message, state: FSMContext):
+async def process_code(message: Message, state: FSMContext, session: AsyncSession):
     code = message.text.strip().lower()
     
-    async with AsyncSessionFactory() as session:
-        # First check if user already has any active courses
-        existing_courses = await session.execute(
-            select(UserCourse).where(UserCourse.user_id == message.from_user.id)
+    # First check if user already has any active courses
+    existing_courses = await session.execute(
+        select(UserCourse).where(UserCourse.user_id == message.from_user.id)
+    )
+    if existing_courses.scalars().first():
+        await message.answer(
+            "⚠️ У вас уже есть активный курс. Используйте /menu для продолжения."
         )
-        if existing_courses.scalars().first():
-            await message.answer(
-                "⚠️ У вас уже есть активный курс. Используйте /menu для продолжения."
-            )
-            await state.clear()
-            return
+        await state.clear()
+        return
             
-        # Then verify the course code
-        success, response = await verify_course_code(code, message.from_user.id)
+    # Then verify the course code
+    success, response = await verify_course_code(code, message.from_user.id)
         
-        if not success:
-            await message.answer(f"❌ {response}\nПопробуй 'роза', 'фиалка' или 'лепесток':")
-            return
+    if not success:
+        await message.answer(f"❌ {response}\nПопробуй 'роза', 'фиалка' или 'лепесток':")
+        return
             
-        # Successful activation
-        markup = get_main_keyboard()
-        await message.answer(
-            f"🎉 Курс активирован! Вот что ты можешь:",
-            reply_markup=markup
-        )
+    # Successful activation
+    markup = get_main_keyboard()
+    await message.answer(
+        f"🎉 Курс активирован! Вот что ты можешь:",
+        reply_markup=markup
+    )
         
-        await message.answer(
-            f"✅ Отлично! Ты активировал курс!\n\n"
-            f"Теперь введи своё имя:"
-        )
+    await message.answer(
+        f"✅ Отлично! Ты активировал курс!\n\n"
+        f"Теперь введи своё имя:"
+    )
         
-        await state.set_state("waiting_name")
-        await state.update_data(course_id=response)
-        await state.clear()  # Очищаем предыдущее состояние
+    await state.set_state("waiting_name")
+    await state.update_data(course_id=response)
+    await state.clear()  # Очищаем предыдущее состояние
 
 @router.message(F.text, StateFilter("waiting_name"))
 async def process_name(message: Message, state: FSMContext):
@@ -205,16 +206,17 @@ async def process_name(message: Message, state: FSMContext):
         return
     
     data = await state.get_data()
-    async with AsyncSessionFactory() as session:
-        if await add_user(session, message.from_user.id, name, data['course_id']):
-            await message.answer(
-                f"🔥 Супер, {name}!\n\n"
-                f"Теперь у тебя есть доступ к курсу!\n"
-                f"Напиши /menu чтобы продолжить"
-            )
-            await state.clear()
-        else:
-            await message.answer("😱 Ой, что-то пошло не так. Попробуй ещё раз /start")
+    # Коммитим сразу (через писателя), а не в конце апдейта: дальше ждём Telegram
+    added = await register_user(message.from_user.id, name, data['course_id'])
+    if added:
+        await message.answer(
+            f"🔥 Супер, {name}!\n\n"
+            f"Теперь у тебя есть доступ к курсу!\n"
+            f"Напиши /menu чтобы продолжить"
+        )
+        await state.clear()
+    else:
+        await message.answer("😱 Ой, что-то пошло не так. Попробуй ещё раз /start")
 
 @router.message(F.photo)
 async def handle_photo(message: Message):
@@ -282,15 +284,3 @@ async def handle_message(message: Message):
         logger.exception(f"File not found for user {message.from_user.id}: {e}")
         # Возможно, стоит предложить пользователю связаться с поддержкой
 
-
-async def get_user_state(user_id: int) -> tuple:
-    """Get current user state from database"""
-    async with AsyncSessionFactory() as session:
-        result = await session.execute(
-            select(UserState)
-            .where(UserState.user_id == user_id)
-        )
-        state = result.scalar_one_or_none()
-        if state:
-            return (state.state, state.course_id, state.lesson)
-        return None
@@ -1,14 +1,24 @@
-import os, sys, json, asyncio, logging
+import sys, json, asyncio, logging
+from contextlib import suppress
 
 from aiogram import Bot, Dispatcher
 from src.utils.db import test_admin_group, AsyncSessionFactory as async_session
 from src.config import BOT_TOKEN
 from src.utils.scheduler import check_and_send_lessons
+from src.utils.rate_limiter import rate_limiter
+from src.utils.retry import retry_policy
+from src.utils.course_cache import catalog
+from src.utils.lesson_manifest import lesson_manifests
+from src.utils.media_cache import media_cache
+from src.utils.write_queue import write_queue
+from src.utils.fsm_storage import fsm_storage
+from src.utils.delivery_cursor import delivery_cursor
+from src.utils.worker_leases import POLLING, worker_leases
 from src.handlers import user, admin
 from logging.handlers import RotatingFileHandler
 
 from src.utils.models import Base
-from src.utils.session import engine
+from src.utils.session import db_session_middleware, engine
 
 # Configure logging at the root level
 logging.basicConfig(
@@ -32,28 +42,56 @@ if not BOT_TOKEN:
     logger.error("BOT_TOKEN not found in environment variables")
     sys.exit(1)
     
-dp = Dispatcher()
+dp = Dispatcher(storage=fsm_storage)  # FSM переживает рестарт (SQLite + кэш в памяти)
+dp.update.outer_middleware(db_session_middleware)  # одна сессия БД и один commit на апдейт
 
-LOCK_FILE = "bot.lock"
+async def stop_polling_on_lease_loss(gained: frozenset, lost: frozenset, lost_roles: set):
+    """Аренду POLLING забрал другой процесс — перестаём читать getUpdates"""
+    if POLLING in lost_roles:
+        with suppress(RuntimeError):  # поллинг ещё не успел стартовать
+            await dp.stop_polling()
 
-def check_single_instance():
-    if os.path.exists(LOCK_FILE):
+
+async def share_rate_limits(*changes):
+    """Лимиты Telegram общие на бота: каждый живой воркер берёт свою долю"""
+    rate_limiter.set_workers(worker_leases.peers + 1)
+
+
+async def poll_under_lease(bot: Bot):
+    """Поллим Telegram, только пока держим аренду POLLING (getUpdates допускает одного читателя).
+
+    Остальные процессы работают планировщиком своих шардов и ждут: упал
+    поллер — его аренда истекает, и поллинг подхватывает следующий.
+    """
+    while True:
+        if not await worker_leases.acquire(POLLING):
+            await asyncio.sleep(worker_leases.interval)
+            continue
+        logger.info(f"Polling as {worker_leases.owner}")
+        # Пока поллил другой процесс, он менял FSM в БД — наш кэш мог устареть
+        # (несохранённые изменения invalidate() не трогает)
+        fsm_storage.invalidate()
+        maintenance = asyncio.create_task(validate_media_cache(bot))
         try:
-            with open(LOCK_FILE, 'r') as f:
-                pid = int(f.read().strip())
-            os.kill(pid, 0)
-            logger.error(f"Bot is already running with PID {pid}")
-            sys.exit(1)
-        except (OSError, ValueError):
-            pass
-    
-    with open(LOCK_FILE, 'w') as f:
-        f.write(str(os.getpid()))
+            await dp.start_polling(bot)
+        finally:
+            maintenance.cancel()
+        if POLLING in worker_leases.roles:
+            return  # остановлены сигналом
+        logger.warning("Polling lease lost, standing by")
 
 async def validate_media_cache(bot: Bot):
-    async with async_session() as session:
-        # Use session for any DB operations
-        pass
+    """Прогрев и перепроверка кэша медиа — только у держателя POLLING.
+
+    Файлы курсов общие на бота: если бы каждый воркер грел и перепроверял
+    их сам, загрузки и get_file умножились бы на число процессов. Остальные
+    воркеры не загружают заново: недостающие file_id дочитывают из media_cache.
+    """
+    try:
+        await media_cache.warm_up(bot)
+    except Exception as e:
+        logger.error(f"Media cache warm-up failed: {e}", exc_info=True)
+    await media_cache.run_reverify(bot)
 
 
 async def init_models():
@@ -63,17 +101,28 @@ async def init_models():
 
 async def main():
     try:
-        check_single_instance()
         logger.info("Starting bot initialization...")
         
         await init_models()  # Добавляем await перед init_models()
 
         logger.info("Database initialized successfully")
+        write_queue.start()  # единственный писатель в SQLite (group commit)
+        fsm_storage.start()  # фоновая запись изменённых состояний
+        await worker_leases.start()  # вместо PID-файла: шарды планировщика и поллинг — аренды в БД
+        await worker_leases.rebalance()
+        await share_rate_limits()
+        worker_leases.subscribe(stop_polling_on_lease_loss)
+        worker_leases.subscribe(share_rate_limits)  # воркеров стало больше/меньше — пересчитываем долю
+        
+        catalog.reload()  # Каталог курсов в память до первого апдейта
+        await asyncio.to_thread(lesson_manifests.compile_all)  # Папки уроков сканируем один раз
         
         dp.include_router(user.router)
         dp.include_router(admin.router)
         
         bot = Bot(token=BOT_TOKEN)
+        bot.session.middleware(retry_policy)  # Снаружи: каждый повтор снова проходит лимитер
+        bot.session.middleware(rate_limiter)  # Все исходящие запросы через лимитер
         
         # Test admin group communication with timeout
         logger.info("Testing admin group communication...")
@@ -87,22 +136,29 @@ async def main():
             logger.error("Admin group test timed out")
             sys.exit(1)
             
-        # Validate media cache
-        await validate_media_cache(bot)
+        # file_id в память — у каждого воркера; прогрев и перепроверку ведёт поллер
+        await media_cache.load()
+        asyncio.create_task(media_cache.run_flusher())
         
         logger.info("Bot started successfully")
 
         # Start schedulers
         asyncio.create_task(check_and_send_lessons(bot))
+        asyncio.create_task(worker_leases.run())
         logger.info("All schedulers are running! 🚀")
         
-        await dp.start_polling(bot)
+        await poll_under_lease(bot)
     except Exception as e:
         logger.error(f"Error during bot startup: {e}", exc_info=True)
         raise
     finally:
-        if os.path.exists(LOCK_FILE):
-            os.remove(LOCK_FILE)
+        from src.utils.delivery import delivery_pool
+        await delivery_pool.stop()
+        await delivery_cursor.release_all()  # недоставленные уроки сразу доступны после рестарта
+        await worker_leases.release_all()  # шарды и поллинг сразу забирают остальные процессы
+        await media_cache.flush()
+        await fsm_storage.close()  # последние состояния — в очередь писателя
+        await write_queue.stop()  # дописываем очередь до закрытия
         from src.utils.cache import shutdown
         await shutdown()
 
@@ -112,6 +168,4 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         logger.info("Received keyboard interrupt")
     finally:
-        logger.info("Shutting down...")
-        if os.path.exists(LOCK_FILE):
-            os.remove(LOCK_FILE)
\ No newline at end of file
+        logger.info("Shutting down...")
\ No newline at end of file
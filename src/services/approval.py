@@ -0,0 +1,109 @@
+import logging
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+from sqlalchemy import text
+
+from src.config import get_lesson_delay
+from src.utils.lesson_manifest import lesson_manifests
+from src.utils.lesson_queue import DB_TIME_FORMAT, lesson_queue, utc_now
+from src.utils.user_state import COURSE_DESTINY, course_key, user_states
+from src.utils.write_queue import write_queue
+
+logger = logging.getLogger(__name__)
+
+APPROVE_HOMEWORK = text('''
+    UPDATE homeworks
+    SET status = 'approved',
+        approval_time = :now,
+        next_lesson_at = :next_lesson_at,
+        admin_id = :admin_id
+    WHERE user_id = :user_id AND course_id = :course_id AND lesson = :lesson AND status = 'pending'
+''')
+# Одна строка плана на урок; повторное одобрение начинает доставку урока заново
+PLAN_DELIVERY = text('''
+    INSERT INTO lesson_deliveries (user_id, course_id, lesson, starts_at, next_file, next_send_at)
+    VALUES (:user_id, :course_id, :lesson, :starts_at, 0, :next_send_at)
+    ON CONFLICT(user_id, course_id, lesson) DO UPDATE SET
+        starts_at = excluded.starts_at,
+        next_file = 0,
+        next_send_at = excluded.next_send_at,
+        lease_owner = NULL,
+        lease_until = NULL
+''')
+ADVANCE_COURSE = text('''
+    UPDATE user_courses
+    SET current_lesson = :lesson
+    WHERE user_id = :user_id AND course_id = :course_id
+''')
+SET_STATE = text('''
+    INSERT INTO fsm_storage (key, user_id, destiny, state, data, updated_at)
+    VALUES (:state_key, :user_id, :destiny, :state,
+            json_object('course_id', :course_id, 'lesson', :lesson), datetime('now'))
+    ON CONFLICT(key) DO UPDATE SET
+        state = excluded.state,
+        data = excluded.data,
+        updated_at = excluded.updated_at
+''')
+
+
+class Approval(NamedTuple):
+    next_lesson: int
+    next_lesson_at: datetime  # UTC, naive — как datetime('now') в SQLite
+    files: int  # сколько файлов в плане доставки следующего урока
+
+
+async def approve_homework(user_id: int, course_id: str, lesson: int, admin_id: Optional[int] = None,
+                           state: str = 'waiting_next_lesson', writer=write_queue,
+                           now: Optional[datetime] = None) -> Optional[Approval]:
+    """Одобряем ДЗ одной транзакцией: статус, план доставки следующего урока, прогресс, состояние.
+
+    Все времена считаются в Python; на урок пишется одна строка плана
+    (старт = next_lesson_at, курсор по манифесту), а не строка на каждый файл.
+    Транзакция идёт через общий писатель (write_queue.transaction) и делит
+    commit с соседними записями. Возвращает None, если
+    ДЗ уже одобрено (повторный клик) или не найдено — тогда ничего не пишется.
+    """
+    now = now or utc_now()
+    next_lesson = lesson + 1
+    next_lesson_at = now + timedelta(seconds=get_lesson_delay())
+    manifest = await lesson_manifests.get(course_id, next_lesson)
+    files = manifest.files if manifest else ()
+    first_send_at = manifest.send_at(next_lesson_at, 0) if manifest else None
+    key = {'user_id': user_id, 'course_id': course_id}
+
+    async def apply(conn) -> bool:
+        result = await conn.execute(APPROVE_HOMEWORK, {
+            **key, 'lesson': lesson, 'admin_id': admin_id,
+            'now': now.strftime(DB_TIME_FORMAT),
+            'next_lesson_at': next_lesson_at.strftime(DB_TIME_FORMAT),
+        })
+        if result.rowcount == 0:
+            return False
+
+        if first_send_at is not None:
+            await conn.execute(PLAN_DELIVERY, {
+                **key, 'lesson': next_lesson,
+                'starts_at': next_lesson_at.strftime(DB_TIME_FORMAT),
+                'next_send_at': first_send_at.strftime(DB_TIME_FORMAT),
+            })
+        await conn.execute(ADVANCE_COURSE, {**key, 'lesson': next_lesson})
+        await conn.execute(SET_STATE, {
+            **key, 'lesson': next_lesson, 'state': state, 'destiny': COURSE_DESTINY,
+            'state_key': user_states.storage.key_builder.build(course_key(user_id)),
+        })
+        return True
+
+    if not await writer.transaction(apply):
+        logger.warning(f"1010 | No pending homework {user_id}/{course_id}/{lesson} to approve")
+        return None
+
+    # Кэш состояний и очередь дедлайнов обновляем только после commit
+    # (кэш перезаписываем, а не сбрасываем: ещё не записанное старое состояние не должно победить)
+    await user_states.set(user_id, course_id, state, next_lesson)
+    # Следующие файлы урока ставит в очередь сам планировщик, сдвигая курсор
+    if first_send_at is not None:
+        lesson_queue.push(first_send_at, user_id, course_id, next_lesson)
+
+    logger.info(f"1011 | Homework {user_id}/{course_id}/{lesson} approved, {len(files)} files scheduled")
+    return Approval(next_lesson, next_lesson_at, len(files))
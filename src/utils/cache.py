@@ -6,12 +6,12 @@ from functools import wraps
 import time
 
 from sqlalchemy import text
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import sessionmaker
 
+from .engine import engine
+
 # Database configuration
-DATABASE_URL = "sqlite+aiosqlite:///c:/Trae/AntBot/data/bot.db"
-engine = create_async_engine(DATABASE_URL)
 async_session = sessionmaker(
     bind=engine,
     class_=AsyncSession,
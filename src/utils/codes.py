@@ -1,35 +1,59 @@
+import logging
+from datetime import datetime
+from typing import Optional
+
 from sqlalchemy import select, update
-from .models import ActivationCode, UsedCode
+
+from .models import ActivationCode
 from .db import safe_db_operation
+from .course_cache import CodeTarget, catalog, normalize_code
+from .write_queue import write_queue
+
+logger = logging.getLogger(__name__)
+
+
+def _target(course_id: str, version_id: str) -> CodeTarget:
+    course = catalog.get(course_id)
+    version = course.version(version_id) if course else None
+    return CodeTarget(course_id, version_id, bool(version and version.self_approved))
+
+
+@safe_db_operation
+async def is_code_used(code: str, session=None) -> bool:
+    result = await session.execute(
+        select(ActivationCode.is_used).where(ActivationCode.code == normalize_code(code))
+    )
+    return bool(result.scalar_one_or_none())
+
+
+@safe_db_operation
+async def find_activation_code(code: str, session=None) -> Optional[CodeTarget]:
+    """Неиспользованный одноразовый код -> куда он ведёт (поиск по первичному ключу)"""
+    result = await session.execute(
+        select(ActivationCode.course_id, ActivationCode.version_id)
+        .where(ActivationCode.code == normalize_code(code))
+        .where(ActivationCode.is_used == False)
+    )
+    row = result.first()
+    return _target(*row) if row else None
+
+
+def claim_statement(code: str, user_id: int):
+    """UPDATE ... RETURNING, гасящий код; пустой результат — код уже использован"""
+    return (
+        update(ActivationCode)
+        .where(ActivationCode.code == normalize_code(code))
+        .where(ActivationCode.is_used == False)
+        .values(is_used=True, used_at=datetime.now(), used_by=user_id)
+        .returning(ActivationCode.course_id, ActivationCode.version_id)
+    )
+
 
-async def is_code_used(code: str) -> bool:
-    async def _check(session, code):
-        result = await session.execute(
-            select(UsedCode).where(UsedCode.code == code)
-        )
-        return result.scalar_one_or_none() is not None
-    return await safe_db_operation(_check, code)
-
-async def verify_activation_code(code: str, user_id: int) -> tuple[bool, str]:
-    async def _verify(session, code, user_id):
-        result = await session.execute(
-            select(ActivationCode)
-            .where(ActivationCode.code == code)
-            .where(ActivationCode.is_used == False)
-        )
-        code_obj = result.scalar_one_or_none()
-        
-        if not code_obj:
-            return False, ""
-            
-        await session.execute(
-            update(ActivationCode)
-            .where(ActivationCode.code == code)
-            .values(
-                is_used=True,
-                used_at=datetime.now(),
-                used_by=user_id
-            )
-        )
-        return True, code_obj.course_id
-    return await safe_db_operation(_verify, code, user_id)
\ No newline at end of file
+async def claim_activation_code(code: str, user_id: int, writer=write_queue) -> Optional[CodeTarget]:
+    """Атомарно гасим одноразовый код: при гонке двух пользователей код получит один"""
+    rows = await writer.fetch(claim_statement(code, user_id))
+    if not rows:
+        return None
+    row = rows[0]
+    logger.info(f"Activation code claimed by {user_id}: {row.course_id}/{row.version_id}")
+    return _target(*row)
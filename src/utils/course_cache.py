@@ -1,20 +1,173 @@
 import json
 import logging
 import os
+import time
+from dataclasses import dataclass, field
+from typing import NamedTuple, Optional
+
+from src.config import COURSES_FILE, CATALOG_CHECK_INTERVAL
 
 logger = logging.getLogger(__name__)
 
+
+@dataclass(frozen=True, slots=True)
+class CourseVersion:
+    """Тариф курса (self_check / admin_check / premium)"""
+    id: str
+    name: str
+    code: str
+    self_approved: bool = False
+    price: dict = field(default_factory=dict)
+    features: tuple = ()
+
+
+@dataclass(frozen=True, slots=True)
+class Course:
+    id: str
+    name: str
+    description: str = ''
+    is_active: bool = True
+    next_lesson_delay: Optional[int] = None
+    versions: tuple = ()
+
+    def version(self, version_id: str) -> Optional[CourseVersion]:
+        return next((v for v in self.versions if v.id == version_id), None)
+
+
+class CodeTarget(NamedTuple):
+    """Куда ведёт кодовое слово"""
+    course_id: str
+    version_id: str
+    self_approved: bool
+
+
+def normalize_code(code: str) -> str:
+    """Кодовые слова сравниваем без регистра и пробелов по краям"""
+    return code.strip().casefold()
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogSnapshot:
+    """Неизменяемый снимок каталога — подменяется целиком при перезагрузке"""
+    courses: dict
+    raw: dict
+    codes: dict = field(default_factory=dict)  # normalize_code(code) -> CodeTarget
+    mtime_ns: int = 0
+    size: int = -1
+
+
+def parse_courses(raw: dict) -> dict[str, Course]:
+    """Разбираем courses.json в типизированные структуры"""
+    courses = {}
+    for course_id, data in raw.items():
+        versions = tuple(
+            CourseVersion(
+                id=v['id'],
+                name=v.get('name', v['id']),
+                code=v.get('code', ''),
+                self_approved=bool(v.get('self_approved', False)),
+                price=dict(v.get('price', {})),
+                features=tuple(v.get('features', ())),
+            )
+            for v in data.get('versions', [])
+        )
+        courses[course_id] = Course(
+            id=course_id,
+            name=data.get('name', course_id),
+            description=data.get('description', ''),
+            is_active=bool(data.get('is_active', True)),
+            next_lesson_delay=data.get('next_lesson_delay'),
+            versions=versions,
+        )
+    return courses
+
+
+def build_code_index(courses: dict[str, Course]) -> dict[str, CodeTarget]:
+    """Индекс кодовых слов: один dict-lookup вместо перебора курсов и тарифов"""
+    codes = {}
+    for course in courses.values():
+        for version in course.versions:
+            if not version.code:
+                continue
+            key = normalize_code(version.code)
+            if key in codes:
+                logger.warning(f"Duplicate course code '{version.code}' in {course.id}/{version.id}")
+                continue
+            codes[key] = CodeTarget(course.id, version.id, version.self_approved)
+    return codes
+
+
+class CourseCatalog:
+    """Каталог курсов на весь процесс.
+
+    courses.json читается один раз; дальше файл проверяется по mtime/размеру
+    не чаще раза в CATALOG_CHECK_INTERVAL секунд. При изменении собирается
+    новый снимок и атомарно подменяет старый, так что читатели всегда
+    видят целостную версию. Битый JSON не ломает каталог — остаётся старый снимок.
+    """
+
+    def __init__(self, path: str = COURSES_FILE, check_interval: float = CATALOG_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = CatalogSnapshot(courses={}, raw={})
+        self._checked_at = float('-inf')
+
+    def _build(self, raw: dict, stat) -> CatalogSnapshot:
+        courses = parse_courses(raw)
+        return CatalogSnapshot(
+            courses=courses, raw=raw, codes=build_code_index(courses),
+            mtime_ns=stat.st_mtime_ns, size=stat.st_size
+        )
+
+    def reload(self, force: bool = False) -> bool:
+        """Перечитываем файл, если он изменился. Возвращаем True, если снимок обновлён."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            logger.error(f"Courses file not found: {self.path}")
+            return False
+
+        current = self._snapshot
+        if not force and (stat.st_mtime_ns, stat.st_size) == (current.mtime_ns, current.size):
+            return False
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                snapshot = self._build(json.load(f), stat)
+        except Exception as e:
+            logger.error(f"Error loading courses data: {e}")
+            return False
+
+        self._snapshot = snapshot  # атомарная подмена
+        logger.info(f"Course catalog loaded: {len(snapshot.courses)} courses")
+        return True
+
+    def _fresh(self) -> CatalogSnapshot:
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            self._checked_at = now
+            self.reload()
+        return self._snapshot
+
+    @property
+    def courses(self) -> dict[str, Course]:
+        return self._fresh().courses
+
+    def get(self, course_id: str) -> Optional[Course]:
+        return self._fresh().courses.get(course_id)
+
+    def resolve_code(self, code: str) -> Optional[CodeTarget]:
+        """Кодовое слово из courses.json -> (course_id, version_id, self_approved)"""
+        return self._fresh().codes.get(normalize_code(code))
+
+    def raw(self) -> dict:
+        """Исходный dict из courses.json (для старого кода)"""
+        return self._fresh().raw
+
+
+catalog = CourseCatalog()
+
+
 def get_courses_data() -> dict:
     """Load courses data from cache"""
-    try:
-        cache_file = os.path.join('data', 'courses', 'courses.json')
-        if not os.path.exists(cache_file):
-            logger.error(f"Courses cache file not found: {cache_file}")
-            return {}
-            
-        with open(cache_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
-            
-    except Exception as e:
-        logger.error(f"Error loading courses data: {e}")
-        return {}
\ No newline at end of file
+    return catalog.raw()
@@ -1,4 +1,6 @@
+from src.config import DB_PATH
 from src.utils.db import safe_db_operation
+from src.utils.engine import sqlite_connection
 import logging
 
 logger = logging.getLogger(__name__)
@@ -6,7 +8,7 @@ logger = logging.getLogger(__name__)
 async def get_course_progress(user_id: int, course_id: str):
     """Получаем прогресс пользователя по курсу 📊"""
     logger.info(f"4001 | Запрашиваем прогресс для user_id={user_id}, course={course_id} 📈")
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with sqlite_connection(DB_PATH) as db:
         # Add lesson metadata
         await db.execute(
             '''
@@ -1,9 +1,9 @@
-import logging, asyncio
+import logging
 from datetime import datetime, timedelta
 from typing import Optional, List, Tuple
 from functools import wraps  # Add this import at the top
 from sqlalchemy import select, update, delete, func
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
@@ -11,7 +11,10 @@ from src.config import ADMIN_GROUP_ID
 import logging
 from sqlalchemy import text  # Add this import at the top
 # Добавляем в начало файла, где другие импорты
-from src.utils.models import User, UserCourse, Homework, ScheduledFile
+from src.utils.models import User, UserCourse, Homework, LessonDelivery
+from src.utils.retry import retry_policy
+from src.utils.lesson_queue import DB_TIME_FORMAT, utc_now
+from src.utils.write_queue import write_queue
 
 
 logger = logging.getLogger(__name__)
@@ -46,7 +49,6 @@ async def test_admin_group(bot: Bot, session: AsyncSession) -> bool:
 
 # Константы
 DEFAULT_RETRY_COUNT = 3
-DEFAULT_RETRY_DELAY = 5
 
 async def verify_course_enrollment(
     session: AsyncSession, 
@@ -78,29 +80,26 @@ async def notify_admins_with_retry(
     markup: InlineKeyboardMarkup,
     retry_count: int = DEFAULT_RETRY_COUNT
 ) -> bool:
-    """Отправка уведомления админам с повторами"""
-    for attempt in range(retry_count):
-        try:
-            await bot.send_photo(
-                chat_id=ADMIN_GROUP_ID,
-                photo=file_id,
-                caption=(
-                    f"📝 Новое домашнее задание!\n"
-                    f"👤 Ученик: {user_data['name']}\n"
-                    f"📚 Курс: {user_data['course_id']}\n"
-                    f"📊 Тариф: {user_data['version_id']}\n"
-                    f"📝 Урок: {user_data['lesson']}"
-                ),
-                reply_markup=markup
-            )
-            return True
-            
-        except Exception as e:
-            logger.warning(f"Попытка {attempt+1} не удалась: {e}")
-            if attempt < retry_count - 1:
-                await asyncio.sleep(DEFAULT_RETRY_DELAY)
-                
-    return False
+    """Отправка уведомления админам с повторами (RetryAfter, backoff, без повторов на постоянных ошибках)"""
+    try:
+        await retry_policy.call(
+            bot.send_photo,
+            chat_id=ADMIN_GROUP_ID,
+            photo=file_id,
+            caption=(
+                f"📝 Новое домашнее задание!\n"
+                f"👤 Ученик: {user_data['name']}\n"
+                f"📚 Курс: {user_data['course_id']}\n"
+                f"📊 Тариф: {user_data['version_id']}\n"
+                f"📝 Урок: {user_data['lesson']}"
+            ),
+            reply_markup=markup,
+            attempts=retry_count
+        )
+        return True
+    except Exception as e:
+        logger.warning(f"Не удалось уведомить админов: {e}")
+        return False
 
 async def get_pending_homeworks(session: AsyncSession) -> list:  # Упрощаем аннотацию
     """Get list of pending homeworks using ORM"""
@@ -125,46 +124,40 @@ async def get_next_lesson(session: AsyncSession, user_id: int, course_id: str) -
         logger.error(f"Error getting next lesson: {e}")
         return 1
 
-async def cleanup_old_scheduled_files(session: AsyncSession, days: int = 7) -> int:
-    """Cleanup old scheduled files using ORM"""
+async def cleanup_finished_deliveries(days: int = 7, writer=write_queue) -> int:
+    """Cleanup fully delivered lesson plans (через общий писатель)"""
     try:
-        result = await session.execute(
-            delete(ScheduledFile)
-            .where(ScheduledFile.sent == True)
-            .where(ScheduledFile.send_at < datetime.now() - timedelta(days=days))
+        return await writer.execute(
+            delete(LessonDelivery)
+            .where(LessonDelivery.next_send_at.is_(None))
+            .where(LessonDelivery.starts_at < (utc_now() - timedelta(days=days)).strftime(DB_TIME_FORMAT))
         )
-        await session.commit()
-        return result.rowcount
     except SQLAlchemyError as e:
-        logger.error(f"Error cleaning scheduled files: {e}")
-        await session.rollback()
+        logger.error(f"Error cleaning lesson deliveries: {e}")
         return 0
 
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 import logging
 from functools import wraps
 
-# Настройка алхимического двигателя 🚀
-DATABASE_URL = "sqlite+aiosqlite:///./antbot.db"
-engine = create_async_engine(DATABASE_URL)
-AsyncSessionFactory = async_sessionmaker(engine, expire_on_commit=False)
+# Настройка алхимического двигателя 🚀 (общий engine с прагмами SQLite)
+from .session import AsyncSessionFactory, session_scope
 
 def safe_db_operation(func):
-    """Декоратор для безопасной работы с БД (без fetch_one)"""
+    """Декоратор для безопасной работы с БД (без fetch_one).
+
+    Внутри апдейта берёт его общую сессию (commit — в DbSessionMiddleware),
+    вне апдейта открывает свою и коммитит сама."""
     @wraps(func)
     async def wrapper(*args, **kwargs):
         try:
-            async with AsyncSessionFactory() as session:
+            async with session_scope() as session:
                 kwargs['session'] = session
-                result = await func(*args, **kwargs)
-                await session.commit()
-                return result
+                return await func(*args, **kwargs)
         except SQLAlchemyError as e:
             logging.error(f"Database error in {func.__name__}: {e}")
-            if 'session' in locals():
-                await session.rollback()
             return None
     return wrapper
 
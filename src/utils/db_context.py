@@ -1,17 +1,18 @@
-import aiosqlite
 from contextlib import asynccontextmanager
 import logging
 
+from src.config import DB_PATH
+from .engine import connect
+
 logger = logging.getLogger(__name__)
 
-DB_PATH = "data/bot.db"
 db_connection = None
 
 @asynccontextmanager
 async def get_db():
     global db_connection
     if db_connection is None:
-        db_connection = await aiosqlite.connect(DB_PATH)
+        db_connection = await connect(DB_PATH)
     try:
         yield db_connection
     finally:
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from src.config import DELIVERY_WORKERS, DELIVERY_QUEUE_SIZE
+
+logger = logging.getLogger(__name__)
+
+DeliveryJob = Callable[[], Awaitable]
+
+
+class DeliveryPool:
+    """Пул воркеров для доставки уроков.
+
+    Каждый user_id всегда попадает в одну и ту же партицию (очередь + воркер),
+    поэтому файлы одного ученика уходят строго по порядку, а разные ученики
+    обслуживаются параллельно. Очереди ограничены — при переполнении submit()
+    ждёт, и планировщик не набирает в память больше, чем успевает отправить.
+    """
+
+    def __init__(self, workers: int = DELIVERY_WORKERS, queue_size: int = DELIVERY_QUEUE_SIZE):
+        if workers < 1:
+            raise ValueError("Нужен хотя бы один воркер доставки")
+        self.workers = workers
+        self.queue_size = queue_size
+        self._queues: list[asyncio.Queue] = []
+        self._tasks: list[asyncio.Task] = []
+        self.in_flight = 0
+        self.processed = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def partition(self, user_id: int) -> int:
+        return int(user_id) % self.workers
+
+    def start(self):
+        if self.running:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._worker(queue), name=f"delivery-worker-{i}")
+            for i, queue in enumerate(self._queues)
+        ]
+        logger.info(f"6001 | Пул доставки запущен: {self.workers} воркеров, очередь до {self.queue_size}")
+
+    async def submit(self, user_id: int, job: DeliveryJob):
+        """Ставим задачу в очередь партиции ученика (ждём, если очередь полна)"""
+        if not self.running:
+            self.start()
+        await self._queues[self.partition(user_id)].put((user_id, job))
+
+    async def join(self):
+        """Ждём, пока все поставленные задачи будут обработаны"""
+        for queue in self._queues:
+            await queue.join()
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queues = []
+        logger.info("6002 | Пул доставки остановлен")
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'queue_depth': sum(queue.qsize() for queue in self._queues),
+            'in_flight': self.in_flight,
+            'processed': self.processed,
+            'failed': self.failed,
+        }
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            user_id, job = await queue.get()
+            self.in_flight += 1
+            try:
+                await job()
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"6003 | Ошибка доставки для {user_id}: {e}", exc_info=True)
+            finally:
+                self.in_flight -= 1
+                queue.task_done()
+
+
+delivery_pool = DeliveryPool()
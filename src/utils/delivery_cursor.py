@@ -0,0 +1,117 @@
+import logging
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+from sqlalchemy import text
+
+from src.config import DELIVERY_LEASE, WORKER_ID
+from .lesson_queue import DB_TIME_FORMAT, parse_db_time, utc_now
+from .write_queue import WriteQueue, write_queue as default_writer
+
+logger = logging.getLogger(__name__)
+
+# Забираем урок, только если файл уже наступил и урок никто не держит (или аренда истекла)
+CLAIM_DELIVERY = text('''
+    UPDATE lesson_deliveries
+    SET lease_owner = :owner, lease_until = :lease_until
+    WHERE user_id = :user_id AND course_id = :course_id AND lesson = :lesson
+    AND next_send_at <= :now
+    AND (lease_until IS NULL OR lease_until <= :now)
+    RETURNING starts_at, next_file
+''')
+# Курсор двигает только владелец аренды и только с того места, откуда начал
+ADVANCE_DELIVERY = text('''
+    UPDATE lesson_deliveries
+    SET next_file = :next_file, next_send_at = :next_send_at,
+        lease_owner = :lease_owner, lease_until = :lease_until
+    WHERE user_id = :user_id AND course_id = :course_id AND lesson = :lesson
+    AND lease_owner = :owner AND next_file = :cursor
+''')
+RELEASE_ALL = text('''
+    UPDATE lesson_deliveries
+    SET lease_owner = NULL, lease_until = NULL
+    WHERE lease_owner = :owner
+''')
+
+
+class Claim(NamedTuple):
+    """Арендованный урок: с какого файла продолжать и до какого времени он наш"""
+    user_id: int
+    course_id: str
+    lesson: int
+    starts_at: datetime
+    next_file: int
+    lease_until: datetime
+
+
+class DeliveryCursor:
+    """Курсор доставки урока с арендой (lease) в lesson_deliveries.
+
+    claim() атомарно забирает наступивший урок на DELIVERY_LEASE секунд,
+    после каждой отправленной пачки advance() сдвигает next_file и продлевает
+    аренду, последний advance() её снимает. Процесс упал — курсор остался
+    там, где закоммичен последний сдвиг, а урок после истечения аренды
+    заберёт следующий claim(): повторно уйдёт максимум одна пачка, пропусков нет.
+    """
+
+    def __init__(self, owner: str = WORKER_ID, lease: float = DELIVERY_LEASE,
+                 writer: WriteQueue = default_writer):
+        self.owner = owner
+        self.lease = lease
+        self.writer = writer
+        self.claims = 0
+        self.advances = 0
+        self.lost = 0
+
+    def _lease_until(self, now: datetime) -> datetime:
+        return (now + timedelta(seconds=self.lease)).replace(microsecond=0)  # в БД время без долей секунды
+
+    async def claim(self, user_id: int, course_id: str, lesson: int,
+                    now: Optional[datetime] = None) -> Optional[Claim]:
+        """Забираем урок; None — файлы ещё не наступили или урок уже у другого воркера"""
+        now = now or utc_now()
+        lease_until = self._lease_until(now)
+        rows = await self.writer.fetch(CLAIM_DELIVERY, {
+            'user_id': user_id, 'course_id': course_id, 'lesson': lesson, 'owner': self.owner,
+            'now': now.strftime(DB_TIME_FORMAT), 'lease_until': lease_until.strftime(DB_TIME_FORMAT),
+        })
+        if not rows:
+            return None
+        self.claims += 1
+        starts_at, next_file = rows[0]
+        return Claim(user_id, course_id, lesson, parse_db_time(starts_at), next_file, lease_until)
+
+    async def advance(self, claim: Claim, next_file: int, next_send_at: Optional[datetime],
+                      release: bool = False, now: Optional[datetime] = None) -> Optional[Claim]:
+        """Сдвигаем курсор. None — аренду у нас уже забрали, дальше слать нельзя."""
+        lease_until = None if release else self._lease_until(now or utc_now())
+        updated = await self.writer.execute(ADVANCE_DELIVERY, {
+            'user_id': claim.user_id, 'course_id': claim.course_id, 'lesson': claim.lesson,
+            'owner': self.owner, 'cursor': claim.next_file, 'next_file': next_file,
+            'next_send_at': next_send_at.strftime(DB_TIME_FORMAT) if next_send_at else None,
+            'lease_owner': None if release else self.owner,
+            'lease_until': lease_until.strftime(DB_TIME_FORMAT) if lease_until else None,
+        })
+        if not updated:
+            self.lost += 1
+            logger.warning(f"6201 | Аренда урока {claim.lesson} ученика {claim.user_id} потеряна")
+            return None
+        self.advances += 1
+        return claim._replace(next_file=next_file, lease_until=lease_until)
+
+    async def release(self, claim: Claim, next_send_at: Optional[datetime]) -> bool:
+        """Отпускаем урок, не сдвигая курсор"""
+        return await self.advance(claim, claim.next_file, next_send_at, release=True) is not None
+
+    async def release_all(self) -> int:
+        """При остановке отдаём свои аренды сразу, не дожидаясь истечения"""
+        released = await self.writer.execute(RELEASE_ALL, {'owner': self.owner})
+        if released:
+            logger.info(f"6202 | Отпущено аренд: {released}")
+        return released
+
+    def stats(self) -> dict:
+        return {'owner': self.owner, 'claims': self.claims, 'advances': self.advances, 'lost': self.lost}
+
+
+delivery_cursor = DeliveryCursor()
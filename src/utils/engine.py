@@ -0,0 +1,73 @@
+import logging
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import aiosqlite
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from src.config import (
+    DATABASE_URL, DB_PATH, SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT,
+    SQLITE_CACHE_SIZE, SQLITE_MMAP_SIZE, SQLITE_TEMP_STORE
+)
+
+logger = logging.getLogger(__name__)
+
+
+def sqlite_pragmas(**overrides) -> dict:
+    """Профиль производительности SQLite из конфига (можно переопределить по ключу)"""
+    pragmas = {
+        'journal_mode': SQLITE_JOURNAL_MODE,
+        'synchronous': SQLITE_SYNCHRONOUS,
+        'busy_timeout': SQLITE_BUSY_TIMEOUT,
+        'cache_size': SQLITE_CACHE_SIZE,
+        'mmap_size': SQLITE_MMAP_SIZE,
+        'temp_store': SQLITE_TEMP_STORE,
+    }
+    pragmas.update(overrides)
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+def pragma_statements(pragmas: dict) -> list[str]:
+    return [f"PRAGMA {name}={value}" for name, value in pragmas.items()]
+
+
+def create_engine(url: str = DATABASE_URL, pragmas: Optional[dict] = None, **kwargs) -> AsyncEngine:
+    """AsyncEngine, который применяет профиль SQLite к каждому новому соединению"""
+    engine = create_async_engine(url, **kwargs)
+    if engine.dialect.name != 'sqlite':
+        return engine
+    statements = pragma_statements(sqlite_pragmas() if pragmas is None else pragmas)
+
+    @event.listens_for(engine.sync_engine, 'connect')
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    return engine
+
+
+async def connect(path: str = DB_PATH, pragmas: Optional[dict] = None) -> aiosqlite.Connection:
+    """Сырое aiosqlite-соединение с тем же профилем (для старого кода на aiosqlite)"""
+    connection = await aiosqlite.connect(path)
+    for statement in pragma_statements(sqlite_pragmas() if pragmas is None else pragmas):
+        await connection.execute(statement)
+    return connection
+
+
+@asynccontextmanager
+async def sqlite_connection(path: str = DB_PATH, pragmas: Optional[dict] = None):
+    """async with-обёртка над connect(): вместо aiosqlite.connect(DB_PATH)"""
+    connection = await connect(path, pragmas)
+    try:
+        yield connection
+    finally:
+        await connection.close()
+
+
+# Один engine на процесс: один пул соединений и один профиль для всех модулей
+engine = create_engine()
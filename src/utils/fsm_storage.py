@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import text
+
+from src.config import FSM_CACHE_SIZE, FSM_FLUSH_BATCH, FSM_FLUSH_INTERVAL
+from .session import AsyncSessionFactory
+from .write_queue import WriteQueue, write_queue as default_write_queue
+
+logger = logging.getLogger(__name__)
+
+GET_RECORD = text('SELECT state, data FROM fsm_storage WHERE key = :key')
+UPSERT_RECORD = text('''
+    INSERT INTO fsm_storage (key, user_id, destiny, state, data, updated_at)
+    VALUES (:key, :user_id, :destiny, :state, :data, datetime('now'))
+    ON CONFLICT(key) DO UPDATE SET
+        state = excluded.state,
+        data = excluded.data,
+        updated_at = excluded.updated_at
+''')
+DELETE_RECORD = text('DELETE FROM fsm_storage WHERE key = :key')
+
+
+class FsmRecord:
+    """Состояние и данные одного ключа (в памяти)"""
+    __slots__ = ('state', 'data')
+
+    def __init__(self, state: Optional[str] = None, data: Optional[dict] = None):
+        self.state = state
+        self.data = data or {}
+
+    @property
+    def empty(self) -> bool:
+        return self.state is None and not self.data
+
+
+def state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище aiogram в SQLite (таблица fsm_storage).
+
+    Чтение — из LRU в памяти, БД только при промахе. Изменения не пишутся
+    сразу: ключ помечается «грязным», и фоновый flush раз в FSM_FLUSH_INTERVAL
+    отдаёт последние значения общему писателю одним executemany — три
+    set_state/update_data подряд в одном хендлере дают одну запись.
+    Грязные ключи не вытесняются из кэша до записи.
+
+    Тут же живёт и «где ученик в курсе» (destiny='course', см. user_state.py),
+    так что состояния диалогов и прогресс переживают рестарт одинаково.
+    """
+
+    def __init__(self, max_entries: int = FSM_CACHE_SIZE, session_factory=AsyncSessionFactory,
+                 writer: WriteQueue = default_write_queue, key_builder: Optional[KeyBuilder] = None):
+        self.max_entries = max_entries
+        self.session_factory = session_factory
+        self.writer = writer
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True, with_business_connection_id=True)
+        self._entries: OrderedDict[str, FsmRecord] = OrderedDict()
+        self._dirty: dict[str, StorageKey] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+    # --- BaseStorage ---
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record.state = state_name(state)
+        self._mark_dirty(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise ValueError(f"Data must be a dict or dict-like object, got {type(data).__name__}")
+        record = await self._record(key)
+        record.data = data.copy()
+        self._mark_dirty(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._record(key)).data.copy()
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    # --- кэш и запись ---
+
+    def start(self, interval: float = FSM_FLUSH_INTERVAL):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self.run_flusher(interval), name="fsm-flusher")
+
+    async def flush(self) -> int:
+        """Пишем последние значения изменённых ключей (executemany через писателя)"""
+        if not self._dirty:
+            return 0
+        batch, self._dirty = self._dirty, {}
+        upserts, deletes = [], []
+        for built, key in batch.items():
+            record = self._entries.get(built)
+            if record is None or record.empty:
+                deletes.append({'key': built})
+            else:
+                upserts.append({
+                    'key': built, 'user_id': key.user_id, 'destiny': key.destiny,
+                    'state': record.state, 'data': json.dumps(record.data, ensure_ascii=False),
+                })
+        try:
+            pending = []
+            if upserts:
+                pending.append(self.writer.submit(UPSERT_RECORD, upserts))
+            if deletes:
+                pending.append(self.writer.submit(DELETE_RECORD, deletes))
+            await asyncio.gather(*pending)
+        except Exception:
+            # Не теряем изменения: ключи снова грязные, запишем следующим flush
+            self._dirty = {**batch, **self._dirty}
+            raise
+        logger.debug(f"FSM storage flushed {len(batch)} keys")
+        return len(batch)
+
+    async def run_flusher(self, interval: float = FSM_FLUSH_INTERVAL):
+        """Фоновый сброс изменённых состояний в БД"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"FSM storage flush failed: {e}", exc_info=True)
+
+    def invalidate(self, key: Optional[StorageKey] = None):
+        """Забываем ключ (или всё), если строку поменяли в обход хранилища"""
+        if key is None:
+            self._entries = OrderedDict((k, v) for k, v in self._entries.items() if k in self._dirty)
+            return
+        built = self.key_builder.build(key)
+        if built not in self._dirty:
+            self._entries.pop(built, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'dirty': len(self._dirty),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+    async def _record(self, key: StorageKey) -> FsmRecord:
+        built = self.key_builder.build(key)
+        record = self._entries.get(built)
+        if record is not None:
+            self._entries.move_to_end(built)
+            self.hits += 1
+            return record
+
+        self.misses += 1
+        async with self.session_factory() as session:
+            row = (await session.execute(GET_RECORD, {'key': built})).first()
+        # Пока читали, ключ мог появиться в кэше (set из другого хендлера) — он свежее
+        record = self._entries.get(built)
+        if record is None:
+            record = FsmRecord(row[0], json.loads(row[1] or '{}')) if row else FsmRecord()
+            self._put(built, record)
+        return record
+
+    def _put(self, built: str, record: FsmRecord):
+        self._entries[built] = record
+        while len(self._entries) > self.max_entries:
+            # Самый старый чистый ключ; только что добавленный не трогаем
+            victim = next((k for k in self._entries if k not in self._dirty and k != built), None)
+            if victim is None:
+                return  # всё грязное — подождём flush
+            del self._entries[victim]
+
+    def _mark_dirty(self, key: StorageKey):
+        self._dirty[self.key_builder.build(key)] = key
+        if len(self._dirty) >= FSM_FLUSH_BATCH and not self._flush_running:
+            self._flush_task = asyncio.create_task(self.flush())
+
+    @property
+    def _flush_running(self) -> bool:
+        return self._flush_task is not None and not self._flush_task.done()
+
+
+fsm_storage = SQLiteStorage()
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from src.config import LESSON_CHECK_INTERVAL, extract_delay_from_filename
+from .media_cache import COURSES_DIR, file_hash, media_type
+
+logger = logging.getLogger(__name__)
+
+TEXT_EXTENSIONS = ('.txt', '.md')
+LESSON_DIR_PATTERN = re.compile(r'lesson(\d+)$')
+
+
+@dataclass(frozen=True, slots=True)
+class LessonFile:
+    """Один файл урока со всем, что нужно для отправки"""
+    name: str
+    path: str
+    kind: str  # text / photo / video / audio / document
+    delay: int  # секунды от начала урока (из суффикса _15min / _1hour)
+    size: int
+    content_hash: str
+    text: Optional[str] = None  # для текстовых файлов — уже прочитанное содержимое
+    mtime_ns: int = 0
+
+
+@dataclass(frozen=True, slots=True)
+class LessonManifest:
+    course_id: str
+    lesson: int
+    files: tuple = ()  # LessonFile, по порядку отправки
+    _by_name: dict = field(default_factory=dict, repr=False, compare=False)
+
+    def file(self, name: str) -> Optional[LessonFile]:
+        return self._by_name.get(name)
+
+    def send_at(self, starts_at: datetime, index: int) -> Optional[datetime]:
+        """Когда отправлять файл с этим индексом; None — файлы урока закончились"""
+        if index >= len(self.files):
+            return None
+        return starts_at + timedelta(seconds=self.files[index].delay)
+
+    def due(self, starts_at: datetime, cursor: int, now: datetime) -> int:
+        """Индекс за последним наступившим файлом: отправляем files[cursor:due]"""
+        end = cursor
+        while end < len(self.files) and starts_at + timedelta(seconds=self.files[end].delay) <= now:
+            end += 1
+        return end
+
+
+def file_kind(name: str) -> str:
+    if os.path.splitext(name)[1].lower() in TEXT_EXTENSIONS:
+        return 'text'
+    return media_type(name) or 'document'
+
+
+def lesson_signature(lesson_dir: Path) -> Optional[tuple]:
+    """(имя, mtime, размер) файлов урока — только stat, без чтения; None — папки нет"""
+    try:
+        with os.scandir(lesson_dir) as entries:
+            return tuple(sorted(
+                (entry.name, stat.st_mtime_ns, stat.st_size)
+                for entry in entries
+                if entry.is_file() and not entry.name.startswith('.')
+                for stat in (entry.stat(),)
+            ))
+    except FileNotFoundError:
+        return None
+
+
+def compile_lesson(lesson_dir: Path, course_id: str, lesson: int,
+                   previous: Optional[LessonManifest] = None) -> LessonManifest:
+    """Разбираем папку урока: тип, задержка, размер, хэш и текст каждого файла.
+
+    Файлы, у которых mtime и размер совпадают с previous, не перечитываются.
+    """
+    files = []
+    with os.scandir(lesson_dir) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name.startswith('.'):
+                continue
+            stat = entry.stat()
+            old = previous.file(entry.name) if previous else None
+            if old and (old.mtime_ns, old.size) == (stat.st_mtime_ns, stat.st_size):
+                files.append(old)
+                continue
+            kind = file_kind(entry.name)
+            text = None
+            if kind == 'text':
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+            files.append(LessonFile(
+                name=entry.name,
+                path=entry.path,
+                kind=kind,
+                delay=extract_delay_from_filename(entry.name),
+                size=stat.st_size,
+                content_hash=file_hash(entry.path),
+                text=text,
+                mtime_ns=stat.st_mtime_ns,
+            ))
+    # Порядок отправки: сначала по задержке, внутри — по имени файла
+    files.sort(key=lambda f: (f.delay, f.name))
+    return LessonManifest(course_id, lesson, tuple(files), {f.name: f for f in files})
+
+
+class _Entry(NamedTuple):
+    manifest: Optional[LessonManifest]
+    signature: Optional[tuple]  # lesson_signature() на момент сборки
+    checked_at: float
+
+
+class LessonManifests:
+    """Скомпилированные манифесты всех уроков.
+
+    Папка урока компилируется один раз (compile_all при старте или первый
+    запрос к уроку), дальше хендлеры и планировщик получают готовый
+    упорядоченный список файлов. Не чаще раза в LESSON_CHECK_INTERVAL
+    секунд папка сверяется по mtime/размеру файлов; если что-то изменилось
+    (или урок появился/пропал), манифест пересобирается — хэши считаются
+    заново только для изменённых файлов. Всё чтение диска идёт в потоке,
+    не в цикле событий.
+    """
+
+    def __init__(self, courses_dir: Path = COURSES_DIR, check_interval: float = LESSON_CHECK_INTERVAL):
+        self.courses_dir = Path(courses_dir)
+        self.check_interval = check_interval
+        self._entries: dict[tuple[str, int], _Entry] = {}
+        self._pending: dict[tuple[str, int], asyncio.Future] = {}
+
+    def lesson_dir(self, course_id: str, lesson: int) -> Path:
+        return self.courses_dir / course_id / f'lesson{lesson}'
+
+    def refresh(self, course_id: str, lesson: int) -> Optional[LessonManifest]:
+        """Сверяем папку урока со снимком и пересобираем при изменениях (блокирующий вызов)"""
+        key = (course_id, lesson)
+        lesson_dir = self.lesson_dir(course_id, lesson)
+        cached = self._entries.get(key)
+        previous = cached.manifest if cached else None
+        signature = lesson_signature(lesson_dir)
+
+        if cached and cached.signature == signature:
+            manifest = previous
+        elif signature is None:
+            logger.warning(f"📁 5560 Lesson directory not found: {lesson_dir}")
+            manifest = None
+        else:
+            try:
+                manifest = compile_lesson(lesson_dir, course_id, lesson, previous)
+            except Exception as e:
+                # Не запоминаем ошибку: при следующем запросе попробуем снова
+                logger.error(f"5561 | Failed to compile lesson manifest {lesson_dir}: {e}")
+                return previous
+        self._entries[key] = _Entry(manifest, signature, time.monotonic())
+        return manifest
+
+    def compile_all(self) -> int:
+        """Компилируем все data/courses/<course>/lessonN (вызывать в потоке — хэши видео)"""
+        compiled = 0
+        for lesson_dir in self.courses_dir.glob('*/lesson*'):
+            match = LESSON_DIR_PATTERN.match(lesson_dir.name)
+            if not match or not lesson_dir.is_dir():
+                continue
+            # По одному ключу, а не подменой словаря: не теряем то, что собрал цикл событий
+            if self.refresh(lesson_dir.parent.name, int(match.group(1))):
+                compiled += 1
+        logger.info(f"📚 5562 Compiled {compiled} lesson manifests")
+        return compiled
+
+    async def get(self, course_id: str, lesson: int) -> Optional[LessonManifest]:
+        """Манифест урока; None — урока нет"""
+        key = (course_id, lesson)
+        cached = self._entries.get(key)
+        if cached and time.monotonic() - cached.checked_at < self.check_interval:
+            return cached.manifest
+
+        pending = self._pending.get(key)
+        if pending is None:
+            # Одна сверка на урок, сколько бы учеников ни ждали его одновременно
+            pending = asyncio.ensure_future(asyncio.to_thread(self.refresh, course_id, lesson))
+            self._pending[key] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(pending)
+
+    def invalidate(self, course_id: Optional[str] = None):
+        if course_id is None:
+            self._entries = {}
+        else:
+            self._entries = {k: v for k, v in self._entries.items() if k[0] != course_id}
+
+
+lesson_manifests = LessonManifests()
@@ -0,0 +1,166 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import bindparam, text
+
+from src.config import LESSON_QUEUE_RESYNC
+from .session import session_scope
+
+logger = logging.getLogger(__name__)
+
+DB_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+LessonKey = tuple[int, str, int]  # (user_id, course_id, lesson)
+
+# Только недоставленные уроки своих шардов (частичный индекс ix_lesson_deliveries_due), а не вся история.
+# Урок под чужой арендой встаёт в очередь на момент её истечения — тогда его можно забрать.
+LOAD_DEADLINES = text('''
+    SELECT user_id, course_id, lesson, MAX(next_send_at, COALESCE(lease_until, next_send_at))
+    FROM lesson_deliveries
+    WHERE next_send_at IS NOT NULL AND next_send_at <= :horizon
+    AND user_id % :shards IN :owned
+''').bindparams(bindparam('owned', expanding=True))
+FAR_FUTURE = datetime(9999, 12, 31, 23, 59, 59)
+
+
+def utc_now() -> datetime:
+    """Текущее время в тех же координатах, что и datetime('now') в SQLite (UTC, naive)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+async def fetch_deadlines(shards: int = 1, owned=(0,), horizon: datetime = FAR_FUTURE) -> list:
+    if not owned:
+        return []
+    async with session_scope() as session:
+        return (await session.execute(LOAD_DEADLINES, {
+            'shards': shards, 'owned': sorted(owned), 'horizon': horizon.strftime(DB_TIME_FORMAT),
+        })).all()
+
+
+def parse_db_time(value) -> Optional[datetime]:
+    """Парсим время из БД (строка 'YYYY-MM-DD HH:MM:SS' или datetime) в UTC, naive.
+
+    Время с таймзоной (например, московское) переводим в UTC, а не
+    отрезаем зону — иначе дедлайн сдвинется на её смещение.
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.replace(tzinfo=None)
+    try:
+        return datetime.strptime(str(value)[:19], DB_TIME_FORMAT)
+    except ValueError:
+        logger.warning(f"5001 | Не удалось распарсить время: {value!r}")
+        return None
+
+
+class LessonQueue:
+    """Очередь дедлайнов уроков на min-heap.
+
+    Вместо опроса БД раз в 100 секунд держим в памяти все будущие
+    next_send_at из lesson_deliveries и спим ровно до ближайшего из них.
+    Новые дедлайны добавляет approve_homework через push().
+    Если задан shards (WorkerLeases), из БД грузятся только свои шарды.
+    """
+
+    def __init__(self, resync_interval: float = LESSON_QUEUE_RESYNC, shards=None):
+        self.resync_interval = resync_interval
+        self.shards = shards
+        self._heap: list[tuple[datetime, int, LessonKey]] = []
+        self._pending: set[tuple[datetime, LessonKey]] = set()
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def push(self, due_at, user_id: int, course_id: str, lesson: int) -> bool:
+        """Добавляем дедлайн (UTC: next_lesson_at + задержка файла). Дубликаты (тот же урок на то же время) игнорируем."""
+        due_at = parse_db_time(due_at)
+        if due_at is None:
+            return False
+
+        key = (int(user_id), course_id, int(lesson))
+        if (due_at, key) in self._pending:
+            return False
+
+        self._pending.add((due_at, key))
+        heapq.heappush(self._heap, (due_at, next(self._counter), key))
+        logger.debug(f"5002 | Дедлайн {key} на {due_at}, в очереди {len(self._heap)}")
+
+        # Будим цикл только если новый дедлайн раньше текущего сна
+        if due_at <= self._heap[0][0]:
+            self._wakeup.set()
+        return True
+
+    def next_due(self) -> Optional[datetime]:
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now: Optional[datetime] = None) -> list[LessonKey]:
+        """Забираем все уроки, чьё время уже наступило (без повторов)"""
+        now = now or utc_now()
+        due: list[LessonKey] = []
+        while self._heap and self._heap[0][0] <= now:
+            due_at, _, key = heapq.heappop(self._heap)
+            self._pending.discard((due_at, key))
+            if key not in due:
+                due.append(key)
+        return due
+
+    def clear(self):
+        self._heap.clear()
+        self._pending.clear()
+
+    async def load(self, horizon: datetime = FAR_FUTURE) -> int:
+        """Загружаем неотправленные дедлайны из БД (при старте, ресинке и смене шардов)"""
+        if self.shards is None:
+            rows = await fetch_deadlines(horizon=horizon)
+        else:
+            rows = await fetch_deadlines(self.shards.shards, self.shards.owned, horizon)
+
+        added = sum(self.push(due_at, user_id, course_id, lesson)
+                    for user_id, course_id, lesson, due_at in rows)
+        logger.info(f"5003 | Загружено дедлайнов: {added}, всего в очереди: {len(self)}")
+        return added
+
+    def _sleep_timeout(self) -> float:
+        next_due = self.next_due()
+        if next_due is None:
+            return self.resync_interval
+        delay = (next_due - utc_now()).total_seconds()
+        return max(0.0, min(delay, self.resync_interval))
+
+    async def run(self, deliver: Callable[[int, str, int], Awaitable]):
+        """Основной цикл: спим до ближайшего дедлайна, отдаём уроки в deliver"""
+        loop = asyncio.get_running_loop()
+        last_resync = loop.time()
+
+        while True:
+            for user_id, course_id, lesson in self.pop_due():
+                try:
+                    await deliver(user_id, course_id, lesson)
+                except Exception as e:
+                    logger.error(f"5004 | Ошибка доставки урока {lesson} для {user_id}: {e}", exc_info=True)
+
+            # Страховка на случай записей, добавленных в БД в обход push()
+            if loop.time() - last_resync >= self.resync_interval:
+                try:
+                    await self.load()
+                except Exception as e:
+                    logger.error(f"5005 | Ошибка ресинка очереди: {e}", exc_info=True)
+                last_resync = loop.time()
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._sleep_timeout())
+            except asyncio.TimeoutError:
+                pass
+
+
+lesson_queue = LessonQueue()
@@ -1,60 +1,26 @@
-import os
-import aiofiles
 import logging
 
+from src.config import DB_PATH
+from src.utils.engine import sqlite_connection
+from src.utils.lesson_manifest import lesson_manifests
+
 logger = logging.getLogger(__name__)
 
 async def get_lesson_materials(course_id: str, lesson: int):
-    # Исправляем путь к урокам - у нас lesson{N}, а не lessons/lesson_{N}
-    base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))  # Корень проекта
-    lesson_dir = os.path.join(base_dir, "data", "courses", course_id, f"lesson{lesson}")
-    
-    logger.info(f"Ищем материалы в директории: {lesson_dir}")
-    
-    materials = []
+    """Материалы урока из скомпилированного манифеста (тексты уже прочитаны)"""
     try:
-        # Проверяем, существует ли директория
-        if not os.path.exists(lesson_dir):
-            logger.error(f"Директория урока не найдена: {lesson_dir}")
+        manifest = await lesson_manifests.get(course_id, lesson)
+        if not manifest:
+            logger.error(f"Урок не найден: {course_id}/lesson{lesson}")
             return []
-            
-        for filename in os.listdir(lesson_dir):
-            file_path = os.path.join(lesson_dir, filename)
-            
-            # Skip directories
-            if os.path.isdir(file_path):
-                continue
-                
-            # Determine type by extension
-            ext = os.path.splitext(filename)[1].lower()
-            
-            if ext in ['.txt', '.md']:
-                async with aiofiles.open(file_path, 'r', encoding='utf-8') as f:
-                    content = await f.read()
-                materials.append({
-                    'type': 'text',
-                    'content': content,
-                    'file_path': file_path
-                })
-                logger.info(f"Загрузили текст из {file_path}")
-                
-            elif ext in ['.jpg', '.jpeg', '.png']:
-                materials.append({
-                    'type': 'photo',
-                    'file_path': file_path
-                })
-                logger.info(f"Добавили фото: {file_path}")
-                
-            elif ext in ['.mp4', '.avi', '.mov']:
-                materials.append({
-                    'type': 'video',
-                    'file_path': file_path
-                })
-                logger.info(f"Добавили видео: {file_path}")
-                
-        # Sort materials by filename to maintain order
-        materials.sort(key=lambda x: x['file_path'])
-        
+
+        materials = []
+        for f in sorted(manifest.files, key=lambda f: f.name):
+            if f.kind == 'text':
+                materials.append({'type': 'text', 'content': f.text, 'file_path': f.path,
+                                  'content_hash': f.content_hash})
+            elif f.kind in ('photo', 'video'):
+                materials.append({'type': f.kind, 'file_path': f.path})
         return materials
     except Exception as e:
         logger.error(f"Ошибка загрузки материалов: {e}")
@@ -63,7 +29,7 @@ async def get_lesson_materials(course_id: str, lesson: int):
 
 async def add_lesson_to_course(course_id: str, lesson_data: dict):
     """Add new lesson to course (moved from services/course.py)"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with sqlite_connection(DB_PATH) as db:
         # Add lesson metadata
         await db.execute(
             '''
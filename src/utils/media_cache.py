@@ -1,79 +1,424 @@
+import asyncio
+import hashlib
 import os
+from datetime import datetime, timedelta
 from pathlib import Path
-import json
 import logging
-from .models import MediaCache as MediaCacheModel  # Нужно добавить модель
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, InputMediaPhoto, InputMediaVideo
+from sqlalchemy import bindparam, delete, insert, or_, select, update
+
+from src.config import (
+    ADMIN_GROUP_ID, MEDIA_WARMUP_CONCURRENCY, MEDIA_WARMUP_CHAT_ID,
+    MEDIA_REVERIFY_AGE, MEDIA_REVERIFY_INTERVAL, MEDIA_REVERIFY_BATCH,
+    MEDIA_CACHE_FLUSH_INTERVAL, MEDIA_CACHE_FLUSH_BATCH
+)
+from .models import MediaCache as MediaCacheModel
+from .rate_limiter import bulk_lane
+from .session import AsyncSessionFactory
+from .write_queue import write_queue
 
 logger = logging.getLogger(__name__)
 
+COURSES_DIR = Path(__file__).resolve().parents[2] / 'data' / 'courses'
+
+# Расширение -> тип медиа (он же суффикс метода bot.send_<type>)
+MEDIA_TYPES = {
+    '.jpg': 'photo', '.jpeg': 'photo', '.png': 'photo',
+    '.mp4': 'video', '.avi': 'video', '.mov': 'video',
+    '.mp3': 'audio', '.ogg': 'audio',
+}
+
+
+def media_type(file_path) -> Optional[str]:
+    return MEDIA_TYPES.get(Path(file_path).suffix.lower())
+
+
+# Что можно собрать в альбом sendMediaGroup (аудио с фото не смешиваются)
+ALBUM_MEDIA = {'photo': InputMediaPhoto, 'video': InputMediaVideo}
+MEDIA_GROUP_LIMIT = 10  # максимум элементов в одном альбоме
+
+
+def group_media(items: list, path=lambda item: item, key=lambda item: None) -> list[list]:
+    """Режем последовательность на отправки: подряд идущие фото/видео с одним
+    key (например, временем отправки) — альбомами до MEDIA_GROUP_LIMIT,
+    всё остальное по одному. Порядок сохраняется."""
+    batches = []
+    for item in items:
+        albumable = media_type(path(item)) in ALBUM_MEDIA
+        last = batches[-1] if batches else None
+        if (albumable and last and len(last) < MEDIA_GROUP_LIMIT
+                and media_type(path(last[-1])) in ALBUM_MEDIA
+                and key(last[-1]) == key(item)):
+            last.append(item)
+        else:
+            batches.append([item])
+    return batches
+
+
+def file_hash(file_path) -> str:
+    """sha256 содержимого файла (читаем кусками, видео бывают большие)"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Так Telegram отвечает на протухший или чужой file_id
+INVALID_FILE_ID_MARKERS = ('file identifier', 'file_id', 'file reference')
+
+
+def is_invalid_file_id(exc: Exception) -> bool:
+    return isinstance(exc, TelegramBadRequest) and any(
+        marker in str(exc).lower() for marker in INVALID_FILE_ID_MARKERS
+    )
+
+
+def extract_file_id(message, kind: str) -> Optional[str]:
+    """Достаём file_id из ответа Telegram на отправку"""
+    if kind == 'photo' and message.photo:
+        return message.photo[-1].file_id
+    media = getattr(message, kind, None)
+    return media.file_id if media else None
+
+
 class MediaCache:
-    def __init__(self):
-        self.cache_file = Path('data/media_cache.json')
-        self.cache = self._load_cache()
+    """Кэш file_id для медиафайлов уроков.
 
-    def _load_cache(self):
-        if self.cache_file.exists():
-            try:
-                with open(self.cache_file, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                logger.error(f"Failed to load media cache: {e}")
-                return {}
-        return {}
-
-    def _save_cache(self):
-        self.cache_file.parent.mkdir(exist_ok=True)
-        with open(self.cache_file, 'w') as f:
-            json.dump(self.cache, f, indent=2)
-
-    async def get_media_id(self, file_path: str, bot) -> str:
-        """Get file_id from cache or upload new file"""
-        async with AsyncSessionFactory() as session:
-            cached = await session.execute(
-                select(MediaCacheModel)
-                .where(MediaCacheModel.file_path == file_path)
+    Ключ — путь относительно data/courses плюс хэш содержимого: если файл
+    заменили, хэш меняется и файл загрузится заново. Первая отправка
+    загружает файл, все следующие (другим ученикам, при повторе урока)
+    уходят по file_id без повторной загрузки.
+
+    Таблица читается целиком один раз в load(), дальше поиск — это словарь
+    в памяти (промах дочитывается из БД по ключу). Новые записи не пишутся по одной: они копятся и сбрасываются
+    в БД пачкой (flush) по таймеру или при наборе MEDIA_CACHE_FLUSH_BATCH.
+    Все записи идут через общий писатель (write_queue), сессии — только на чтение.
+    """
+
+    def __init__(self, session_factory=AsyncSessionFactory, courses_dir: Path = COURSES_DIR,
+                 writer=write_queue):
+        self._session_factory = session_factory
+        self._writer = writer
+        self.courses_dir = Path(courses_dir)
+        self._ids: dict[tuple[str, str], str] = {}
+        self._hashes: dict[str, tuple[int, int, str]] = {}
+        self._uploads: dict[tuple[str, str], asyncio.Future] = {}
+        self._dirty: dict[tuple[str, str], dict] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def relative_path(self, file_path) -> str:
+        path = Path(file_path).resolve()
+        try:
+            return path.relative_to(self.courses_dir.resolve()).as_posix()
+        except ValueError:
+            return Path(file_path).as_posix()
+
+    async def content_hash(self, file_path) -> str:
+        """Хэш файла; пересчитываем только если изменились mtime или размер"""
+        stat = os.stat(file_path)
+        key = str(file_path)
+        cached = self._hashes.get(key)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        digest = await asyncio.to_thread(file_hash, file_path)
+        self._hashes[key] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    async def _cache_key(self, file_path) -> tuple[str, str]:
+        return self.relative_path(file_path), await self.content_hash(file_path)
+
+    async def load(self) -> int:
+        """Читаем всю таблицу в память (один проход по первичному ключу)"""
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(MediaCacheModel.file_path, MediaCacheModel.content_hash, MediaCacheModel.file_id)
             )
-        abs_path = Path(file_path)
-        
-        if not abs_path.exists():
-            logger.error(f"Media file not found: {file_path}")
-            return None
+            for file_path, content_hash, file_id in result:
+                self._ids.setdefault((file_path, content_hash), file_id)
+        logger.info(f"Media cache loaded: {len(self._ids)} entries")
+        return len(self._ids)
+
+    async def get_cached_id(self, file_path) -> Optional[str]:
+        """file_id из памяти, а при промахе — из таблицы media_cache.
+
+        Прогревает кэш один процесс (держатель POLLING): file_id, загруженные
+        им после нашего load(), дочитываем из БД, а не загружаем файл заново.
+        """
+        key = await self._cache_key(file_path)
+        if key in self._ids:
+            return self._ids[key]
+
+        async with self._session_factory() as session:
+            row = await session.get(MediaCacheModel, key)
+        if row:
+            self._ids.setdefault(key, row.file_id)
+        # Пока шёл запрос, файл мог догрузить этот же процесс — смотрим память ещё раз
+        return self._ids.get(key)
+
+    async def store(self, file_path, file_id: str):
+        """Запоминаем file_id; в БД он попадёт со следующим flush()"""
+        key = await self._cache_key(file_path)
+        self._ids[key] = file_id
+        now = datetime.now()
+        self._dirty[key] = {
+            'file_path': key[0],
+            'content_hash': key[1],
+            'media_type': media_type(file_path),
+            'file_id': file_id,
+            'created_at': now,
+            'verified_at': now,
+        }
+        logger.info(f"New file uploaded and cached: {key[0]}")
+        if len(self._dirty) >= MEDIA_CACHE_FLUSH_BATCH and not self._flush_running:
+            self._flush_task = asyncio.create_task(self.flush())
+
+    @property
+    def _flush_running(self) -> bool:
+        return self._flush_task is not None and not self._flush_task.done()
+
+    async def flush(self) -> int:
+        """Пишем накопленные записи одной записью писателя (executemany)"""
+        if not self._dirty:
+            return 0
+        batch, self._dirty = self._dirty, {}
+        try:
+            await self._writer.execute(
+                insert(MediaCacheModel).prefix_with('OR REPLACE'),
+                list(batch.values())
+            )
+        except Exception:
+            # Не теряем записи: вернём их в очередь (свежие важнее старых)
+            self._dirty = {**batch, **self._dirty}
+            raise
+        logger.debug(f"Media cache flushed {len(batch)} entries")
+        return len(batch)
 
-        # Check if we have valid cached file_id
-        if file_path in self.cache:
+    async def run_flusher(self, interval: float = MEDIA_CACHE_FLUSH_INTERVAL):
+        """Фоновый сброс новых записей в БД"""
+        while True:
+            await asyncio.sleep(interval)
             try:
-                # Verify file_id is still valid
-                await bot.get_file(self.cache[file_path])
-                logger.debug(f"Using cached file_id for {file_path}")
-                return self.cache[file_path]
+                await self.flush()
             except Exception as e:
-                logger.warning(f"Cached file_id invalid for {file_path}: {e}")
-                del self.cache[file_path]
+                logger.error(f"Media cache flush failed: {e}", exc_info=True)
 
-        # Upload new file and cache file_id
+    async def forget(self, file_path):
+        key = await self._cache_key(file_path)
+        self._ids.pop(key, None)
+        self._dirty.pop(key, None)
+        await self._writer.execute(
+            delete(MediaCacheModel)
+            .where(MediaCacheModel.file_path == key[0])
+            .where(MediaCacheModel.content_hash == key[1])
+        )
+
+    async def _send_raw(self, bot, chat_id: int, kind: str, media, **kwargs):
+        sender = getattr(bot, f"send_{kind}")
+        return await sender(chat_id, **{kind: media}, **kwargs)
+
+    async def _upload(self, bot, chat_id: int, file_path, **kwargs):
+        """Загружаем файл и кэшируем file_id.
+
+        Если тот же файл уже загружается (прогрев или другой ученик),
+        ждём ту загрузку и возвращаем (None, file_id) — отправить по id
+        должен вызывающий.
+        """
+        kind = media_type(file_path)
+        key = await self._cache_key(file_path)
+        pending = self._uploads.get(key)
+        if pending:
+            file_id = await asyncio.shield(pending)
+            if file_id:
+                return None, file_id
+
+        future = asyncio.get_running_loop().create_future()
+        self._uploads[key] = future
+        file_id = None
         try:
-            if file_path.endswith(('.jpg', '.jpeg', '.png')):
-                result = await bot.send_photo(
-                    chat_id=ADMIN_GROUP_ID,
-                    photo=FSInputFile(file_path),
-                    disable_notification=True
-                )
-                file_id = result.photo[-1].file_id
-            elif file_path.endswith(('.mp4', '.mov')):
-                result = await bot.send_video(
-                    chat_id=ADMIN_GROUP_ID,
-                    video=FSInputFile(file_path),
-                    disable_notification=True
+            message = await self._send_raw(bot, chat_id, kind, FSInputFile(file_path), **kwargs)
+            file_id = extract_file_id(message, kind)
+            if file_id:
+                await self.store(file_path, file_id)
+            return message, file_id
+        finally:
+            future.set_result(file_id)
+            self._uploads.pop(key, None)
+
+    async def send(self, bot, chat_id: int, file_path, **kwargs):
+        """Отправляем медиа по file_id из кэша, либо загружаем и кэшируем"""
+        kind = media_type(file_path)
+        if kind is None:
+            raise ValueError(f"Unsupported media type: {file_path}")
+
+        file_id = await self.get_cached_id(file_path)
+        if file_id:
+            # Оптимистично шлём по file_id, без get_file; перезагружаем только при отказе
+            try:
+                return await self._send_raw(bot, chat_id, kind, file_id, **kwargs)
+            except TelegramBadRequest as e:
+                if not is_invalid_file_id(e):
+                    raise
+                logger.warning(f"Cached file_id rejected for {file_path}: {e}")
+                await self.forget(file_path)
+
+        message, file_id = await self._upload(bot, chat_id, file_path, **kwargs)
+        if message is None:
+            return await self._send_raw(bot, chat_id, kind, file_id, **kwargs)
+        return message
+
+    async def send_group(self, bot, chat_id: int, file_paths: list, caption: Optional[str] = None, **kwargs):
+        """Фото/видео одним альбомом: кэшированные по file_id, новые — загрузкой.
+
+        Подпись ставится на первый элемент. Если Telegram отверг какой-то
+        file_id, забываем кэшированные id альбома и шлём его заново файлами.
+        """
+        if len(file_paths) == 1:
+            return [await self.send(bot, chat_id, file_paths[0], caption=caption, **kwargs)]
+
+        for attempt in range(2):
+            cached = [await self.get_cached_id(path) for path in file_paths]
+            media = [
+                ALBUM_MEDIA[media_type(path)](
+                    media=file_id or FSInputFile(path), caption=caption if i == 0 else None
                 )
-                file_id = result.video.file_id
+                for i, (path, file_id) in enumerate(zip(file_paths, cached))
+            ]
+            try:
+                messages = await bot.send_media_group(chat_id, media=media, **kwargs)
+            except TelegramBadRequest as e:
+                if attempt or not any(cached) or not is_invalid_file_id(e):
+                    raise
+                logger.warning(f"Cached file_id rejected in media group: {e}")
+                for path, file_id in zip(file_paths, cached):
+                    if file_id:
+                        await self.forget(path)
+                continue
 
-            logger.info(f"New file uploaded and cached: {file_path}")
-            self.cache[file_path] = file_id
-            self._save_cache()
+            for path, file_id, message in zip(file_paths, cached, messages):
+                if not file_id and (new_id := extract_file_id(message, media_type(path))):
+                    await self.store(path, new_id)
+            return messages
+
+    async def get_media_id(self, file_path: str, bot, chat_id: int = ADMIN_GROUP_ID) -> Optional[str]:
+        """Get file_id from cache or upload new file to the admin group"""
+        if not Path(file_path).exists():
+            logger.error(f"Media file not found: {file_path}")
+            return None
+        if media_type(file_path) is None:
+            logger.error(f"Unsupported media type: {file_path}")
+            return None
+
+        file_id = await self.get_cached_id(file_path)
+        if file_id:
             return file_id
 
+        try:
+            _, file_id = await self._upload(bot, chat_id, file_path, disable_notification=True)
+            return file_id
         except Exception as e:
             logger.error(f"Failed to upload media {file_path}: {e}")
             return None
 
-media_cache = MediaCache()
\ No newline at end of file
+    async def reverify(self, bot, max_age: float = MEDIA_REVERIFY_AGE,
+                       limit: int = MEDIA_REVERIFY_BATCH) -> dict:
+        """Перепроверяем через get_file самые давно проверенные записи.
+
+        Сессия открыта только на чтение пачки, итог пишет писатель одной
+        транзакцией: сетевые запросы идут без открытой транзакции.
+        """
+        stats = {'valid': 0, 'invalid': 0, 'failed': 0}
+        threshold = datetime.now() - timedelta(seconds=max_age)
+        async with self._session_factory() as session:
+            result = await session.execute(
+                select(MediaCacheModel.file_path, MediaCacheModel.content_hash, MediaCacheModel.file_id)
+                .where(or_(MediaCacheModel.verified_at.is_(None),
+                           MediaCacheModel.verified_at < threshold))
+                .order_by(MediaCacheModel.verified_at)
+                .limit(limit)
+            )
+            rows = result.all()
+
+        valid, invalid = [], []
+        with bulk_lane():
+            for file_path, content_hash, file_id in rows:
+                params = {'b_path': file_path, 'b_hash': content_hash, 'b_file_id': file_id}
+                try:
+                    await bot.get_file(file_id)
+                    valid.append({**params, 'b_verified_at': datetime.now()})
+                    stats['valid'] += 1
+                except Exception as e:
+                    if not is_invalid_file_id(e):
+                        stats['failed'] += 1
+                        continue
+                    logger.warning(f"Cached file_id expired for {file_path}: {e}")
+                    if self._ids.get((file_path, content_hash)) == file_id:
+                        del self._ids[(file_path, content_hash)]
+                    invalid.append(params)
+                    stats['invalid'] += 1
+
+        if valid or invalid:
+            # Сравниваем и file_id: пока шла проверка, запись могли перезалить
+            table = MediaCacheModel.__table__
+            same_row = (
+                (table.c.file_path == bindparam('b_path'))
+                & (table.c.content_hash == bindparam('b_hash'))
+                & (table.c.file_id == bindparam('b_file_id'))
+            )
+
+            async def apply(conn):
+                if valid:
+                    await conn.execute(
+                        update(table).where(same_row).values(verified_at=bindparam('b_verified_at')),
+                        valid
+                    )
+                if invalid:
+                    await conn.execute(delete(table).where(same_row), invalid)
+
+            await self._writer.transaction(apply)
+
+        if rows:
+            logger.info(f"Media cache re-verification: {stats}")
+        return stats
+
+    async def run_reverify(self, bot, interval: float = MEDIA_REVERIFY_INTERVAL):
+        """Фоновая низкоприоритетная перепроверка file_id"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reverify(bot)
+            except Exception as e:
+                logger.error(f"Media cache re-verification failed: {e}", exc_info=True)
+
+    def course_media(self) -> list[Path]:
+        """Все медиафайлы уроков: data/courses/*/lesson*/*"""
+        return sorted(
+            path for path in self.courses_dir.glob('*/lesson*/*')
+            if path.is_file() and media_type(path)
+        )
+
+    async def warm_up(self, bot, concurrency: int = MEDIA_WARMUP_CONCURRENCY,
+                      chat_id: int = MEDIA_WARMUP_CHAT_ID) -> dict:
+        """Загружаем заранее всё, чего нет в кэше (или что изменилось)"""
+        semaphore = asyncio.Semaphore(concurrency)
+        stats = {'cached': 0, 'uploaded': 0, 'failed': 0}
+
+        async def warm(path: Path):
+            async with semaphore:
+                if await self.get_cached_id(path):
+                    stats['cached'] += 1
+                elif await self.get_media_id(str(path), bot, chat_id):
+                    stats['uploaded'] += 1
+                else:
+                    stats['failed'] += 1
+
+        with bulk_lane():  # прогрев не должен тормозить ответы пользователям
+            await asyncio.gather(*(warm(path) for path in self.course_media()))
+        logger.info(f"Media cache warm-up done: {stats}")
+        return stats
+
+
+media_cache = MediaCache()
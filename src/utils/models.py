@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, Index, text
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -45,19 +45,84 @@ class Homework(Base):
     lesson = Column(Integer)
     status = Column(String, default='pending')
     submission_time = Column(DateTime)
+    approval_time = Column(DateTime)
+    next_lesson_at = Column(DateTime)  # UTC, когда открывается следующий урок
+    next_lesson_sent = Column(Boolean, default=False)  # устарело: доставку ведёт lesson_deliveries
+    admin_comment = Column(String)
     file_id = Column(String)
     admin_id = Column(Integer)
     
     user = relationship("User", back_populates="homeworks")
 
-class ScheduledFile(Base):
-    """Модель для запланированных файлов (теперь не потеряется)"""
-    __tablename__ = 'scheduled_files'
+    __table_args__ = (
+        # Одобрение/отказ ищут ДЗ конкретного урока
+        Index('ix_homeworks_user_lesson', 'user_id', 'course_id', 'lesson'),
+        # Очередь на проверку — только pending, по времени сдачи
+        Index('ix_homeworks_pending', 'submission_time', sqlite_where=text("status = 'pending'")),
+    )
+
+class LessonDelivery(Base):
+    """План доставки урока: одна строка на ученика и урок вместо строки на каждый файл.
+
+    Задержки файлов берутся из манифеста урока (LessonFile.delay от starts_at),
+    next_file — курсор по manifest.files. next_send_at — время следующего файла,
+    NULL — урок доставлен целиком. lease_owner/lease_until — кто сейчас
+    отправляет урок (см. delivery_cursor).
+    """
+    __tablename__ = 'lesson_deliveries'
+
+    user_id = Column(Integer, primary_key=True)
+    course_id = Column(String, primary_key=True)
+    lesson = Column(Integer, primary_key=True)
+    starts_at = Column(DateTime, nullable=False)
+    next_file = Column(Integer, nullable=False, default=0)
+    next_send_at = Column(DateTime)
+    lease_owner = Column(String)
+    lease_until = Column(DateTime)
+
+    __table_args__ = (
+        # Планировщику нужны только недоставленные уроки, по времени следующего файла
+        Index('ix_lesson_deliveries_due', 'next_send_at', sqlite_where=text('next_send_at IS NOT NULL')),
+    )
+
+class WorkerLease(Base):
+    """Аренды процессов: шарды планировщика (shard:N), поллинг и пульс воркера (см. worker_leases)"""
+    __tablename__ = 'worker_leases'
+
+    name = Column(String, primary_key=True)
+    owner = Column(String)
+    lease_until = Column(DateTime)
+
+class MediaCache(Base):
+    """Кэш file_id медиафайлов уроков (загружаем в Telegram один раз)"""
+    __tablename__ = 'media_cache'
     
-    id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, nullable=False)
+    file_path = Column(String, primary_key=True)  # путь относительно data/courses
+    content_hash = Column(String, primary_key=True)  # sha256 содержимого
+    media_type = Column(String, nullable=False)  # photo / video / audio
+    file_id = Column(String, nullable=False)
+    created_at = Column(DateTime)
+    verified_at = Column(DateTime)  # когда Telegram последний раз подтвердил file_id
+
+class ActivationCode(Base):
+    """Одноразовые коды активации (в дополнение к кодовым словам из courses.json)"""
+    __tablename__ = 'activation_codes'
+
+    code = Column(String, primary_key=True)  # normalize_code(): casefold + strip
     course_id = Column(String, nullable=False)
-    lesson = Column(Integer, nullable=False)
-    file_name = Column(String, nullable=False)
-    send_at = Column(DateTime, nullable=False)
-    sent = Column(Boolean, default=False)
\ No newline at end of file
+    version_id = Column(String, nullable=False)
+    is_used = Column(Boolean, default=False, nullable=False)
+    created_at = Column(DateTime)
+    used_at = Column(DateTime)
+    used_by = Column(Integer, ForeignKey('users.user_id'))
+
+class FsmState(Base):
+    """Состояния FSM aiogram и прогресс ученика (destiny='course'), см. SQLiteStorage"""
+    __tablename__ = 'fsm_storage'
+
+    key = Column(String, primary_key=True)  # DefaultKeyBuilder: fsm:<chat>:<user>:<destiny>
+    user_id = Column(Integer, nullable=False, index=True)
+    destiny = Column(String, nullable=False)
+    state = Column(String)
+    data = Column(Text, nullable=False, default='{}')  # JSON
+    updated_at = Column(DateTime)
@@ -0,0 +1,195 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from src.config import (
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST, TELEGRAM_GROUP_RATE
+)
+
+logger = logging.getLogger(__name__)
+
+# Приоритетные полосы: чем меньше число, тем раньше получаем токен
+PRIORITY_INTERACTIVE = 0  # ответы на действия пользователя
+PRIORITY_BULK = 1  # плановая рассылка уроков
+
+LANE_NAMES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_BULK: 'bulk'}
+
+_send_priority: ContextVar[int] = ContextVar('send_priority', default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def bulk_lane():
+    """Все запросы внутри блока идут по низкоприоритетной полосе"""
+    token = _send_priority.set(PRIORITY_BULK)
+    try:
+        yield
+    finally:
+        _send_priority.reset(token)
+
+
+class TokenBucket:
+    """Классическое ведро токенов с резервированием (токены могут уйти в минус)"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: Optional[float] = None) -> float:
+        """Сколько ждать до появления целого токена"""
+        self._refill(now or time.monotonic())
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def reserve(self, now: Optional[float] = None) -> float:
+        """Забираем токен сразу, возвращаем, сколько нужно подождать перед запросом"""
+        self._refill(now or time.monotonic())
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def set_rate(self, rate: float, capacity: float):
+        """Меняем скорость на ходу: накопленное по старой скорости сохраняется"""
+        self._refill(time.monotonic())
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = min(self.tokens, capacity)
+
+    @property
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.capacity
+
+
+class RateLimiter(BaseRequestMiddleware):
+    """Ограничитель исходящих запросов к Bot API на уровне сессии aiogram.
+
+    Держит общий лимит бота (~30 запросов/с) и лимит на чат
+    (1 сообщение/с в личке, 20 в минуту в группе). Общие токены раздаются
+    по приоритету: интерактивные ответы обгоняют рассылку уроков.
+
+    Лимиты Telegram — на бота, а не на процесс: при нескольких воркерах
+    (см. worker_leases) каждый берёт 1/N всех лимитов, set_workers()
+    вызывается после каждой балансировки.
+    """
+
+    MAX_CHAT_BUCKETS = 10000
+
+    def __init__(
+        self,
+        global_rate: float = TELEGRAM_GLOBAL_RATE,
+        chat_rate: float = TELEGRAM_CHAT_RATE,
+        chat_burst: float = TELEGRAM_CHAT_BURST,
+        group_rate: float = TELEGRAM_GROUP_RATE,
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.workers = 1  # живых процессов, делящих лимиты бота
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: dict[int, TokenBucket] = {}
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+        self._stats = {
+            name: {'requests': 0, 'delayed': 0, 'wait_total': 0.0, 'wait_max': 0.0}
+            for name in LANE_NAMES.values()
+        }
+
+    def _chat_limits(self, chat_id: int) -> tuple[float, float]:
+        """(скорость, ёмкость) ведра чата — доля этого процесса"""
+        if chat_id < 0:  # группы и каналы
+            return self.group_rate / self.workers, 1
+        return self.chat_rate / self.workers, max(1.0, self.chat_burst / self.workers)
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.MAX_CHAT_BUCKETS:
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.idle}
+            bucket = TokenBucket(*self._chat_limits(chat_id))
+            self._chats[chat_id] = bucket
+        return bucket
+
+    def set_workers(self, workers: int):
+        """Делим лимиты бота между workers процессами (каждый держит свою долю)"""
+        workers = max(1, int(workers))
+        if workers == self.workers:
+            return
+        logger.info(f"7002 | Лимиты Telegram делятся на {workers} воркеров (было {self.workers})")
+        self.workers = workers
+        share = self.global_rate / workers
+        self._global.set_rate(share, max(1.0, share))
+        for chat_id, bucket in self._chats.items():
+            bucket.set_rate(*self._chat_limits(chat_id))
+
+    async def _acquire_global(self, priority: int):
+        if not self._waiters and self._global.delay() == 0:
+            self._global.reserve()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run_pump())
+        await future
+
+    async def _run_pump(self):
+        """Раздаём общие токены ожидающим строго в порядке приоритета"""
+        while self._waiters:
+            delay = self._global.delay()
+            if delay:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():  # запрос отменили, пока ждал
+                continue
+            self._global.reserve()
+            future.set_result(None)
+
+    async def acquire(self, chat_id=None, priority: Optional[int] = None) -> float:
+        """Ждём разрешения на запрос. Возвращаем время задержки в секундах."""
+        priority = _send_priority.get() if priority is None else priority
+        started = time.monotonic()
+
+        if isinstance(chat_id, int):
+            chat_delay = self._chat_bucket(chat_id).reserve()
+            if chat_delay:
+                await asyncio.sleep(chat_delay)
+        await self._acquire_global(priority)
+
+        waited = time.monotonic() - started
+        stats = self._stats[LANE_NAMES.get(priority, 'bulk')]
+        stats['requests'] += 1
+        if waited > 0.001:
+            stats['delayed'] += 1
+            stats['wait_total'] += waited
+            stats['wait_max'] = max(stats['wait_max'], waited)
+        return waited
+
+    def stats(self) -> dict:
+        return {
+            'lanes': {name: dict(values) for name, values in self._stats.items()},
+            'waiting': len(self._waiters),
+            'chats_tracked': len(self._chats),
+            'workers': self.workers,
+        }
+
+    async def __call__(self, make_request, bot, method):
+        waited = await self.acquire(getattr(method, 'chat_id', None))
+        if waited > 1:
+            logger.debug(f"7001 | {type(method).__name__} придержан на {waited:.2f}s")
+        return await make_request(bot, method)
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,98 @@
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from src.config import RENDER_CACHE_MAX_CHARS
+from .text_processor import process_markdown, process_markdown_simple, render_entities
+
+logger = logging.getLogger(__name__)
+
+# Режимы вывода = значения parse_mode для Telegram
+MODE_PLAIN = None
+MODE_MARKDOWN = 'Markdown'
+MODE_MARKDOWN_V2 = 'MarkdownV2'
+MODE_ENTITIES = 'entities'  # список (текст, MessageEntity) — шлём без parse_mode
+
+RENDERERS = {
+    MODE_MARKDOWN: process_markdown_simple,
+    MODE_MARKDOWN_V2: process_markdown,
+    MODE_ENTITIES: render_entities,
+}
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def rendered_size(rendered) -> int:
+    """Сколько символов держит запись (для entities считаем только тексты)"""
+    if isinstance(rendered, str):
+        return len(rendered)
+    return sum(len(text) for text, _ in rendered)
+
+
+class RenderCache:
+    """LRU-кэш готовых к отправке текстов уроков.
+
+    Ключ — (хэш содержимого, режим): изменился файл — изменился хэш, и старая
+    запись просто вытесняется. content_hash берётся из того же LessonFile,
+    что и текст: манифест урока сверяется с диском (см. lesson_manifest),
+    так что после правки .md приходят новые текст и хэш. Без content_hash
+    ключ считается по самому тексту. Память ограничена суммарной длиной текстов.
+    """
+
+    def __init__(self, max_chars: int = RENDER_CACHE_MAX_CHARS):
+        self.max_chars = max_chars
+        self._entries: OrderedDict[tuple[str, Optional[str]], object] = OrderedDict()
+        self._chars = 0
+        self.hits = 0
+        self.misses = 0
+
+    def render_messages(self, text: str, content_hash: Optional[str] = None) -> list:
+        """Урок -> готовые сообщения (текст, entities) для отправки без parse_mode"""
+        return self.render(text, MODE_ENTITIES, content_hash)
+
+    def render(self, text: str, mode: Optional[str] = MODE_MARKDOWN,
+               content_hash: Optional[str] = None):
+        """Текст в нужном режиме; повторный вызов — чтение из памяти"""
+        renderer = RENDERERS.get(mode)
+        if renderer is None:
+            return text  # plain уходит как есть
+
+        key = (content_hash or text_hash(text), mode)
+        rendered = self._entries.get(key)
+        if rendered is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return rendered
+
+        self.misses += 1
+        rendered = renderer(text)
+        self._put(key, rendered)
+        return rendered
+
+    def _put(self, key, rendered):
+        size = rendered_size(rendered)
+        if size > self.max_chars:
+            return  # такой текст не кэшируем, чтобы не выкинуть всё остальное
+        self._entries[key] = rendered
+        self._chars += size
+        while self._chars > self.max_chars:
+            _, evicted = self._entries.popitem(last=False)
+            self._chars -= rendered_size(evicted)
+
+    def clear(self):
+        self._entries.clear()
+        self._chars = 0
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'chars': self._chars,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+render_cache = RenderCache()
@@ -1,11 +1,14 @@
-import json  # Добавляем этот импорт для работы с JSON
-from sqlalchemy import select, update, delete, func
+from sqlalchemy import select, insert, delete, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from .models import User, Course, UserCourse, Homework
 import logging
 from src.utils.courses import verify_code  # Добавляем этот импорт
+from src.utils.course_cache import catalog
+from src.utils.codes import find_activation_code, claim_statement
 from sqlalchemy.exc import SQLAlchemyError
-from .session import AsyncSessionFactory
+from .session import session_scope
+from .write_queue import write_queue
+from .user_state import UserStateRecord, user_states
 from typing import List, Optional  # Для аннотации типов
 
 
@@ -34,7 +37,7 @@ async def add_user(session: AsyncSession, user_id: int, name: str, course_id: st
             version_id = "self_check"  # Или получаем из курса
             await enroll_user_in_course(session, user_id, course_id, version_id)
             
-        await session.commit()
+        await session.flush()  # commit — у владельца сессии (middleware апдейта)
         return True
     except Exception as e:
         logging.error(f"Ошибка при добавлении пользователя {user_id}: {e}")
@@ -43,6 +46,27 @@ async def add_user(session: AsyncSession, user_id: int, name: str, course_id: st
 
 
 
+async def register_user(user_id: int, name: str, course_id: str = None) -> bool:
+    """Регистрируем пользователя (и записываем на курс) одной транзакцией писателя.
+
+    Для хендлеров: запись коммитится сразу, а не в конце апдейта,
+    пока хендлер ждёт Telegram.
+    """
+    async def register(conn):
+        await conn.execute(insert(User).values(user_id=user_id, name=name))
+        if course_id:
+            await conn.execute(insert(UserCourse).values(
+                user_id=user_id, course_id=course_id, version_id="self_check", current_lesson=1
+            ))
+
+    try:
+        await write_queue.transaction(register)
+        return True
+    except Exception as e:
+        logging.error(f"Ошибка при добавлении пользователя {user_id}: {e}")
+        return False
+
+
 async def get_user(session: AsyncSession, user_id: int) -> Optional[User]:
     """Получаем пользователя по ID (версия для спортсменов-олимпийцев)"""
     result = await session.execute(select(User).where(User.user_id == user_id))
@@ -57,7 +81,7 @@ async def enroll_user_in_course(session: AsyncSession, user_id: int, course_id:
             current_lesson=1
         )
         session.add(user_course)
-        await session.commit()
+        await session.flush()  # commit — у владельца сессии
         return True
     except Exception as e:
         logging.error(f"Error enrolling user {user_id} in course {course_id}: {e}")
@@ -148,46 +172,57 @@ async def get_user_info(session: AsyncSession, user_id: int) -> str:
 
 
 async def verify_course_code(code: str, user_id: int) -> tuple[bool, str]:
-    """Проверяем любой валидный код из courses.json"""
+    """Проверяем кодовое слово из courses.json или одноразовый код из БД"""
     try:
-        with open('c:/Trae/AntBot/data/courses.json', 'r', encoding='utf-8') as f:
-            courses = json.load(f)
-        
-        # Ищем код во всех курсах
-        for course_id, course_data in courses.items():
-            for version in course_data.get('versions', []):
-                if version.get('code', '').lower() == code.lower():
-                    async with AsyncSessionFactory() as session:
-                        # Проверяем, не активирован ли уже курс
-                        stmt = select(UserCourse).where(
-                            UserCourse.user_id == user_id,
-                            UserCourse.course_id == course_id
-                        )
-                        if await session.scalar(stmt):
-                            return False, "Этот курс уже активирован"
-                        
-                        # Записываем на курс
-                        if await enroll_user_in_course(session, user_id, course_id, version['id']):
-                            return True, f"Курс '{course_data['name']}' активирован"
-                        return False, "Ошибка активации курса"
-        
-        return False, "Неверное кодовое слово"
+        # Кодовые слова из courses.json — из индекса в памяти, одноразовые — из БД
+        target = catalog.resolve_code(code)
+        single_use = target is None
+        if single_use:
+            target = await find_activation_code(code)
+        if not target:
+            return False, "Неверное кодовое слово"
+
+        course = catalog.get(target.course_id)
+
+        # Гасим код и записываем на курс одной транзакцией писателя — до ответов пользователю
+        async def activate(conn) -> Optional[str]:
+            # Проверяем, не активирован ли уже курс
+            stmt = select(UserCourse.user_id).where(
+                UserCourse.user_id == user_id,
+                UserCourse.course_id == target.course_id
+            )
+            if await conn.scalar(stmt):
+                return "Этот курс уже активирован"
+
+            if single_use and not (await conn.execute(claim_statement(code, user_id))).first():
+                return "Этот код уже использован"
+
+            # Записываем на курс
+            await conn.execute(insert(UserCourse).values(
+                user_id=user_id, course_id=target.course_id,
+                version_id=target.version_id, current_lesson=1
+            ))
+            return None
+
+        error = await write_queue.transaction(activate)
+        if error:
+            return False, error
+        if single_use:
+            logging.info(f"Activation code claimed by {user_id}: {target.course_id}/{target.version_id}")
+        return True, f"Курс '{course.name if course else target.course_id}' активирован"
     
     except Exception as e:
         logging.error(f"Ошибка при проверке кода: {e}")
         return False, "Ошибка системы. Попробуй позже"
 
 
-async def set_user_state(session: AsyncSession, user_id: int, state: str) -> bool:
-    """Update user's state in database"""
+async def set_user_state(user_id: int, course_id: str, state: str, lesson: int = None) -> bool:
+    """Update user's state in database (через общий писатель, кэш обновляется после commit)"""
     try:
-        stmt = update(User).where(User.user_id == user_id).values(state=state)
-        await session.execute(stmt)
-        await session.commit()
+        await user_states.set(user_id, course_id, state, lesson)
         return True
     except Exception as e:
         logging.error(f"Error updating state for user {user_id}: {e}")
-        await session.rollback()
         return False
 
 
@@ -197,7 +232,7 @@ from .models import User, UserCourse
 
 async def get_user_info(user_id: int):
     """Get user info from database"""
-    async with AsyncSessionFactory() as session:
+    async with session_scope() as session:
         result = await session.execute(
             select(User)
             .where(User.user_id == user_id)
@@ -205,17 +240,9 @@ async def get_user_info(user_id: int):
         return result.scalar_one_or_none()
 
 
-async def get_user_state(user_id: int) -> tuple:
-    """Get current user state from database"""
-    async with AsyncSessionFactory() as session:
-        result = await session.execute(
-            select(UserState)
-            .where(UserState.user_id == user_id)
-        )
-        state = result.scalar_one_or_none()
-        if state:
-            return (state.state, state.course_id, state.lesson)
-        return None
+async def get_user_state(user_id: int) -> Optional[UserStateRecord]:
+    """Get current user state: (state, course_id, lesson) из кэша, БД — только при промахе"""
+    return await user_states.get(user_id)
 
 
 # Добавляем где-нибудь в начале
@@ -224,19 +251,15 @@ from functools import wraps
 from sqlalchemy.exc import SQLAlchemyError
 
 def safe_db_operation(func):
-    """Декоратор для безопасной работы с БД"""
+    """Декоратор для безопасной работы с БД (сессия апдейта или своя, см. session_scope)"""
     @wraps(func)
     async def wrapper(*args, **kwargs):
         try:
-            async with AsyncSessionFactory() as session:
+            async with session_scope() as session:
                 kwargs['session'] = session
-                result = await func(*args, **kwargs)
-                await session.commit()
-                return result
+                return await func(*args, **kwargs)
         except SQLAlchemyError as e:
             logging.error(f"Database error in {func.__name__}: {e}")
-            if 'session' in locals():
-                await session.rollback()
             return None
     return wrapper
 
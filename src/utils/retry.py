@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import random
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Optional
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import (
+    TelegramEntityTooLarge, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+)
+from aiogram.methods import GetUpdates
+
+from src.config import (
+    TELEGRAM_RETRY_ATTEMPTS, TELEGRAM_RETRY_BASE_DELAY, TELEGRAM_RETRY_MAX_DELAY,
+    TELEGRAM_RETRY_MAX_WAIT, TELEGRAM_RETRY_BUDGET
+)
+from .rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+RETRY_AFTER = 'retry_after'  # Telegram сам сказал, сколько ждать
+TRANSIENT = 'transient'  # 5xx, сеть/таймаут у безопасных методов — повторяем с backoff
+PERMANENT = 'permanent'  # бот заблокирован, чат не найден и т.п. — не повторяем
+
+# Методы, повтор которых ничего не дублирует (плюс все get*)
+IDEMPOTENT_METHODS = frozenset({
+    'AnswerCallbackQuery', 'DeleteMessage', 'DeleteWebhook', 'EditMessageCaption',
+    'EditMessageReplyMarkup', 'EditMessageText', 'SetMyCommands', 'SetWebhook',
+})
+
+# Внутри call() middleware не повторяет сам, чтобы повторы не перемножались
+_retry_scope: ContextVar[bool] = ContextVar('retry_scope', default=False)
+
+
+def is_safe_to_repeat(method) -> bool:
+    """Можно ли повторить запрос, если неизвестно, дошёл ли он до Telegram"""
+    if method is None:
+        return False
+    name = type(method).__name__
+    return name.startswith('Get') or name in IDEMPOTENT_METHODS
+
+
+def classify_error(exc: BaseException) -> str:
+    """Определяем, есть ли смысл повторять запрос"""
+    if isinstance(exc, TelegramRetryAfter):
+        return RETRY_AFTER
+    if isinstance(exc, TelegramEntityTooLarge):
+        return PERMANENT
+    if isinstance(exc, TelegramServerError):
+        return TRANSIENT
+    if isinstance(exc, (TelegramNetworkError, asyncio.TimeoutError)):
+        # Запрос мог дойти до Telegram: повторная отправка продублирует сообщение
+        return TRANSIENT if is_safe_to_repeat(getattr(exc, 'method', None)) else PERMANENT
+    return PERMANENT
+
+
+class RetryPolicy(BaseRequestMiddleware):
+    """Повторы исходящих запросов к Telegram.
+
+    RetryAfter ждём ровно столько, сколько просит Telegram, сетевые ошибки
+    повторяем с экспоненциальной задержкой и jitter (только для методов,
+    которые безопасно повторить), постоянные ошибки отдаём сразу. Общий
+    бюджет повторов не даёт заваливать API ретраями во время инцидентов. Работает и как request middleware aiogram, и
+    напрямую через call().
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = TELEGRAM_RETRY_ATTEMPTS,
+        base_delay: float = TELEGRAM_RETRY_BASE_DELAY,
+        max_delay: float = TELEGRAM_RETRY_MAX_DELAY,
+        max_retry_after: float = TELEGRAM_RETRY_MAX_WAIT,
+        budget_per_second: float = TELEGRAM_RETRY_BUDGET,
+        sleep: Callable[[float], Awaitable] = asyncio.sleep,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self._budget = TokenBucket(budget_per_second, max(1.0, budget_per_second * 10))
+        self._sleep = sleep
+        self._stats: dict[str, dict[str, int]] = defaultdict(
+            lambda: {'retried': 0, 'gave_up': 0, 'permanent': 0}
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """Full jitter: случайная задержка от 0 до base * 2^attempt (с потолком)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _retry_delay(self, exc: BaseException, attempt: int, max_attempts: int) -> Optional[float]:
+        """Сколько ждать перед следующей попыткой, или None — сдаёмся"""
+        kind = classify_error(exc)
+        stats = self._stats[type(exc).__name__]
+
+        if kind == PERMANENT:
+            stats['permanent'] += 1
+            return None
+        if attempt + 1 >= max_attempts or self._budget.delay() > 0:
+            stats['gave_up'] += 1
+            return None
+
+        if kind == RETRY_AFTER:
+            if exc.retry_after > self.max_retry_after:
+                stats['gave_up'] += 1
+                return None
+            delay = float(exc.retry_after)
+        else:
+            delay = self.backoff(attempt)
+
+        self._budget.reserve()
+        stats['retried'] += 1
+        return delay
+
+    async def call(self, func: Callable[..., Awaitable], *args, attempts: Optional[int] = None, **kwargs):
+        """Вызываем func с повторами по политике"""
+        max_attempts = attempts or self.max_attempts
+        attempt = 0
+        scope = _retry_scope.set(True)
+        try:
+            while True:
+                try:
+                    return await func(*args, **kwargs)
+                except Exception as exc:
+                    delay = self._retry_delay(exc, attempt, max_attempts)
+                    if delay is None:
+                        raise
+                    logger.warning(f"8001 | Попытка {attempt + 1} не удалась ({type(exc).__name__}), "
+                                   f"повтор через {delay:.1f}s: {exc}")
+                    await self._sleep(delay)
+                    attempt += 1
+        finally:
+            _retry_scope.reset(scope)
+
+    def stats(self) -> dict:
+        return {name: dict(values) for name, values in self._stats.items()}
+
+    async def __call__(self, make_request, bot, method):
+        # У поллинга свой backoff; внутри call() повторы уже идут снаружи
+        if isinstance(method, GetUpdates) or _retry_scope.get():
+            return await make_request(bot, method)
+        return await self.call(make_request, bot, method)
+
+
+retry_policy = RetryPolicy()
@@ -4,42 +4,49 @@ import pytz
 import os
 import re
 from datetime import datetime, timedelta
+from typing import Optional
 from aiogram import Bot
 # Change from:
 # from .db import DB_PATH, safe_db_operation
 # To:
-# Было: from .session import DB_PATH
-# Стало:
-from .session import DATABASE_URL  # Хотя скорее всего можно вообще убрать
 from .requests import safe_db_operation  # Or move this function to requests.py
 from src.config import extract_delay_from_filename  # Оставить абсолютным
+from .lesson_queue import lesson_queue, utc_now
+from .db import cleanup_finished_deliveries
+from .delivery import delivery_pool
+from .rate_limiter import bulk_lane
 import aiosqlite
-from aiogram.types import FSInputFile  # Добавить импорт
+from .media_cache import group_media, media_cache, media_type
+from .lesson_manifest import LessonFile, lesson_manifests
+from .render_cache import render_cache
+from .delivery_cursor import delivery_cursor
+from .worker_leases import WorkerLeases, worker_leases
 
 
 logger = logging.getLogger(__name__)
 
-async def send_file(bot: Bot, user_id: int, file_path: str):
+async def send_file(bot: Bot, user_id: int, file_path: str, lesson_file: Optional[LessonFile] = None):
     """Send a file to user with proper error handling"""
     try:
-        if not os.path.exists(file_path):
+        if lesson_file is None and not os.path.exists(file_path):
             logger.error(f"❌ 4001 File not found: {file_path}")
             return False
             
         # Определяем тип файла по расширению
         ext = file_path.lower().split('.')[-1]
-        input_file = FSInputFile(file_path)
         
         if ext in ['txt', 'md']:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-            await bot.send_message(user_id, text, parse_mode=None)
-        elif ext in ['jpg', 'jpeg', 'png']:
-            await bot.send_photo(user_id, input_file)
-        elif ext in ['mp3', 'ogg']:
-            await bot.send_audio(user_id, input_file)
-        elif ext in ['mp4', 'avi']:
-            await bot.send_video(user_id, input_file)
+            if lesson_file is not None and lesson_file.kind == 'text':
+                # Текст уже прочитан при компиляции манифеста
+                content, content_hash = lesson_file.text, lesson_file.content_hash
+            else:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    content, content_hash = f.read(), None
+            for text, entities in render_cache.render_messages(content, content_hash):
+                await bot.send_message(user_id, text, entities=entities, parse_mode=None)
+        elif media_type(file_path):
+            # Фото/аудио/видео загружаются один раз, дальше уходят по file_id
+            await media_cache.send(bot, user_id, file_path)
                 
         logger.info(f"✅ 4002 File sent successfully: {file_path}")
         return True
@@ -53,103 +60,116 @@ async def send_file(bot: Bot, user_id: int, file_path: str):
 DELAY_PATTERN = re.compile(r'_(\d+)(min|hour)\.')
 
 async def send_lesson_files(bot: Bot, user_id: int, course_id: str, lesson: int):
-    """Send lesson files to user"""
+    """Send lesson files to user
+
+    Урок сначала арендуется (delivery_cursor.claim), затем наступившие файлы
+    манифеста уходят пачками начиная с курсора next_file; после каждой пачки
+    курсор сдвигается и аренда продлевается, последняя пачка аренду снимает.
+    На ошибке отправки курсор стоит на месте, а урок остаётся за нами до
+    истечения аренды — это и есть пауза перед повтором.
+    """
     logger.info(f"🚀 Attempting to send files for user {user_id}, course {course_id}, lesson {lesson}")
     
     try:
-        # Get files that need to be sent
-        cursor = await safe_db_operation('''
-            SELECT id, file_name, send_at
-            FROM scheduled_files
-            WHERE user_id = ? AND course_id = ? AND lesson = ? AND sent = 0
-            AND send_at <= datetime('now')
-        ''', (user_id, course_id, lesson))
+        now = utc_now()
+        claim = await delivery_cursor.claim(user_id, course_id, lesson, now)
+        if claim is None:
+            logger.debug("📋 Nothing due")
+            return
+        
+        manifest = await lesson_manifests.get(course_id, lesson)
+        if manifest is None:
+            # Урок удалили с диска — закрываем план, иначе он будет всплывать на каждом ресинке
+            logger.warning(f"📁 4004 No manifest for {course_id}/lesson{lesson}, closing delivery for {user_id}")
+            await delivery_cursor.release(claim, None)
+            return
         
-        files = await cursor.fetchall()
-        logger.debug(f"📋 Found {len(files)} files to send")
+        cursor = claim.next_file
+        due = manifest.files[cursor:manifest.due(claim.starts_at, cursor, now)]
+        logger.debug(f"📋 Found {len(due)} files to send")
         
-        for file_id, file_name, send_time in files:
-            full_path = os.path.join('data', 'courses', course_id, f'lesson{lesson}', file_name)
-            logger.debug(f"📎 Attempting to send file: {full_path}")
+        # Фото/видео с одной задержкой уходят альбомом, текст — между ними, по порядку
+        batches = group_media(due, path=lambda f: f.path, key=lambda f: f.delay)
+        for i, batch in enumerate(batches):
+            names = [f.name for f in batch]
+            logger.debug(f"📎 Attempting to send: {names}")
             
             try:
-                if await send_file(bot, user_id, full_path):
-                    # Mark as sent
-                    await safe_db_operation('''
-                        UPDATE scheduled_files 
-                        SET sent = 1 
-                        WHERE id = ?
-                    ''', (file_id,))
-                    
+                if len(batch) > 1:
+                    await media_cache.send_group(bot, user_id, [f.path for f in batch])
+                    sent = True
+                else:
+                    sent = await send_file(bot, user_id, batch[0].path, batch[0])
             except Exception as e:
-                logger.error(f"❌ Error sending file {file_name}: {e}", exc_info=True)
+                logger.error(f"❌ Error sending files {names}: {e}", exc_info=True)
+                sent = False
+            if not sent:
+                lesson_queue.push(claim.lease_until, user_id, course_id, lesson)
+                return
+            
+            # Сдвигаем курсор (одна запись в group commit на всю пачку); последняя пачка снимает аренду
+            next_file = claim.next_file + len(batch)
+            claim = await delivery_cursor.advance(
+                claim, next_file, manifest.send_at(claim.starts_at, next_file), release=i == len(batches) - 1
+            )
+            if claim is None:
+                return  # урок забрал другой воркер — дальше шлёт он
+        
+        if not batches:
+            await delivery_cursor.release(claim, manifest.send_at(claim.starts_at, cursor))
+        
+        # Следующий по времени файл урока — в очередь дедлайнов
+        next_send_at = manifest.send_at(claim.starts_at, claim.next_file)
+        if next_send_at is not None:
+            lesson_queue.push(next_send_at, user_id, course_id, lesson)
                 
     except Exception as e:
         logger.error(f"💥 Critical error in send_lesson_files: {e}", exc_info=True)
         raise
 
-# Удаляем функцию check_scheduled_files, так как её функциональность 
-# теперь полностью покрывается send_lesson_files
-async def check_and_send_lessons(bot: Bot):
-    while True:
-        try:
-            # First get count of pending lessons
-            count_result = await safe_db_operation('''
-                SELECT COUNT(*)
-                FROM homeworks h
-                JOIN user_courses uc ON h.user_id = uc.user_id AND h.course_id = uc.course_id
-                WHERE h.status = 'approved' 
-                AND datetime(h.next_lesson_at) <= datetime('now')
-                AND h.next_lesson_sent = 0
-            ''', fetch_one=True)  # Changed to fetch_one
-            
-            count = count_result[0] if count_result else 0
-            
-            if count > 0:
-                logger.info(f"2000 | Found {count} pending lessons")
-                # Get the actual lessons data
-                lessons = await safe_db_operation('''
-                    SELECT 
-                        h.user_id, 
-                        h.course_id, 
-                        h.lesson, 
-                        h.next_lesson_at,
-                        uc.first_lesson_time,
-                        strftime('%s', h.next_lesson_at) - strftime('%s', 'now') as time_diff
-                    FROM homeworks h
-                    JOIN user_courses uc ON h.user_id = uc.user_id AND h.course_id = uc.course_id
-                    WHERE h.status = 'approved' 
-                    AND datetime(h.next_lesson_at) <= datetime('now')
-                    AND h.next_lesson_sent = 0
-                    ORDER BY uc.first_lesson_time ASC, h.lesson ASC
-                ''', fetch_all=True)  # Changed to fetch_all
-                
-                for lesson in lessons:
-                    user_id, course_id, lesson_num, next_at, first_time, time_diff = lesson
-                    try:
-                        await send_lesson_files(bot, user_id, course_id, lesson_num)
-                        await safe_db_operation('''
-                            UPDATE homeworks 
-                            SET next_lesson_sent = 1 
-                            WHERE user_id = ? AND course_id = ? AND lesson = ?
-                        ''', (user_id, course_id, lesson_num))
-                        logger.info(f"2000.4 | Lesson {lesson_num} sent to user {user_id}")
-                    except Exception as e:
-                        logger.error(f"2000.5 | Failed to send lesson: {e}", exc_info=True)
-                    
-                logger.info("2000.6 | Scheduler Check Completed")
-                
-        except Exception as e:
-            logger.error(f"2000.7 | Scheduler error: {e}", exc_info=True)
-            
-        await asyncio.sleep(100)
+async def deliver_lesson(bot: Bot, user_id: int, course_id: str, lesson: int):
+    """Доставляем наступившие файлы урока (конец плана и есть «урок отправлен»)"""
+    with bulk_lane():  # плановая рассылка уступает интерактивным ответам
+        await send_lesson_files(bot, user_id, course_id, lesson)
+    logger.info(f"2000.4 | Lesson {lesson} delivered to user {user_id}")
+
+
+async def check_and_send_lessons(bot: Bot, leases: WorkerLeases = worker_leases):
+    """Планировщик уроков: грузим дедлайны своих шардов в кучу и спим до ближайшего
+
+    Шарды уже должны быть взяты (leases.rebalance() при старте), дальше их
+    перераспределяет leases.run().
+    """
+    lesson_queue.shards = leases
+    await lesson_queue.load()
+    delivery_pool.start()
+
+    async def on_rebalance(gained: frozenset, lost: frozenset, lost_roles: set):
+        if gained:
+            await lesson_queue.load()  # дедлайны новых шардов (уже известные отбросит push)
+        elif leases.peers:
+            # Одобрения в других процессах попадают только в БД — подбираем то, что наступит до следующего прохода
+            await lesson_queue.load(horizon=utc_now() + timedelta(seconds=2 * leases.interval))
+
+    leases.subscribe(on_rebalance)
+
+    async def deliver(user_id: int, course_id: str, lesson: int):
+        if not leases.owns(user_id):
+            return  # шард у другого воркера — урок доставит он
+        # Отдаём урок в пул: разные ученики параллельно, один ученик — по порядку
+        await delivery_pool.submit(
+            user_id, lambda: deliver_lesson(bot, user_id, course_id, lesson)
+        )
+
+    logger.info(f"2000 | Scheduler started, shards {sorted(leases.owned)}, {len(lesson_queue)} deadlines queued")
+    await lesson_queue.run(deliver)
 
 
 async def schedule_cleanup():
-    """Schedule periodic cleanup of old files"""
+    """Schedule periodic cleanup of delivered lesson plans"""
     while True:
         try:
-            await cleanup_old_scheduled_files(7)  # Clean files older than 7 days
+            await cleanup_finished_deliveries(7)  # Clean plans older than 7 days
             await asyncio.sleep(24 * 60 * 60)  # Run daily
         except Exception as e:
             logger.error(f"Error in cleanup scheduler: {e}")
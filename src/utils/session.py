@@ -1,17 +1,92 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
+import logging
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from .engine import engine
 from .models import Base
 
-DATABASE_URL = "sqlite+aiosqlite:///c:/Trae/AntBot/data/bot.db"  # Теперь база живет тут
+logger = logging.getLogger(__name__)
+
+# Одна фабрика сессий на процесс (db.py и остальные импортируют её отсюда)
+AsyncSessionFactory = async_sessionmaker(engine, expire_on_commit=False)
+
+# Сессия текущего апдейта (ставит DbSessionMiddleware)
+current_session: ContextVar[Optional[AsyncSession]] = ContextVar('current_session', default=None)
+
+
+@asynccontextmanager
+async def session_scope():
+    """Сессия для утилит: внутри апдейта — общая (commit сделает middleware),
+    вне апдейта (планировщик, старт) — своя, с commit/rollback на выходе."""
+    session = current_session.get()
+    if session is not None:
+        yield session
+        return
+    async with AsyncSessionFactory() as session:
+        token = current_session.set(session)  # вложенные утилиты — в ту же транзакцию
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            current_session.reset(token)
+
+
+class DbSessionMiddleware(BaseMiddleware):
+    """Одна AsyncSession на апдейт.
+
+    Сессия открывается до хендлеров, попадает в data['session'] (хендлер
+    получает её аргументом session) и в current_session для утилит, а в
+    конце апдейта — один commit или rollback. Вместо трёх-четырёх сессий
+    и commit'ов на апдейт — одно соединение из пула и одна транзакция.
+    Записи в ней не делаем: открытая транзакция держала бы блокировку
+    записи до конца апдейта, через все ожидания Telegram. Записи идут
+    через write_queue (несколько операторов — write_queue.transaction()).
+    """
+
+    def __init__(self, session_factory=AsyncSessionFactory):
+        self.session_factory = session_factory
+        self.updates = 0
+        self.commits = 0
+        self.rollbacks = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        self.updates += 1
+        async with self.session_factory() as session:
+            data['session'] = session
+            token = current_session.set(session)
+            try:
+                result = await handler(event, data)
+            except Exception:
+                if session.in_transaction():
+                    self.rollbacks += 1
+                    await session.rollback()
+                raise
+            else:
+                if session.in_transaction():
+                    self.commits += 1
+                    await session.commit()
+                return result
+            finally:
+                current_session.reset(token)
+
+    def stats(self) -> dict:
+        return {'updates': self.updates, 'commits': self.commits, 'rollbacks': self.rollbacks}
+
 
-engine = create_async_engine(DATABASE_URL)
+db_session_middleware = DbSessionMiddleware()
 
-AsyncSessionFactory = sessionmaker(
-    bind=engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autoflush=False
-)
 
 async def init_db():
     async with engine.begin() as conn:
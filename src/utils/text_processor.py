@@ -1,23 +1,37 @@
 import re
 
+from aiogram.types import MessageEntity
+
+# HTML из редактора уроков -> Markdown v1 (<p> убирается отдельно, см. ниже)
+_SIMPLE_REPLACEMENTS = {
+    '</p>': '\n', '<br />': '\n', '<br>': '\n',
+    '<b>': '*', '</b>': '*', '<strong>': '*', '</strong>': '*',
+    '<i>': '_', '</i>': '_', '<em>': '_', '</em>': '_',
+    '—': '-',  # Fix lists (simple dashes, no escaping needed)
+}
+_SIMPLE_PATTERN = re.compile('|'.join(map(re.escape, _SIMPLE_REPLACEMENTS)))
+_EXTRA_NEWLINES = re.compile(r'\n{3,}')
+
+# MarkdownV2: спецсимволы экранируются одной заменой по классу символов,
+# маркеры разметки * _ ~ разбираются отдельным проходом (им нужна пара)
+_V2_ESCAPE = re.compile(r'[\[\]()`>#+\-=|{}.!]')
+_V2_MARKERS = re.compile(r'([*_~\n])')
+# Временные символы старого рендерера: в исходном тексте они всегда
+# превращались в маркеры — сохраняем это поведение байт-в-байт
+_V2_LEGACY_TEMPS = {'※': '*', '¤': '_', '±': '~', '§': '__'}
+_V2_LIST_ITEM = re.compile(r'(?m)^[-—•]\s')
+
+
 def process_markdown_simple(text: str) -> str:
     """Process text for basic Telegram Markdown (v1) format"""
     try:
-        # Remove HTML tags
-        text = text.replace('<p>', '').replace('</p>', '\n')
-        text = text.replace('<br />', '\n').replace('<br>', '\n')
-        
-        # Convert HTML to Markdown v1
-        text = text.replace('<b>', '*').replace('</b>', '*')
-        text = text.replace('<strong>', '*').replace('</strong>', '*')
-        text = text.replace('<i>', '_').replace('</i>', '_')
-        text = text.replace('<em>', '_').replace('</em>', '_')
+        # Remove HTML tags. <p> убираем первым: после него могут "склеиться" новые теги
+        text = text.replace('<p>', '')
+        # Convert HTML to Markdown v1 — один проход по строке
+        text = _SIMPLE_PATTERN.sub(lambda m: _SIMPLE_REPLACEMENTS[m.group()], text)
         
         # Clean up multiple newlines
-        text = re.sub(r'\n{3,}', '\n\n', text)
-        
-        # Fix lists (simple dashes, no escaping needed)
-        text = text.replace('—', '-')
+        text = _EXTRA_NEWLINES.sub('\n\n', text)
         
         return text.strip()
     except Exception as e:
@@ -25,36 +39,36 @@ def process_markdown_simple(text: str) -> str:
 
 # Keep the old function but use the new one in handlers
 def process_markdown(text: str) -> str:
-    """Process text for Telegram MarkdownV2 format"""
+    """Process text for Telegram MarkdownV2 format
+
+    Маркеры * _ ~ парно сочетаются в пределах строки (первый со вторым,
+    третий с четвёртым...) и остаются разметкой; непарные и прочие
+    спецсимволы экранируются. Время линейно от длины текста.
+    """
     try:
-        # First handle markdown elements
-        markdown_pairs = [
-            ('*', '※'), # Bold
-            ('_', '¤'),  # Italic
-            ('~', '±'),  # Strikethrough
-            ('__', '§'), # Underline
-        ]
-        
-        # Replace markdown with temporary symbols
-        for md, temp in markdown_pairs:
-            # Find pairs of markdown symbols and replace them
-            pattern = f'\\{md}(.*?)\\{md}'
-            matches = re.finditer(pattern, text)
-            for match in reversed(list(matches)):
-                text = text[:match.start()] + temp + match.group(1) + temp + text[match.end():]
-        
-        # Escape special characters
-        special_chars = r'_*[]()~`>#+-=|{}.!'
-        for char in special_chars:
-            text = text.replace(char, f'\\{char}')
+        # Нечётные элементы — маркеры и переносы строк, чётные — текст между ними
+        parts = _V2_MARKERS.split(_V2_ESCAPE.sub(r'\\\g<0>', text))
+        pending = {}  # маркер -> индекс открывающего маркера без пары
+        for i in range(1, len(parts), 2):
+            char = parts[i]
+            if char == '\n':
+                pending.clear()  # разметка не переходит через перенос строки
+                continue
+            opener = pending.pop(char, None)
+            if opener is None:
+                pending[char] = i
+                parts[i] = f'\\{char}'  # пока пары нет — экранирован
+            else:
+                parts[opener] = char
+        text = ''.join(parts)
         
-        # Restore markdown symbols
-        for md, temp in markdown_pairs:
-            text = text.replace(temp, md)
+        for temp, marker in _V2_LEGACY_TEMPS.items():
+            if temp in text:
+                text = text.replace(temp, marker)
             
-        # Fix lists (only at start of lines)
-        text = re.sub(r'(?m)^[-—•]\s', '\\- ', text)
-        text = re.sub(r'(?m)^(\d+)\.', r'\1\.', text)
+        # Fix lists (only at start of lines). Нумерованные списки отдельно
+        # не правим: точка после цифр уже экранирована общим правилом
+        text = _V2_LIST_ITEM.sub(r'\\- ', text)
         
         return text.strip()
     except Exception as e:
@@ -62,6 +76,111 @@ def process_markdown(text: str) -> str:
         return text.replace('*', '\\*').replace('_', '\\_').replace('[', '\\[').replace(']', '\\]')
 
 
+# Разметка уроков -> MessageEntity (без parse_mode: Telegram ничего не парсит)
+MESSAGE_LIMIT = 4096  # лимит Telegram в UTF-16 единицах
+_ENTITY_MARKERS = re.compile(r'(__|[*_~]|\n)')
+_ENTITY_TYPES = {'*': 'bold', '_': 'italic', '__': 'underline', '~': 'strikethrough'}
+_SPLIT_SEPARATORS = ('\n\n', '\n', ' ')
+
+
+def utf16_len(text: str) -> int:
+    """Длина в UTF-16 единицах — так Telegram считает offset/length и лимит"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def _parse_entities(text: str) -> tuple[str, list[tuple[str, int, int]]]:
+    """Снимаем парные маркеры; непарные остаются текстом. Смещения — в символах"""
+    parts = _ENTITY_MARKERS.split(text)
+    pairs = {}  # индекс открывающего маркера -> индекс закрывающего
+    pending = {}
+    for i in range(1, len(parts), 2):
+        marker = parts[i]
+        if marker == '\n':
+            pending.clear()  # разметка не переходит через перенос строки
+        elif marker in pending:
+            pairs[pending.pop(marker)] = i
+        else:
+            pending[marker] = i
+    closers = set(pairs.values())
+
+    plain = []
+    positions = {}  # индекс маркера в parts -> позиция в plain
+    pos = 0
+    for i, part in enumerate(parts):
+        if i in pairs or i in closers:
+            positions[i] = pos
+            continue
+        plain.append(part)
+        pos += len(part)
+    spans = [(_ENTITY_TYPES[parts[o]], positions[o], positions[c]) for o, c in pairs.items()]
+    return ''.join(plain), _drop_crossing(spans)
+
+
+def _drop_crossing(spans: list[tuple[str, int, int]]) -> list[tuple[str, int, int]]:
+    """Telegram принимает только вложенные сущности: пересекающиеся отбрасываем"""
+    kept = []
+    stack = []  # открытые сущности, в которые ещё может вложиться следующая
+    for span in sorted(spans, key=lambda s: (s[1], -s[2])):
+        _, start, end = span
+        if start == end:
+            continue
+        while stack and stack[-1][2] <= start:
+            stack.pop()
+        if stack and end > stack[-1][2]:
+            continue
+        stack.append(span)
+        kept.append(span)
+    return kept
+
+
+def _split_points(text: str, limit: int) -> list[tuple[int, int]]:
+    """Режем текст на куски <= limit UTF-16 единиц: по абзацу, строке, пробелу"""
+    chunks = []
+    start = 0
+    while utf16_len(text[start:]) > limit:
+        cut = start + limit
+        while (excess := utf16_len(text[start:cut]) - limit) > 0:
+            cut -= excess
+        for separator in _SPLIT_SEPARATORS:
+            found = text.rfind(separator, start, cut)
+            if found > start + limit // 2:
+                chunks.append((start, found))
+                start = found + len(separator)
+                break
+        else:
+            chunks.append((start, cut))
+            start = cut
+    chunks.append((start, len(text)))
+    return chunks
+
+
+def render_entities(text: str, limit: int = MESSAGE_LIMIT) -> list[tuple[str, list[MessageEntity]]]:
+    """Урок -> сообщения (текст, entities) с UTF-16 смещениями, каждое в пределах лимита.
+
+    Разметка та же, что у process_markdown_simple (*жирный*, _курсив_,
+    __подчёркнутый__, ~зачёркнутый~, HTML-теги); непарный маркер остаётся
+    текстом, поэтому отправка не падает из-за форматирования.
+    """
+    plain, spans = _parse_entities(process_markdown_simple(text))
+    messages = []
+    for chunk_start, chunk_end in _split_points(plain, limit):
+        chunk = plain[chunk_start:chunk_end]
+        bmp_only = utf16_len(chunk) == len(chunk)  # без эмодзи смещения совпадают
+        entities = []
+        for kind, start, end in spans:
+            start, end = max(start, chunk_start) - chunk_start, min(end, chunk_end) - chunk_start
+            if start >= end:
+                continue
+            if bmp_only:
+                offset, length = start, end - start
+            else:
+                offset, length = utf16_len(chunk[:start]), utf16_len(chunk[start:end])
+            entities.append(MessageEntity(type=kind, offset=offset, length=length))
+        if chunk.strip():
+            messages.append((chunk, entities))
+    return messages
+
+
 def format_datetime(dt):
     """Format datetime in Russian style"""
     return dt.strftime("%d.%m.%Y %H:%M")
\ No newline at end of file
@@ -0,0 +1,58 @@
+import logging
+from typing import NamedTuple, Optional
+
+from aiogram.fsm.storage.base import StorageKey
+
+from .fsm_storage import SQLiteStorage, fsm_storage
+
+logger = logging.getLogger(__name__)
+
+COURSE_DESTINY = 'course'  # отдельно от диалогов: state.clear() не сбрасывает прогресс
+
+
+class UserStateRecord(NamedTuple):
+    state: Optional[str]
+    course_id: Optional[str]
+    lesson: Optional[int]
+
+
+def course_key(user_id: int) -> StorageKey:
+    """Ключ прогресса ученика в общем хранилище (личный чат, destiny='course')"""
+    return StorageKey(bot_id=0, chat_id=user_id, user_id=user_id, destiny=COURSE_DESTINY)
+
+
+class UserStates:
+    """Где ученик в курсе: состояние, курс, урок.
+
+    Живёт в том же SQLiteStorage, что и FSM aiogram: чтение из памяти,
+    запись — пачкой через общий писатель. set(durable=True) дожидается commit.
+    """
+
+    def __init__(self, storage: SQLiteStorage = fsm_storage):
+        self.storage = storage
+
+    async def get(self, user_id: int) -> Optional[UserStateRecord]:
+        key = course_key(user_id)
+        state = await self.storage.get_state(key)
+        if state is None:
+            return None
+        data = await self.storage.get_data(key)
+        return UserStateRecord(state, data.get('course_id'), data.get('lesson'))
+
+    async def set(self, user_id: int, course_id: Optional[str], state: str,
+                  lesson: Optional[int] = None, durable: bool = False) -> UserStateRecord:
+        key = course_key(user_id)
+        await self.storage.set_state(key, state)
+        await self.storage.update_data(key, {'course_id': course_id, 'lesson': lesson})
+        if durable:
+            await self.storage.flush()
+        return UserStateRecord(state, course_id, lesson)
+
+    def invalidate(self, user_id: int):
+        self.storage.invalidate(course_key(user_id))
+
+    def stats(self) -> dict:
+        return self.storage.stats()
+
+
+user_states = UserStates()
@@ -0,0 +1,199 @@
+import asyncio
+import logging
+import math
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import bindparam, text
+
+from src.config import SCHEDULER_SHARDS, WORKER_ID, WORKER_LEASE
+from .lesson_queue import DB_TIME_FORMAT, parse_db_time, utc_now
+from .session import session_scope
+from .write_queue import WriteQueue, write_queue as default_writer
+
+logger = logging.getLogger(__name__)
+
+POLLING = 'polling'  # getUpdates допускает одного читателя — поллит только владелец этой аренды
+SHARD_PREFIX = 'shard:'
+WORKER_PREFIX = 'worker:'  # пульс процесса: по нему считаем живых воркеров для честной доли
+STALE_WORKERS = timedelta(days=1)
+
+LEASE_ROWS = text('SELECT name, owner, lease_until FROM worker_leases')
+SEED_LEASE = text('INSERT OR IGNORE INTO worker_leases (name) VALUES (:name)')
+# Берём/продлеваем: своё, ничьё или с истёкшей арендой. Гонку двух воркеров решает WHERE
+ACQUIRE_LEASES = text('''
+    UPDATE worker_leases
+    SET owner = :owner, lease_until = :lease_until
+    WHERE name IN :names
+    AND (owner IS NULL OR owner = :owner OR lease_until <= :now)
+    RETURNING name
+''').bindparams(bindparam('names', expanding=True))
+DELETE_WORKERS = text('''
+    DELETE FROM worker_leases
+    WHERE name LIKE 'worker:%' AND (owner = :owner OR lease_until <= :stale)
+''')
+RELEASE_LEASES = text('''
+    UPDATE worker_leases
+    SET owner = NULL, lease_until = NULL
+    WHERE name IN :names AND owner = :owner
+''').bindparams(bindparam('names', expanding=True))
+
+
+def shard_name(shard: int) -> str:
+    return f'{SHARD_PREFIX}{shard}'
+
+
+def shard_number(name: str) -> int:
+    return int(name[len(SHARD_PREFIX):])
+
+
+def shard_of(user_id: int, shards: int) -> int:
+    """Шард ученика; тот же остаток считает SQL-фильтр (user_id % :shards)"""
+    return int(user_id) % shards
+
+
+class WorkerLeases:
+    """Аренды процессов в таблице worker_leases.
+
+    Работа планировщика поделена на SCHEDULER_SHARDS шардов по user_id.
+    Каждый процесс раз в треть WORKER_LEASE продлевает свой пульс и шарды,
+    добирает свободные до честной доли (шарды / живые воркеры), лишние
+    отдаёт — так новый процесс получает работу, а шарды упавшего забираются,
+    как только истечёт его аренда. Отдельная аренда POLLING выбирает
+    единственного читателя getUpdates. Доставку ровно одному воркеру
+    по-прежнему гарантирует аренда урока в delivery_cursor, шарды лишь
+    делят, кто грузит и рассылает дедлайны.
+    """
+
+    def __init__(self, shards: int = SCHEDULER_SHARDS, owner: str = WORKER_ID,
+                 lease: float = WORKER_LEASE, writer: WriteQueue = default_writer):
+        if shards < 1:
+            raise ValueError("Нужен хотя бы один шард")
+        self.shards = shards
+        self.owner = owner
+        self.lease = lease
+        self.writer = writer
+        self.owned: frozenset[int] = frozenset()
+        self.roles: set[str] = set()  # удерживаемые аренды кроме шардов (POLLING)
+        self.heartbeat = f'{WORKER_PREFIX}{owner}'
+        self.peers = 0  # сколько других живых воркеров видели при последней балансировке
+        self.rebalances = 0
+        self._listeners: list[Callable[[frozenset, frozenset, set], Awaitable]] = []
+
+    @property
+    def interval(self) -> float:
+        return self.lease / 3
+
+    def owns(self, user_id: int) -> bool:
+        return shard_of(user_id, self.shards) in self.owned
+
+    def _lease_until(self, now: datetime) -> str:
+        return (now + timedelta(seconds=self.lease)).strftime(DB_TIME_FORMAT)
+
+    async def start(self, now: Optional[datetime] = None):
+        """Заводим строки шардов, POLLING и своего пульса (существующие не трогаем)"""
+        now = now or utc_now()
+        await self.writer.execute(DELETE_WORKERS, {
+            'owner': self.owner, 'stale': (now - STALE_WORKERS).strftime(DB_TIME_FORMAT),
+        })
+        names = [shard_name(shard) for shard in range(self.shards)] + [POLLING, self.heartbeat]
+        await self.writer.execute(SEED_LEASE, [{'name': name} for name in names])
+        await self._acquire([self.heartbeat], now)
+
+    async def _acquire(self, names: list[str], now: datetime) -> set[str]:
+        if not names:
+            return set()
+        rows = await self.writer.fetch(ACQUIRE_LEASES, {
+            'names': names, 'owner': self.owner,
+            'now': now.strftime(DB_TIME_FORMAT), 'lease_until': self._lease_until(now),
+        })
+        return {row[0] for row in rows}
+
+    async def _release(self, names: list[str]) -> int:
+        if not names:
+            return 0
+        return await self.writer.execute(RELEASE_LEASES, {'names': names, 'owner': self.owner})
+
+    async def acquire(self, name: str, now: Optional[datetime] = None) -> bool:
+        """Берём именованную аренду (POLLING); дальше её продлевает rebalance()"""
+        if await self._acquire([name], now or utc_now()):
+            self.roles.add(name)
+            return True
+        self.roles.discard(name)
+        return False
+
+    async def rebalance(self, now: Optional[datetime] = None) -> tuple[frozenset, frozenset, set]:
+        """Продлеваем своё, добираем свободное до честной доли, лишнее отдаём.
+
+        Возвращает (полученные шарды, потерянные шарды, потерянные роли).
+        """
+        now = now or utc_now()
+        async with session_scope() as session:
+            rows = (await session.execute(LEASE_ROWS)).all()
+
+        peers, mine, free = 0, [], []
+        for name, owner, lease_until in rows:
+            alive = owner is not None and parse_db_time(lease_until) > now
+            if name.startswith(WORKER_PREFIX):
+                peers += alive and owner != self.owner
+                continue
+            if not name.startswith(SHARD_PREFIX) or shard_number(name) >= self.shards:
+                continue  # POLLING или строки от прошлого, большего SCHEDULER_SHARDS
+            if owner == self.owner:
+                mine.append(shard_number(name))
+            elif not alive:
+                free.append(shard_number(name))
+
+        fair = math.ceil(self.shards / (peers + 1))
+        keep, extra = sorted(mine)[:fair], sorted(mine)[fair:]
+        wanted = [shard_name(shard) for shard in keep + sorted(free)[:max(0, fair - len(keep))]]
+        got = await self._acquire([self.heartbeat, *wanted, *sorted(self.roles)], now)
+        await self._release([shard_name(shard) for shard in extra])
+
+        owned = frozenset(shard_number(name) for name in got if name.startswith(SHARD_PREFIX))
+        gained, lost = owned - self.owned, self.owned - owned
+        lost_roles = self.roles - got
+        self.roles -= lost_roles
+        self.owned, self.peers = owned, peers
+        self.rebalances += 1
+        if gained or lost or lost_roles:
+            logger.info(f"6301 | Шарды {self.owner}: {sorted(owned)} (+{sorted(gained)} -{sorted(lost)}), "
+                        f"других воркеров {peers}")
+        for role in lost_roles:
+            logger.warning(f"6302 | Аренда {role} потеряна")
+        return gained, lost, lost_roles
+
+    def subscribe(self, listener: Callable[[frozenset, frozenset, set], Awaitable]):
+        """listener(gained, lost, lost_roles) вызывается после каждой балансировки в run()"""
+        self._listeners.append(listener)
+
+    async def run(self):
+        """Фоновая балансировка раз в треть срока аренды"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                changes = await self.rebalance()
+                for listener in self._listeners:
+                    await listener(*changes)
+            except Exception as e:
+                logger.error(f"6303 | Ошибка балансировки шардов: {e}", exc_info=True)
+
+    async def release_all(self) -> int:
+        """При остановке отдаём шарды и роли сразу, не дожидаясь истечения аренды"""
+        released = await self._release([shard_name(shard) for shard in sorted(self.owned)] + sorted(self.roles))
+        await self.writer.execute(DELETE_WORKERS, {'owner': self.owner, 'stale': None})
+        self.owned, self.roles = frozenset(), set()
+        return released
+
+    def stats(self) -> dict:
+        return {
+            'owner': self.owner,
+            'shards': self.shards,
+            'owned': sorted(self.owned),
+            'roles': sorted(self.roles),
+            'peers': self.peers,
+            'rebalances': self.rebalances,
+        }
+
+
+worker_leases = WorkerLeases()
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, NamedTuple, Optional, Union
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from src.config import WRITE_BATCH_SIZE, WRITE_BATCH_DELAY
+from .engine import engine as default_engine
+
+logger = logging.getLogger(__name__)
+
+Params = Union[dict, list, None]  # list[dict] — executemany
+Work = Callable[[AsyncConnection], Awaitable[Any]]
+
+
+class WriteIntent(NamedTuple):
+    statement: Any  # оператор или work(conn) для transaction()
+    params: Params
+    future: asyncio.Future
+    returning: bool = False  # вернуть строки (UPDATE ... RETURNING), а не rowcount
+    work: bool = False  # statement — функция с несколькими операторами
+
+
+class WriteQueue:
+    """Единственный писатель в SQLite (group commit).
+
+    SQLite всё равно пропускает писателей по одному, поэтому вместо
+    commit'а в каждом хендлере записи складываются в очередь, а актор
+    с собственным соединением выполняет их пачками одной транзакцией:
+    всё, что накопилось, пока шёл предыдущий commit (до WRITE_BATCH_SIZE
+    записей, плюс окно WRITE_BATCH_DELAY, если оно задано). Одиночная
+    запись не ждёт, а чем выше нагрузка, тем больше записей на один commit.
+
+    execute() возвращает rowcount (или строки RETURNING для fetch()),
+    когда запись уже закоммичена. Если
+    пачка падает, её записи повторяются по одной — ошибку получает только
+    тот, чья запись виновата.
+
+    Несколько операторов с логикой между ними (одобрение ДЗ, активация
+    кода) — одна запись через transaction(): её work(conn) выполняется
+    внутри пачки и откатывается вместе с ней.
+
+    В обход писателя в БД пишут только:
+    - init_models() (create_all) — при старте, до первого апдейта и до
+      запуска писателя;
+    - старые модули, не подключённые к боту (services/scheduler.py,
+      utils/lessons.py, utils/course_service.py, StatsCache) — при
+      подключении их записи переводятся сюда.
+    Сессии апдейта (DbSessionMiddleware) и session_scope() — только для чтения.
+    """
+
+    def __init__(self, engine: AsyncEngine = default_engine,
+                 max_batch: int = WRITE_BATCH_SIZE, max_delay: float = WRITE_BATCH_DELAY):
+        if max_batch < 1:
+            raise ValueError("Размер пачки должен быть не меньше 1")
+        self.engine = engine
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.writes = 0
+        self.commits = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(), name="write-queue")
+        logger.info(f"6101 | Писатель запущен: пачка до {self.max_batch}, окно {self.max_delay * 1000:.0f} мс")
+
+    def submit(self, statement, params: Params = None, returning: bool = False,
+               work: bool = False) -> asyncio.Future:
+        """Ставим запись в очередь; future завершится после commit'а (результат — rowcount)"""
+        if not self.running:
+            self.start()
+        if isinstance(statement, str):
+            statement = text(statement)
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait(WriteIntent(statement, params, future, returning, work))
+        return future
+
+    async def execute(self, statement, params: Params = None) -> int:
+        return await self.submit(statement, params)
+
+    async def fetch(self, statement, params: Params = None) -> list:
+        """Запись с RETURNING: строки читаются до commit'а, отдаются после"""
+        return await self.submit(statement, params, returning=True)
+
+    async def transaction(self, work: Work) -> Any:
+        """Несколько операторов атомарно: await work(conn) внутри пачки, результат — то, что она вернула.
+
+        Если пачка откатится, work выполнится ещё раз отдельно, поэтому
+        внутри — только запросы к conn, без отправки сообщений и правки кэшей.
+        """
+        return await self.submit(work, work=True)
+
+    async def stop(self):
+        """Дописываем всё, что уже в очереди, и останавливаем актор"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        logger.info("6102 | Писатель остановлен")
+
+    def stats(self) -> dict:
+        return {
+            'queue_depth': self._queue.qsize() if self._queue else 0,
+            'writes': self.writes,
+            'commits': self.commits,
+            'failed': self.failed,
+            'writes_per_commit': self.writes / self.commits if self.commits else 0.0,
+        }
+
+    async def _collect(self, first: WriteIntent) -> tuple[list[WriteIntent], bool]:
+        """Добираем попутчиков: до max_batch записей или до конца окна max_delay"""
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+        await asyncio.sleep(0)  # даём уже готовым хендлерам встать в очередь
+        while len(batch) < self.max_batch:
+            try:
+                intent = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    intent = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if intent is None:
+                return batch, True
+            batch.append(intent)
+        return batch, False
+
+    async def _run(self):
+        async with self.engine.connect() as conn:
+            stopping = False
+            while not stopping:
+                first = await self._queue.get()
+                if first is None:
+                    break
+                batch, stopping = await self._collect(first)
+                await self._commit(conn, batch)
+            # После stop() в очереди могли остаться записи — тоже дописываем
+            while not self._queue.empty():
+                intent = self._queue.get_nowait()
+                if intent is not None:
+                    await self._commit(conn, [intent])
+
+    async def _commit(self, conn: AsyncConnection, batch: list[WriteIntent]):
+        batch = [intent for intent in batch if not intent.future.cancelled()]
+        if not batch:
+            return
+        try:
+            async with conn.begin():
+                results = []
+                for intent in batch:
+                    if intent.work:
+                        results.append(await intent.statement(conn))
+                        continue
+                    result = await conn.execute(intent.statement, intent.params)
+                    results.append(result.all() if intent.returning else result.rowcount)
+        except Exception as e:
+            if len(batch) == 1:
+                self._fail(batch[0], e)
+                return
+            logger.warning(f"6103 | Пачка из {len(batch)} записей откатилась ({e}), повторяем по одной")
+            for intent in batch:
+                await self._commit(conn, [intent])
+            return
+
+        self.commits += 1
+        self.writes += len(batch)
+        for intent, result in zip(batch, results):
+            if not intent.future.done():
+                intent.future.set_result(result)
+
+    def _fail(self, intent: WriteIntent, error: Exception):
+        self.failed += 1
+        logger.error(f"6104 | Запись не выполнена: {error}")
+        if not intent.future.done():
+            intent.future.set_exception(error)
+
+
+write_queue = WriteQueue()
@@ -0,0 +1,87 @@
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+from src.services.approval import approve_homework
+from src.utils.fsm_storage import SQLiteStorage
+from src.utils.lesson_manifest import LessonManifests
+from src.utils.user_state import UserStateRecord, UserStates
+
+NOW = datetime(2026, 10, 18, 12, 0, 0)
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def homework(session_factory):
+    async with session_factory() as session:
+        await session.execute(text("INSERT INTO homeworks (user_id, course_id, lesson, status) VALUES (7, 'femininity', 1, 'pending')"))
+        await session.execute(text("INSERT INTO user_courses (user_id, course_id, version_id, current_lesson) VALUES (7, 'femininity', 'self_check', 1)"))
+        await session.commit()
+
+
+@pytest.fixture(autouse=True)
+def states(session_factory, writer, monkeypatch):
+    states = UserStates(SQLiteStorage(session_factory=session_factory, writer=writer))
+    monkeypatch.setattr('src.services.approval.user_states', states)
+    return states
+
+
+@pytest.fixture(autouse=True)
+def manifests(courses_dir, monkeypatch):
+    monkeypatch.setattr('src.config.TEST_MODE', False)
+    monkeypatch.setattr('src.services.approval.lesson_manifests', LessonManifests(courses_dir))
+    monkeypatch.setattr('src.services.approval.get_lesson_delay', lambda: 24 * 3600)
+    queue = []
+    monkeypatch.setattr('src.services.approval.lesson_queue.push', lambda *args: queue.append(args))
+    return queue
+
+
+async def fetch(session_factory, sql):
+    async with session_factory() as session:
+        return (await session.execute(text(sql))).all()
+
+
+@pytest.mark.asyncio
+async def test_approval_writes_everything_in_one_go(session_factory, writer, manifests, states):
+    """Одобрение: статус, план доставки урока, прогресс и состояние одной транзакцией ✅"""
+    approval = await approve_homework(7, 'femininity', 1, admin_id=99, writer=writer, now=NOW)
+
+    assert approval.next_lesson == 2 and approval.files == 3
+    assert approval.next_lesson_at == NOW + timedelta(days=1)
+    assert await fetch(session_factory, "SELECT status, approval_time, next_lesson_at, admin_id FROM homeworks") == [
+        ('approved', '2026-10-18 12:00:00', '2026-10-19 12:00:00', 99)
+    ]
+    # Одна строка на урок, а не на каждый из трёх файлов
+    assert await fetch(session_factory, "SELECT lesson, starts_at, next_file, next_send_at FROM lesson_deliveries") == [
+        (2, '2026-10-19 12:00:00', 0, '2026-10-19 12:00:00'),
+    ]
+    assert await fetch(session_factory, "SELECT current_lesson FROM user_courses") == [(2,)]
+    assert await fetch(session_factory, "SELECT key, state, json_extract(data, '$.lesson') FROM fsm_storage") == [
+        ('fsm:7:7:course', 'waiting_next_lesson', 2)
+    ]
+    assert await states.get(7) == UserStateRecord('waiting_next_lesson', 'femininity', 2)
+    assert manifests == [(NOW + timedelta(days=1), 7, 'femininity', 2)]  # урок открывается через сутки, а не сразу
+
+
+@pytest.mark.asyncio
+async def test_double_click_is_noop(session_factory, writer, manifests):
+    """Повторный клик «одобрить» не планирует файлы второй раз 🖱"""
+    assert await approve_homework(7, 'femininity', 1, writer=writer, now=NOW)
+    assert await approve_homework(7, 'femininity', 1, writer=writer, now=NOW) is None
+
+    assert await fetch(session_factory, "SELECT next_file FROM lesson_deliveries") == [(0,)]
+
+
+@pytest.mark.asyncio
+async def test_failure_rolls_back_everything(session_factory, writer, manifests):
+    """Ошибка посреди одобрения — в БД не остаётся половины изменений 🧯"""
+    async with session_factory() as session:
+        await session.execute(text("DROP TABLE fsm_storage"))
+        await session.commit()
+
+    with pytest.raises(Exception):
+        await approve_homework(7, 'femininity', 1, writer=writer, now=NOW)
+
+    assert await fetch(session_factory, "SELECT status FROM homeworks") == [('pending',)]
+    assert await fetch(session_factory, "SELECT lesson FROM lesson_deliveries") == []
+    assert manifests == []
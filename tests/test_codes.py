@@ -0,0 +1,46 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+from src.utils.models import ActivationCode, UserCourse
+from src.utils.codes import find_activation_code, claim_activation_code, is_code_used
+from src.utils.requests import verify_course_code
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def code(session_factory):
+    async with session_factory() as session:
+        session.add(ActivationCode(code='подарок-42', course_id='femininity', version_id='premium'))
+        await session.commit()
+
+
+@pytest.mark.asyncio
+async def test_single_use_code_lookup(session_factory):
+    """Одноразовый код находится по ключу, регистр не важен 🎟"""
+    target = await find_activation_code(' Подарок-42 ')
+
+    assert (target.course_id, target.version_id) == ('femininity', 'premium')
+    assert await find_activation_code('подарок-43') is None
+    assert await is_code_used('подарок-42') is False
+
+
+@pytest.mark.asyncio
+async def test_single_use_code_claimed_once(session_factory, writer):
+    """Код гасится атомарно — второй пользователь его уже не получит 🔒"""
+    assert await claim_activation_code('подарок-42', 1, writer=writer) is not None
+    assert await claim_activation_code('подарок-42', 2, writer=writer) is None
+    assert await find_activation_code('подарок-42') is None
+    assert await is_code_used('подарок-42') is True
+
+
+@pytest.mark.asyncio
+async def test_activation_claims_code_and_enrolls_in_one_write(session_factory, writer, monkeypatch):
+    """Активация: код гасится и курс записывается одной транзакцией писателя 🎓"""
+    monkeypatch.setattr('src.utils.requests.write_queue', writer)
+
+    ok, _ = await verify_course_code('подарок-42', 1)
+    assert ok
+    assert await verify_course_code('подарок-42', 2) == (False, "Неверное кодовое слово")  # код погашен
+    async with session_factory() as session:
+        assert (await session.execute(select(UserCourse.user_id, UserCourse.version_id))).all() == [(1, 'premium')]
+    assert writer.stats()['commits'] == 1
@@ -0,0 +1,104 @@
+import json
+import os
+import pytest
+
+from src.utils.course_cache import CourseCatalog, Course
+
+
+def write_courses(path, code='роза', name='Женственность'):
+    path.write_text(json.dumps({
+        'femininity': {
+            'name': name,
+            'next_lesson_delay': 24,
+            'versions': [
+                {'id': 'self_check', 'name': 'Базовый', 'code': code, 'self_approved': True,
+                 'price': {'rub': 1500}, 'features': ['Доступ к материалам']},
+                {'id': 'admin_check', 'name': 'Стандарт', 'code': 'фиалка'},
+            ],
+        }
+    }, ensure_ascii=False), encoding='utf-8')
+
+
+@pytest.fixture
+def courses_file(tmp_path):
+    path = tmp_path / 'courses.json'
+    write_courses(path)
+    return path
+
+
+def test_catalog_parses_typed_courses(courses_file):
+    """Каталог отдаёт типизированные курсы и тарифы 📚"""
+    catalog = CourseCatalog(str(courses_file), check_interval=0)
+    course = catalog.get('femininity')
+
+    assert isinstance(course, Course)
+    assert course.name == 'Женственность'
+    assert course.version('self_check').self_approved is True
+    assert course.version('admin_check').self_approved is False
+    assert catalog.raw()['femininity']['versions'][0]['code'] == 'роза'
+
+
+def test_catalog_reads_file_once(courses_file, monkeypatch):
+    """Пока файл не менялся — повторно не читаем 🗂"""
+    catalog = CourseCatalog(str(courses_file), check_interval=0)
+    catalog.courses
+    opened = []
+    real_open = open
+    monkeypatch.setattr('builtins.open', lambda *a, **k: opened.append(a) or real_open(*a, **k))
+
+    for _ in range(10):
+        catalog.get('femininity')
+    assert opened == []
+
+
+def test_catalog_reloads_on_change(courses_file):
+    """Изменили courses.json — каталог подхватил новую версию 🔄"""
+    catalog = CourseCatalog(str(courses_file), check_interval=0)
+    old = catalog.courses
+    write_courses(courses_file, name='Женственность 2.0')
+    stat = os.stat(courses_file)
+    os.utime(courses_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert catalog.get('femininity').name == 'Женственность 2.0'
+    assert old['femininity'].name == 'Женственность'  # старый снимок не тронут
+
+
+def test_broken_json_keeps_previous_snapshot(courses_file):
+    """Битый JSON посреди правки не ломает каталог 🧯"""
+    catalog = CourseCatalog(str(courses_file), check_interval=0)
+    assert catalog.get('femininity') is not None
+    courses_file.write_text('{"femininity": ', encoding='utf-8')
+
+    assert catalog.get('femininity').name == 'Женственность'
+
+
+def test_check_interval_throttles_stat(courses_file):
+    """mtime проверяем не чаще check_interval ⏱"""
+    catalog = CourseCatalog(str(courses_file), check_interval=3600)
+    catalog.courses
+    write_courses(courses_file, name='Другое имя')
+
+    assert catalog.get('femininity').name == 'Женственность'
+    assert catalog.reload() is True
+    assert catalog.get('femininity').name == 'Другое имя'
+
+
+def test_resolve_code_is_normalized(courses_file):
+    """Код ищется в индексе без учёта регистра и пробелов 🔑"""
+    catalog = CourseCatalog(str(courses_file), check_interval=0)
+
+    assert catalog.resolve_code('  РОЗА ') == ('femininity', 'self_check', True)
+    assert catalog.resolve_code('Фиалка') == ('femininity', 'admin_check', False)
+    assert catalog.resolve_code('кактус') is None
+
+
+def test_code_index_follows_reload(courses_file):
+    """После правки courses.json старый код перестаёт работать 🔁"""
+    catalog = CourseCatalog(str(courses_file), check_interval=0)
+    assert catalog.resolve_code('роза')
+    write_courses(courses_file, code='пион')
+    stat = os.stat(courses_file)
+    os.utime(courses_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert catalog.resolve_code('роза') is None
+    assert catalog.resolve_code('ПИОН').version_id == 'self_check'
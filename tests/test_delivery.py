@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+
+from src.utils.delivery import DeliveryPool
+
+
+@pytest.mark.asyncio
+async def test_per_user_order_is_kept():
+    """Файлы одного ученика приходят строго по порядку 📬"""
+    pool = DeliveryPool(workers=4, queue_size=10)
+    sent = []
+
+    def make_job(user_id, n):
+        async def job():
+            await asyncio.sleep(0.01 if n == 0 else 0)  # первый файл «тяжёлый»
+            sent.append((user_id, n))
+        return job
+
+    try:
+        for n in range(3):
+            await pool.submit(7, make_job(7, n))
+        await pool.join()
+    finally:
+        await pool.stop()
+
+    assert sent == [(7, 0), (7, 1), (7, 2)]
+
+
+@pytest.mark.asyncio
+async def test_slow_user_does_not_block_others():
+    """Медленное видео одного ученика не тормозит остальных 🐢🐇"""
+    pool = DeliveryPool(workers=2, queue_size=10)
+    slow_started = asyncio.Event()
+    release_slow = asyncio.Event()
+    fast_done = asyncio.Event()
+
+    async def slow_job():
+        slow_started.set()
+        await release_slow.wait()
+
+    async def fast_job():
+        fast_done.set()
+
+    try:
+        await pool.submit(0, slow_job)  # партиция 0
+        await slow_started.wait()
+        await pool.submit(1, fast_job)  # партиция 1
+        await asyncio.wait_for(fast_done.wait(), 1)
+        assert pool.stats()['in_flight'] == 1
+        release_slow.set()
+        await pool.join()
+    finally:
+        await pool.stop()
+
+    assert pool.stats()['processed'] == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_job_is_counted():
+    """Ошибка одной доставки не роняет воркер ❌"""
+    pool = DeliveryPool(workers=1, queue_size=10)
+
+    async def broken():
+        raise RuntimeError("Telegram устал")
+
+    async def ok():
+        pass
+
+    try:
+        await pool.submit(1, broken)
+        await pool.submit(1, ok)
+        await pool.join()
+    finally:
+        await pool.stop()
+
+    stats = pool.stats()
+    assert stats['failed'] == 1
+    assert stats['processed'] == 1
+    assert stats['queue_depth'] == 0
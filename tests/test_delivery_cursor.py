@@ -0,0 +1,58 @@
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+from src.utils.delivery_cursor import DeliveryCursor
+
+NOW = datetime(2026, 10, 18, 12, 0, 0)
+LESSON = (7, 'femininity', 2)
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def delivery(engine):
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "INSERT INTO lesson_deliveries (user_id, course_id, lesson, starts_at, next_file, next_send_at) "
+            "VALUES (7, 'femininity', 2, '2026-10-18 12:00:00', 0, '2026-10-18 12:00:00')"
+        ))
+
+
+@pytest.mark.asyncio
+async def test_claim_is_exclusive(writer):
+    """Урок забирает только один воркер, второй ждёт конца аренды 🔒"""
+    first, second = DeliveryCursor('w1', lease=60, writer=writer), DeliveryCursor('w2', lease=60, writer=writer)
+
+    claim = await first.claim(*LESSON, now=NOW)
+    assert claim.next_file == 0 and claim.starts_at == NOW
+    assert await second.claim(*LESSON, now=NOW + timedelta(seconds=30)) is None
+    assert await first.claim(7, 'femininity', 3, now=NOW) is None  # такого плана нет
+
+
+@pytest.mark.asyncio
+async def test_crashed_worker_is_taken_over(writer):
+    """Воркер упал после первой пачки — второй продолжает со следующего файла 🔁"""
+    crashed, survivor = DeliveryCursor('w1', lease=60, writer=writer), DeliveryCursor('w2', lease=60, writer=writer)
+
+    claim = await crashed.claim(*LESSON, now=NOW)
+    claim = await crashed.advance(claim, 2, NOW, now=NOW)  # отправил два файла и «упал»
+    assert claim.lease_until == NOW + timedelta(seconds=60)
+
+    taken = await survivor.claim(*LESSON, now=NOW + timedelta(seconds=61))
+    assert taken.next_file == 2
+
+    # Очнувшийся воркер уже не может сдвинуть курсор
+    assert await crashed.advance(claim, 3, None, release=True) is None
+    assert crashed.stats()['lost'] == 1
+    assert await survivor.advance(taken, 3, None, release=True)
+
+
+@pytest.mark.asyncio
+async def test_release_all_frees_own_leases(writer):
+    """При остановке свои аренды отпускаются, урок сразу доступен 🚪"""
+    stopping, other = DeliveryCursor('w1', lease=600, writer=writer), DeliveryCursor('w2', lease=600, writer=writer)
+    await stopping.claim(*LESSON, now=NOW)
+
+    assert await other.release_all() == 0
+    assert await stopping.release_all() == 1
+    assert await other.claim(*LESSON, now=NOW) is not None
@@ -0,0 +1,35 @@
+import pytest
+from sqlalchemy import text
+
+from src.utils.engine import create_engine, sqlite_connection, sqlite_pragmas
+
+
+def test_pragmas_from_config_and_overrides():
+    """Профиль берётся из конфига, отдельные прагмы можно переопределить или выключить ⚙️"""
+    pragmas = sqlite_pragmas(cache_size=-2000, mmap_size=None)
+    assert pragmas['journal_mode'] == 'WAL'
+    assert pragmas['synchronous'] == 'NORMAL'
+    assert pragmas['cache_size'] == -2000
+    assert 'mmap_size' not in pragmas
+
+
+@pytest.mark.asyncio
+async def test_engine_applies_pragmas_on_every_connection(tmp_path):
+    """Каждое соединение из пула получает WAL, NORMAL и busy_timeout 🗄"""
+    engine = create_engine(f"sqlite+aiosqlite:///{tmp_path / 'bot.db'}")
+    try:
+        async with engine.connect() as conn:
+            assert (await conn.execute(text("PRAGMA journal_mode"))).scalar() == 'wal'
+            assert (await conn.execute(text("PRAGMA synchronous"))).scalar() == 1  # NORMAL
+            assert (await conn.execute(text("PRAGMA busy_timeout"))).scalar() == 5000
+            assert (await conn.execute(text("PRAGMA temp_store"))).scalar() == 2  # MEMORY
+    finally:
+        await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_raw_connection_gets_same_profile(tmp_path):
+    """Старый код на aiosqlite получает тот же профиль 🔌"""
+    async with sqlite_connection(str(tmp_path / 'bot.db'), sqlite_pragmas(busy_timeout=1234)) as db:
+        cursor = await db.execute("PRAGMA busy_timeout")
+        assert (await cursor.fetchone())[0] == 1234
@@ -0,0 +1,100 @@
+import pytest
+import pytest_asyncio
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.utils.engine import create_engine
+from src.utils.fsm_storage import SQLiteStorage
+from src.utils.models import Base
+from src.utils.write_queue import WriteQueue
+
+KEY = StorageKey(bot_id=1, chat_id=-100, user_id=42)
+
+
+class RejectStates(StatesGroup):
+    waiting_for_comment = State()
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    engine = create_engine(f"sqlite+aiosqlite:///{tmp_path / 'fsm.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest_asyncio.fixture
+async def make_storage(engine):
+    writers = []
+
+    def make(**kwargs):
+        writer = WriteQueue(engine)
+        writers.append(writer)
+        return SQLiteStorage(session_factory=async_sessionmaker(engine), writer=writer, **kwargs)
+
+    yield make
+    for writer in writers:
+        await writer.stop()
+
+
+async def count_rows(engine) -> int:
+    async with engine.connect() as conn:
+        return (await conn.execute(text("SELECT COUNT(*) FROM fsm_storage"))).scalar()
+
+
+@pytest.mark.asyncio
+async def test_state_survives_restart(make_storage):
+    """Состояние и данные переживают рестарт бота 🔁"""
+    storage = make_storage()
+    await storage.set_state(KEY, RejectStates.waiting_for_comment)
+    await storage.update_data(KEY, {'user_id': 7, 'lesson': 2})
+    await storage.close()
+
+    restarted = make_storage()
+    assert await restarted.get_state(KEY) == 'RejectStates:waiting_for_comment'
+    assert await restarted.get_data(KEY) == {'user_id': 7, 'lesson': 2}
+
+
+@pytest.mark.asyncio
+async def test_reads_from_memory_and_writes_are_coalesced(make_storage, engine):
+    """Хендлер трогает ключ трижды — одна строка, одна запись; чтение из памяти 🧠"""
+    storage = make_storage()
+    await storage.set_state(KEY, 'waiting_code')
+    await storage.update_data(KEY, {'course_id': 'femininity'})
+    await storage.set_state(KEY, 'waiting_name')
+    assert await count_rows(engine) == 0  # ещё не сброшено
+
+    assert await storage.flush() == 1
+    assert storage.writer.stats()['writes'] == 1
+    assert await count_rows(engine) == 1
+    assert await storage.get_state(KEY) == 'waiting_name'
+    assert storage.stats()['misses'] == 1
+
+
+@pytest.mark.asyncio
+async def test_clear_deletes_row(make_storage, engine):
+    """state.clear() удаляет строку, а не копит пустые 🧹"""
+    storage = make_storage()
+    await storage.set_state(KEY, 'waiting_code')
+    await storage.flush()
+    await storage.set_state(KEY, None)
+    await storage.set_data(KEY, {})
+    await storage.flush()
+    assert await count_rows(engine) == 0
+
+
+@pytest.mark.asyncio
+async def test_dirty_keys_are_not_evicted(make_storage):
+    """Несохранённые изменения не вытесняются из LRU 📌"""
+    storage = make_storage(max_entries=1)
+    other = StorageKey(bot_id=1, chat_id=5, user_id=5)
+    await storage.set_state(KEY, 'waiting_code')
+    await storage.get_state(other)
+    assert await storage.get_state(KEY) == 'waiting_code'
+
+    await storage.flush()
+    restarted = make_storage()
+    assert await restarted.get_state(KEY) == 'waiting_code'
@@ -0,0 +1,87 @@
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+from sqlalchemy import text
+
+from src.utils.lesson_manifest import LessonManifests
+from src.utils.scheduler import send_lesson_files
+from src.utils.delivery_cursor import DeliveryCursor
+
+START = datetime(2026, 10, 18, 12, 0, 0)
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def delivery(session_factory, writer, monkeypatch):
+    async with session_factory() as session:
+        await session.execute(text(
+            "INSERT INTO lesson_deliveries (user_id, course_id, lesson, starts_at, next_file, next_send_at) "
+            "VALUES (7, 'femininity', 2, '2026-10-18 12:00:00', 0, '2026-10-18 12:00:00')"
+        ))
+        await session.commit()
+    monkeypatch.setattr('src.utils.scheduler.delivery_cursor', DeliveryCursor('w1', lease=300, writer=writer))
+
+
+@pytest.fixture(autouse=True)
+def lesson(courses_dir, monkeypatch):
+    monkeypatch.setattr('src.config.TEST_MODE', False)
+    monkeypatch.setattr('src.utils.scheduler.lesson_manifests', LessonManifests(courses_dir))
+    monkeypatch.setattr('src.utils.scheduler.media_cache', MagicMock(send=AsyncMock(return_value=True)))
+    queue = []
+    monkeypatch.setattr('src.utils.scheduler.lesson_queue.push', lambda *args: queue.append(args))
+    return queue
+
+
+def at(moment, monkeypatch):
+    monkeypatch.setattr('src.utils.scheduler.utc_now', lambda: moment)
+
+
+async def cursor(session_factory):
+    async with session_factory() as session:
+        return (await session.execute(text(
+            "SELECT next_file, next_send_at, lease_owner, lease_until FROM lesson_deliveries"
+        ))).one()
+
+
+@pytest.mark.asyncio
+async def test_cursor_walks_the_manifest(session_factory, lesson, monkeypatch):
+    """Сначала наступившие файлы, затем курсор ждёт задание через 15 минут 📬"""
+    bot = AsyncMock()
+
+    at(START, monkeypatch)
+    await send_lesson_files(bot, 7, 'femininity', 2)
+    assert bot.send_message.await_count == 1  # intro.txt; картинка — через media_cache
+    assert tuple(await cursor(session_factory)) == (2, '2026-10-18 12:15:00', None, None)  # аренда снята
+    assert lesson == [(START + timedelta(minutes=15), 7, 'femininity', 2)]
+
+    at(START + timedelta(minutes=16), monkeypatch)
+    await send_lesson_files(bot, 7, 'femininity', 2)
+    assert bot.send_message.await_count == 2
+    assert tuple(await cursor(session_factory)) == (3, None, None, None)
+
+
+@pytest.mark.asyncio
+async def test_repeated_delivery_does_not_resend(session_factory, monkeypatch):
+    """Повторный вызов до следующего файла ничего не отправляет 🔁"""
+    bot = AsyncMock()
+    at(START + timedelta(minutes=1), monkeypatch)
+    await send_lesson_files(bot, 7, 'femininity', 2)
+    await send_lesson_files(bot, 7, 'femininity', 2)
+
+    assert bot.send_message.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_file_keeps_cursor(session_factory, monkeypatch):
+    """Ошибка отправки — курсор стоит на месте, урок ждёт конца аренды 🧯"""
+    bot = AsyncMock()
+    bot.send_message.side_effect = RuntimeError('flood')
+    at(START, monkeypatch)
+    await send_lesson_files(bot, 7, 'femininity', 2)
+    assert tuple(await cursor(session_factory)) == (0, '2026-10-18 12:00:00', 'w1', '2026-10-18 12:05:00')
+
+    # После истечения аренды урок забирается заново и доходит с того же файла
+    bot.send_message.side_effect = None
+    at(START + timedelta(minutes=6), monkeypatch)
+    await send_lesson_files(bot, 7, 'femininity', 2)
+    assert tuple(await cursor(session_factory)) == (2, '2026-10-18 12:15:00', None, None)
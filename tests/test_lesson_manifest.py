@@ -0,0 +1,124 @@
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from src.utils.lesson_manifest import LessonManifests, file_kind
+from src.utils.media_cache import file_hash
+
+
+@pytest.fixture
+def courses_dir(courses_dir):
+    (courses_dir / 'femininity' / 'lesson2' / 'extra_1hour.mp4').write_bytes(b'fake video')
+    return courses_dir
+
+
+def test_file_kind():
+    assert file_kind('lesson1.md') == 'text'
+    assert file_kind('photo.PNG') == 'photo'
+    assert file_kind('workbook.pdf') == 'document'
+
+
+@pytest.mark.asyncio
+async def test_manifest_is_ordered_and_complete(courses_dir, monkeypatch):
+    """Манифест: файлы по задержке, с размером, хэшем и текстом 📋"""
+    monkeypatch.setattr('src.config.TEST_MODE', False)
+    manifests = LessonManifests(courses_dir)
+    manifest = await manifests.get('femininity', 2)
+
+    assert [(f.name, f.delay) for f in manifest.files] == [
+        ('intro.txt', 0), ('lesson2_1.jpeg', 0), ('task_15min.txt', 900), ('extra_1hour.mp4', 3600)
+    ]
+    intro = manifest.file('intro.txt')
+    assert intro.kind == 'text' and intro.text == 'Урок 2'
+    assert intro.size == len('Урок 2'.encode('utf-8'))
+    assert len(intro.content_hash) == 64
+    assert manifest.file('lesson2_1.jpeg').text is None
+
+
+@pytest.mark.asyncio
+async def test_manifest_is_compiled_once(courses_dir):
+    """Повторные запросы урока не трогают диск 💾"""
+    manifests = LessonManifests(courses_dir)
+    assert manifests.compile_all() == 1
+
+    with patch('os.scandir', side_effect=AssertionError('disk access')), \
+         patch('builtins.open', side_effect=AssertionError('disk access')):
+        for _ in range(3):
+            assert len((await manifests.get('femininity', 2)).files) == 4
+
+
+@pytest.mark.asyncio
+async def test_missing_lesson_is_cached(courses_dir):
+    """Несуществующий урок — None, и до следующей сверки папку не ищем 🚫"""
+    manifests = LessonManifests(courses_dir)
+    assert await manifests.get('femininity', 99) is None
+
+    with patch('os.scandir', side_effect=AssertionError('disk access')):
+        assert await manifests.get('femininity', 99) is None
+
+
+@pytest.mark.asyncio
+async def test_invalidate_picks_up_new_files(courses_dir):
+    """После правки материалов invalidate() пересобирает манифест сразу 🔄"""
+    manifests = LessonManifests(courses_dir)
+    await manifests.get('femininity', 2)
+    (courses_dir / 'femininity' / 'lesson2' / 'outro.txt').write_text('Пока!', encoding='utf-8')
+
+    assert (await manifests.get('femininity', 2)).file('outro.txt') is None
+    manifests.invalidate('femininity')
+    assert (await manifests.get('femininity', 2)).file('outro.txt').text == 'Пока!'
+
+
+@pytest.mark.asyncio
+async def test_changed_files_are_picked_up(courses_dir):
+    """Правка файла видна после сверки; хэши считаются только для изменённых ✏️"""
+    manifests = LessonManifests(courses_dir, check_interval=0)
+    before = await manifests.get('femininity', 2)
+    lesson = courses_dir / 'femininity' / 'lesson2'
+    (lesson / 'intro.txt').write_text('Привет ещё раз!', encoding='utf-8')
+
+    with patch('src.utils.lesson_manifest.file_hash', wraps=file_hash) as hashed:
+        after = await manifests.get('femininity', 2)
+
+    assert after.file('intro.txt').text == 'Привет ещё раз!'
+    assert after.file('intro.txt').content_hash != before.file('intro.txt').content_hash
+    assert after.file('extra_1hour.mp4') is before.file('extra_1hour.mp4')
+    assert hashed.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_lesson_appears_after_miss(courses_dir):
+    """Урок, которого не было при первом запросе, находится после сверки 📂"""
+    manifests = LessonManifests(courses_dir, check_interval=0)
+    assert await manifests.get('femininity', 3) is None
+
+    lesson = courses_dir / 'femininity' / 'lesson3'
+    lesson.mkdir()
+    (lesson / 'intro.txt').write_text('Урок 3', encoding='utf-8')
+    assert (await manifests.get('femininity', 3)).file('intro.txt').text == 'Урок 3'
+
+
+@pytest.mark.asyncio
+async def test_compile_all_keeps_other_entries(courses_dir):
+    """compile_all дополняет манифесты, а не подменяет словарь целиком 🧩"""
+    manifests = LessonManifests(courses_dir)
+    assert await manifests.get('femininity', 99) is None
+    manifests.compile_all()
+
+    with patch('os.scandir', side_effect=AssertionError('disk access')):
+        assert await manifests.get('femininity', 99) is None
+        assert len((await manifests.get('femininity', 2)).files) == 4
+
+
+@pytest.mark.asyncio
+async def test_offsets_come_from_manifest(courses_dir, monkeypatch):
+    """Время каждого файла — старт урока + задержка из манифеста ⏱"""
+    monkeypatch.setattr('src.config.TEST_MODE', False)
+    manifest = await LessonManifests(courses_dir).get('femininity', 2)
+    start = datetime(2026, 10, 18, 12, 0, 0)
+
+    assert manifest.send_at(start, 2) == start + timedelta(minutes=15)
+    assert manifest.send_at(start, 4) is None
+    assert manifest.due(start, 0, start) == 2
+    assert manifest.due(start, 2, start + timedelta(minutes=20)) == 3
+    assert manifest.due(start, 0, start + timedelta(days=1)) == 4
@@ -0,0 +1,81 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import text
+
+from src.utils.lesson_queue import LessonQueue, parse_db_time, utc_now
+
+
+def test_parse_db_time():
+    """Парсим время из БД в обоих форматах ⏱"""
+    assert parse_db_time('2025-04-01 10:00:00') == datetime(2025, 4, 1, 10, 0, 0)
+    assert parse_db_time('2025-04-01 10:00:00.123456') == datetime(2025, 4, 1, 10, 0, 0)
+    assert parse_db_time(datetime(2025, 4, 1, 10)) == datetime(2025, 4, 1, 10)
+    moscow = timezone(timedelta(hours=3))
+    assert parse_db_time(datetime(2025, 4, 1, 13, tzinfo=moscow)) == datetime(2025, 4, 1, 10)  # в UTC
+    assert parse_db_time(None) is None
+    assert parse_db_time('не время') is None
+
+
+def test_push_and_pop_in_due_order():
+    """Куча отдаёт уроки по возрастанию дедлайна, без дублей 📚"""
+    queue = LessonQueue()
+    now = datetime(2025, 4, 1, 12, 0, 0)
+
+    assert queue.push(now - timedelta(minutes=1), 2, 'femininity', 3)
+    assert queue.push(now - timedelta(minutes=5), 1, 'femininity', 2)
+    assert queue.push(now + timedelta(minutes=5), 3, 'femininity', 2)
+    assert not queue.push(now - timedelta(minutes=5), 1, 'femininity', 2)  # дубликат
+    assert len(queue) == 3
+
+    assert queue.pop_due(now) == [(1, 'femininity', 2), (2, 'femininity', 3)]
+    assert queue.next_due() == now + timedelta(minutes=5)
+    assert queue.pop_due(now) == []
+
+
+def test_pop_due_merges_same_lesson():
+    """Несколько файлов одного урока с прошедшим временем — одна доставка"""
+    queue = LessonQueue()
+    now = datetime(2025, 4, 1, 12, 0, 0)
+    queue.push(now - timedelta(seconds=30), 1, 'femininity', 2)
+    queue.push(now - timedelta(seconds=10), 1, 'femininity', 2)
+
+    assert queue.pop_due(now) == [(1, 'femininity', 2)]
+    assert len(queue) == 0
+
+
+@pytest.mark.asyncio
+async def test_load_from_db(session_factory):
+    """При старте дедлайны подтягиваются из lesson_deliveries настоящим запросом 🗄"""
+    async with session_factory() as session:
+        await session.execute(text(
+            "INSERT INTO lesson_deliveries (user_id, course_id, lesson, starts_at, next_file, next_send_at, lease_until) "
+            "VALUES (1, 'femininity', 2, '2025-04-01 10:00:00', 0, '2025-04-01 10:00:00', NULL), "
+            "       (2, 'femininity', 3, '2025-04-01 09:00:00', 1, '2025-04-01 09:15:00', '2025-04-01 09:20:00'), "
+            "       (3, 'femininity', 5, '2025-03-01 10:00:00', 3, NULL, NULL)"  # урок уже доставлен
+        ))
+        await session.commit()
+
+    queue = LessonQueue()
+    assert await queue.load() == 2
+    assert queue.pop_due(datetime(2025, 4, 1, 9, 19)) == []  # чужая аренда ещё не истекла
+    assert queue.pop_due(datetime(2025, 4, 1, 10, 0)) == [(2, 'femininity', 3), (1, 'femininity', 2)]
+    assert await queue.load(horizon=datetime(2025, 4, 1, 9, 30)) == 1  # дальше горизонта не грузим
+
+
+@pytest.mark.asyncio
+async def test_run_wakes_up_on_push():
+    """Новый дедлайн будит спящий цикл, а не ждёт ресинка 🚀"""
+    queue = LessonQueue(resync_interval=3600)
+    delivered = asyncio.Queue()
+
+    async def deliver(user_id, course_id, lesson):
+        await delivered.put((user_id, course_id, lesson))
+
+    task = asyncio.create_task(queue.run(deliver))
+    try:
+        await asyncio.sleep(0.01)
+        queue.push(utc_now() + timedelta(milliseconds=50), 42, 'femininity', 2)
+        assert await asyncio.wait_for(delivered.get(), 1) == (42, 'femininity', 2)
+    finally:
+        task.cancel()
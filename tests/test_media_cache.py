@@ -0,0 +1,286 @@
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy import select
+
+from src.utils.models import MediaCache as MediaCacheModel
+from src.utils.media_cache import MediaCache, group_media, media_type
+
+
+@pytest.fixture
+def lesson_dir(courses_dir):
+    return courses_dir / 'femininity' / 'lesson2'
+
+
+def make_bot():
+    bot = AsyncMock()
+    photo = MagicMock(file_id='AgAD-uploaded')
+    bot.send_photo.return_value = MagicMock(photo=[MagicMock(file_id='small'), photo])
+    return bot
+
+
+def test_media_type():
+    assert media_type('lesson2_1.JPEG') == 'photo'
+    assert media_type('intro.mp4') == 'video'
+    assert media_type('lesson2_3.mp3') == 'audio'
+    assert media_type('intro.txt') is None
+
+
+@pytest.mark.asyncio
+async def test_uploads_once_then_reuses_file_id(session_factory, writer, lesson_dir, tmp_path):
+    """Файл загружается один раз, дальше уходит по file_id 📸"""
+    cache = MediaCache(session_factory, courses_dir=tmp_path / 'courses', writer=writer)
+    bot = make_bot()
+    path = lesson_dir / 'lesson2_1.jpeg'
+
+    await cache.send(bot, 1, path)
+    await cache.send(bot, 2, path)
+
+    first, second = bot.send_photo.await_args_list
+    assert first.kwargs['photo'].__class__.__name__ == 'FSInputFile'
+    assert second.kwargs['photo'] == 'AgAD-uploaded'
+    bot.get_file.assert_not_awaited()  # без лишнего round trip на каждый хит
+
+
+@pytest.mark.asyncio
+async def test_cache_survives_restart(session_factory, writer, lesson_dir, tmp_path):
+    """После рестарта file_id берётся из таблицы media_cache 🗄"""
+    path = lesson_dir / 'lesson2_1.jpeg'
+    cache = MediaCache(session_factory, courses_dir=tmp_path / 'courses', writer=writer)
+    await cache.store(path, 'AgAD-old')
+    assert await cache.flush() == 1
+
+    fresh = MediaCache(session_factory, courses_dir=tmp_path / 'courses', writer=writer)
+    assert await fresh.load() == 1
+    assert await fresh.get_cached_id(path) == 'AgAD-old'
+    assert fresh.relative_path(path) == 'femininity/lesson2/lesson2_1.jpeg'
+
+
+@pytest.mark.asyncio
+async def test_other_worker_reads_id_instead_of_uploading(session_factory, writer, lesson_dir, tmp_path):
+    """Файл, прогретый поллером после нашего load(), берём из БД, а не грузим заново 🤝"""
+    path = lesson_dir / 'lesson2_1.jpeg'
+    worker = MediaCache(session_factory, courses_dir=tmp_path / 'courses', writer=writer)
+    assert await worker.load() == 0
+
+    poller = MediaCache(session_factory, courses_dir=tmp_path / 'courses', writer=writer)
+    await poller.store(path, 'AgAD-warm')
+    await poller.flush()
+
+    bot = make_bot()
+    await worker.send(bot, 1, path)
+    assert bot.send_photo.await_args.kwargs['photo'] == 'AgAD-warm'
+
+
+@pytest.mark.asyncio
+async def test_store_is_batched(session_factory, writer, lesson_dir, tmp_path):
+    """Новые file_id копятся в памяти и пишутся одной пачкой 📦"""
+    (lesson_dir / 'lesson2_2.png').write_bytes(b'another picture')
+    cache = MediaCache(session_factory, courses_dir=tmp_path / 'courses', writer=writer)
+    await cache.store(lesson_dir / 'lesson2_1.jpeg', 'AgAD-1')
+    await cache.store(lesson_dir / 'lesson2_2.png', 'AgAD-2')
+    await cache.store(lesson_dir / 'lesson2_2.png', 'AgAD-2b')  # перезапись до flush
+
+    async with session_factory() as session:
+        assert (await session.execute(select(MediaCacheModel))).first() is None
+
+    assert await cache.flush() == 2
+    assert await cache.flush() == 0
+    async with session_factory() as session:
+        rows = (await session.execute(select(MediaCacheModel))).scalars().all()
+    assert sorted(row.file_id for row in rows) == ['AgAD-1', 'AgAD-2b']
+
+
+@pytest.mark.asyncio
+async def test_changed_content_is_uploaded_again(session_factory, writer, lesson_dir, tmp_path):
+    """Заменили картинку — хэш другой, кэш не используется 🔄"""
+    cache = MediaCache(session_factory, courses_dir=tmp_path / 'courses', writer=writer)
+    path = lesson_dir / 'lesson2_1.jpeg'
+    await cache.store(path, 'AgAD-old')
+
+    path.write_bytes(b'new picture, different size')
+    assert await cache.get_cached_id(path) is None
+
+
+@pytest.mark.asyncio
+async def test_warm_up_uploads_only_missing(session_factory, writer, lesson_dir, tmp_path):
+    """Прогрев грузит только то, чего нет в кэше 🔥"""
+    (lesson_dir / 'lesson2_2.png').write_bytes(b'another picture')
+    (lesson_dir / 'intro.txt').write_text('текст не грузим', encoding='utf-8')
+    cache = MediaCache(session_factory, courses_dir=tmp_path / 'courses', writer=writer)
+    await cache.store(lesson_dir / 'lesson2_1.jpeg', 'AgAD-old')
+    bot = make_bot()
+
+    stats = await cache.warm_up(bot, concurrency=2, chat_id=-100)
+
+    assert stats == {'cached': 1, 'uploaded': 1, 'failed': 0}
+    bot.send_photo.assert_awaited_once()
+    assert bot.send_photo.await_args.args[0] == -100
+
+
+@pytest.mark.asyncio
+async def test_concurrent_sends_upload_once(session_factory, writer, lesson_dir, tmp_path):
+    """Два ученика одновременно — одна загрузка, второй получает file_id 👯"""
+    cache = MediaCache(session_factory, courses_dir=tmp_path / 'courses', writer=writer)
+    bot = make_bot()
+    upload_started = asyncio.Event()
+    release = asyncio.Event()
+    uploaded = bot.send_photo.return_value
+
+    async def slow_send_photo(chat_id, photo, **kwargs):
+        if not isinstance(photo, str):
+            upload_started.set()
+            await release.wait()
+        return uploaded
+
+    bot.send_photo.side_effect = slow_send_photo
+    path = lesson_dir / 'lesson2_1.jpeg'
+
+    first = asyncio.create_task(cache.send(bot, 1, path))
+    await upload_started.wait()
+    second = asyncio.create_task(cache.send(bot, 2, path))
+    await asyncio.sleep(0.01)
+    release.set()
+    await asyncio.gather(first, second)
+
+    photos = [call.kwargs['photo'] for call in bot.send_photo.await_args_list]
+    assert sum(not isinstance(p, str) for p in photos) == 1
+    assert 'AgAD-uploaded' in photos
+
+
+@pytest.mark.asyncio
+async def test_rejected_file_id_is_reuploaded(session_factory, writer, lesson_dir, tmp_path):
+    """Telegram отверг file_id — перезагружаем и обновляем кэш ♻️"""
+    cache = MediaCache(session_factory, courses_dir=tmp_path / 'courses', writer=writer)
+    path = lesson_dir / 'lesson2_1.jpeg'
+    await cache.store(path, 'AgAD-stale')
+    bot = make_bot()
+    uploaded = bot.send_photo.return_value
+    bot.send_photo.side_effect = [
+        TelegramBadRequest(MagicMock(), "Bad Request: wrong file identifier/HTTP URL specified"),
+        uploaded,
+    ]
+
+    assert await cache.send(bot, 1, path) is uploaded
+    assert await cache.get_cached_id(path) == 'AgAD-uploaded'
+
+
+@pytest.mark.asyncio
+async def test_reverify_refreshes_and_drops_entries(session_factory, writer, lesson_dir, tmp_path):
+    """Фоновая перепроверка обновляет verified_at и выкидывает протухшие id 🕵️"""
+    (lesson_dir / 'lesson2_2.png').write_bytes(b'another picture')
+    cache = MediaCache(session_factory, courses_dir=tmp_path / 'courses', writer=writer)
+    await cache.store(lesson_dir / 'lesson2_1.jpeg', 'AgAD-good')
+    await cache.store(lesson_dir / 'lesson2_2.png', 'AgAD-bad')
+    await cache.flush()
+
+    async with session_factory() as session:
+        for row in (await session.execute(select(MediaCacheModel))).scalars():
+            row.verified_at = datetime.now() - timedelta(days=30)
+        await session.commit()
+
+    async def get_file(file_id):
+        if file_id == 'AgAD-bad':
+            raise TelegramBadRequest(MagicMock(), "Bad Request: wrong file identifier")
+
+    bot = AsyncMock()
+    bot.get_file.side_effect = get_file
+
+    assert await cache.reverify(bot, max_age=3600) == {'valid': 1, 'invalid': 1, 'failed': 0}
+    assert await cache.get_cached_id(lesson_dir / 'lesson2_2.png') is None
+    assert await cache.reverify(bot, max_age=3600) == {'valid': 0, 'invalid': 0, 'failed': 0}
+
+
+@pytest.mark.asyncio
+async def test_reverify_keeps_no_session_open_during_get_file(session_factory, writer, lesson_dir, tmp_path):
+    """Пока ждём Telegram, транзакция не висит открытой 🔓"""
+    open_sessions = 0
+
+    class CountingFactory:
+        def __call__(self):
+            return self
+
+        async def __aenter__(self):
+            nonlocal open_sessions
+            open_sessions += 1
+            self.session = session_factory()
+            return await self.session.__aenter__()
+
+        async def __aexit__(self, *exc):
+            nonlocal open_sessions
+            open_sessions -= 1
+            return await self.session.__aexit__(*exc)
+
+    cache = MediaCache(CountingFactory(), courses_dir=tmp_path / 'courses', writer=writer)
+    await cache.store(lesson_dir / 'lesson2_1.jpeg', 'AgAD-good')
+    await cache.flush()
+
+    seen = []
+
+    async def get_file(file_id):
+        seen.append(open_sessions)
+
+    bot = AsyncMock()
+    bot.get_file.side_effect = get_file
+
+    assert await cache.reverify(bot, max_age=-1) == {'valid': 1, 'invalid': 0, 'failed': 0}
+    assert seen == [0]
+
+
+def test_group_media_keeps_order():
+    """Подряд идущие фото/видео — в альбом, текст разрывает группу 🖼"""
+    files = ['intro.txt', 'a.jpg', 'b.png', 'c.mp4', 'task.txt', 'd.jpg', 'e.mp3', 'f.jpg']
+    assert group_media(files) == [
+        ['intro.txt'], ['a.jpg', 'b.png', 'c.mp4'], ['task.txt'], ['d.jpg'], ['e.mp3'], ['f.jpg']
+    ]
+
+
+def test_group_media_respects_limit_and_key():
+    """Не больше 10 в альбоме и только с одним временем отправки ⏱"""
+    photos = [(f'{i}.jpg', 0) for i in range(12)] + [('late.jpg', 60)]
+    batches = group_media(photos, path=lambda p: p[0], key=lambda p: p[1])
+    assert [len(b) for b in batches] == [10, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_send_group_mixes_cached_and_new(session_factory, writer, lesson_dir, tmp_path):
+    """Альбом: кэшированные по file_id, новые загружаются и попадают в кэш 📚"""
+    (lesson_dir / 'lesson2_2.png').write_bytes(b'another picture')
+    cache = MediaCache(session_factory, courses_dir=tmp_path / 'courses', writer=writer)
+    first, second = lesson_dir / 'lesson2_1.jpeg', lesson_dir / 'lesson2_2.png'
+    await cache.store(first, 'AgAD-cached')
+    bot = AsyncMock()
+    bot.send_media_group.return_value = [
+        MagicMock(photo=[MagicMock(file_id='AgAD-cached')]),
+        MagicMock(photo=[MagicMock(file_id='AgAD-new')]),
+    ]
+
+    await cache.send_group(bot, 1, [first, second], caption='Урок 2')
+
+    bot.send_media_group.assert_awaited_once()
+    media = bot.send_media_group.await_args.kwargs['media']
+    assert media[0].media == 'AgAD-cached' and media[0].caption == 'Урок 2'
+    assert media[1].media.__class__.__name__ == 'FSInputFile' and media[1].caption is None
+    assert await cache.get_cached_id(second) == 'AgAD-new'
+
+
+@pytest.mark.asyncio
+async def test_send_group_reuploads_rejected_ids(session_factory, writer, lesson_dir, tmp_path):
+    """Telegram отверг file_id в альбоме — шлём альбом заново файлами ♻️"""
+    (lesson_dir / 'lesson2_2.png').write_bytes(b'another picture')
+    cache = MediaCache(session_factory, courses_dir=tmp_path / 'courses', writer=writer)
+    paths = [lesson_dir / 'lesson2_1.jpeg', lesson_dir / 'lesson2_2.png']
+    await cache.store(paths[0], 'AgAD-stale')
+    bot = AsyncMock()
+    bot.send_media_group.side_effect = [
+        TelegramBadRequest(MagicMock(), "Bad Request: wrong file identifier/HTTP URL specified"),
+        [MagicMock(photo=[MagicMock(file_id='AgAD-1')]), MagicMock(photo=[MagicMock(file_id='AgAD-2')])],
+    ]
+
+    await cache.send_group(bot, 1, paths)
+
+    retry_media = bot.send_media_group.await_args.kwargs['media']
+    assert all(m.media.__class__.__name__ == 'FSInputFile' for m in retry_media)
+    assert [await cache.get_cached_id(p) for p in paths] == ['AgAD-1', 'AgAD-2']
@@ -0,0 +1,65 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.services.approval import APPROVE_HOMEWORK
+from src.utils.lesson_queue import LOAD_DEADLINES
+from src.utils.models import Base, Homework, User
+from src.utils.delivery_cursor import ADVANCE_DELIVERY, CLAIM_DELIVERY
+
+LESSON = {'user_id': 7, 'course_id': 'femininity', 'lesson': 2, 'now': '2026-10-18 12:00:00'}
+
+
+@pytest_asyncio.fixture
+async def conn():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        yield conn
+    await engine.dispose()
+
+
+async def query_plan(conn, statement, params=None) -> str:
+    """EXPLAIN QUERY PLAN одной строкой (для ORM-запросов параметры подставляются как есть)"""
+    if not hasattr(statement, 'text'):
+        compiled = statement.compile(dialect=conn.dialect)
+        sql, args = str(compiled), tuple(compiled.params.values())
+        rows = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", args)
+    else:
+        explain = text(f"EXPLAIN QUERY PLAN {statement.text}").bindparams(*statement._bindparams.values())
+        rows = await conn.execute(explain, params or {})
+    return ' | '.join(row[-1] for row in rows.all())
+
+
+@pytest.mark.asyncio
+async def test_scheduler_load_reads_only_unsent_rows(conn):
+    """Загрузка дедлайнов идёт по частичным индексам, без скана истории 🗓"""
+    plan = await query_plan(conn, LOAD_DEADLINES, {'shards': 4, 'owned': [0, 2], 'horizon': LESSON['now']})
+    assert 'USING INDEX ix_lesson_deliveries_due' in plan
+    assert 'SCAN lesson_deliveries' not in plan
+
+
+@pytest.mark.asyncio
+async def test_claim_and_advance_are_index_seeks(conn):
+    """Аренда урока и сдвиг курсора — поиск по ключу, а не скан 🔎"""
+    lease = {**LESSON, 'owner': 'w1', 'lease_until': None}
+    cursor = {**lease, 'cursor': 0, 'next_file': 1, 'next_send_at': None, 'lease_owner': None}
+    assert 'SEARCH lesson_deliveries USING INDEX sqlite_autoindex_lesson_deliveries_1' in await query_plan(conn, CLAIM_DELIVERY, lease)
+    assert 'SEARCH lesson_deliveries USING INDEX sqlite_autoindex_lesson_deliveries_1' in await query_plan(conn, ADVANCE_DELIVERY, cursor)
+    approve = await query_plan(conn, APPROVE_HOMEWORK, {**LESSON, 'next_lesson_at': None, 'admin_id': 1})
+    assert 'SEARCH homeworks USING INDEX ix_homeworks_user_lesson' in approve
+
+
+@pytest.mark.asyncio
+async def test_review_queue_uses_pending_index(conn):
+    """Очередь на проверку читает только pending и уже в нужном порядке 📋"""
+    query = (
+        select(Homework)
+        .join(User, Homework.user_id == User.user_id)
+        .where(Homework.status == 'pending')
+        .order_by(Homework.submission_time)
+    )
+    plan = await query_plan(conn, query)
+    assert 'USING INDEX ix_homeworks_pending' in plan
+    assert 'TEMP B-TREE' not in plan
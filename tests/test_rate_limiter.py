@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from src.utils.rate_limiter import (
+    RateLimiter, TokenBucket, bulk_lane, PRIORITY_BULK, PRIORITY_INTERACTIVE
+)
+
+
+def test_token_bucket_reserve():
+    """Ведро отдаёт burst сразу, дальше — по скорости 🪣"""
+    bucket = TokenBucket(rate=10, capacity=2)
+    now = bucket.updated
+    assert bucket.reserve(now) == 0
+    assert bucket.reserve(now) == 0
+    assert bucket.reserve(now) == pytest.approx(0.1)
+    assert bucket.delay(now + 0.25) == 0
+
+
+@pytest.mark.asyncio
+async def test_per_chat_limit_delays_second_message():
+    """Второе сообщение в тот же чат придерживается, в другой — нет 💬"""
+    limiter = RateLimiter(global_rate=1000, chat_rate=20, chat_burst=1)
+    assert await limiter.acquire(1) < 0.01
+    assert await limiter.acquire(2) < 0.01
+    assert await limiter.acquire(1) >= 0.04
+
+    stats = limiter.stats()['lanes']['interactive']
+    assert stats['requests'] == 3
+    assert stats['delayed'] == 1
+    assert stats['wait_max'] >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_interactive_lane_overtakes_bulk():
+    """Ответ пользователю получает токен раньше рассылки урока 🏎"""
+    limiter = RateLimiter(global_rate=20, chat_rate=1000, chat_burst=1000)
+    limiter._global.tokens = 0  # общий лимит исчерпан
+    order = []
+
+    async def send(name, priority):
+        await limiter.acquire(priority=priority)
+        order.append(name)
+
+    bulk = [asyncio.create_task(send(f"bulk{i}", PRIORITY_BULK)) for i in range(3)]
+    await asyncio.sleep(0)
+    reply = asyncio.create_task(send("reply", PRIORITY_INTERACTIVE))
+    await asyncio.gather(*bulk, reply)
+
+    assert order[0] == "reply"
+
+
+@pytest.mark.asyncio
+async def test_middleware_uses_context_lane():
+    """Middleware берёт chat_id из метода и полосу из контекста 🛣"""
+    limiter = RateLimiter(global_rate=1000, chat_rate=1000, chat_burst=10)
+    make_request = AsyncMock(return_value="ok")
+    method = MagicMock(chat_id=42)
+
+    with bulk_lane():
+        assert await limiter(make_request, MagicMock(), method) == "ok"
+
+    make_request.assert_awaited_once()
+    assert limiter.stats()['lanes']['bulk']['requests'] == 1
+    assert limiter.stats()['lanes']['interactive']['requests'] == 0
+
+
+def test_limits_are_split_between_workers():
+    """Лимиты бота делятся между процессами: N воркеров не шлют N×30 в секунду ⚖️"""
+    limiter = RateLimiter(global_rate=30, chat_rate=1, chat_burst=3, group_rate=0.5)
+    private, group = limiter._chat_bucket(1), limiter._chat_bucket(-100)
+
+    limiter.set_workers(3)
+    assert limiter._global.rate == pytest.approx(10) and limiter._global.capacity == pytest.approx(10)
+    assert private.rate == pytest.approx(1 / 3) and private.capacity == pytest.approx(1)
+    assert group.rate == pytest.approx(0.5 / 3)
+    assert limiter._chat_bucket(2).rate == pytest.approx(1 / 3)  # новые чаты — сразу с долей
+    assert limiter.stats()['workers'] == 3
+
+    limiter.set_workers(1)  # остались одни — забираем весь лимит обратно
+    assert limiter._global.rate == pytest.approx(30)
+    assert private.rate == pytest.approx(1) and private.capacity == pytest.approx(3)
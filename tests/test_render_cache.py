@@ -0,0 +1,78 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+from src.utils.lesson_manifest import LessonManifests
+
+from src.utils.render_cache import RenderCache, MODE_PLAIN, MODE_MARKDOWN, MODE_MARKDOWN_V2
+from src.utils.text_processor import process_markdown, process_markdown_simple
+
+LESSON = '<b>Урок 1</b>\n\n\n— Дыхание. Шаг 1!'
+
+
+def test_render_matches_processors():
+    """Кэш отдаёт ровно то, что сделал бы рендерер 🎨"""
+    cache = RenderCache()
+    assert cache.render(LESSON, MODE_MARKDOWN) == process_markdown_simple(LESSON)
+    assert cache.render(LESSON, MODE_MARKDOWN_V2) == process_markdown(LESSON)
+    assert cache.render(LESSON, MODE_PLAIN) == LESSON
+
+
+def test_repeat_render_is_memory_read():
+    """Повторная отправка урока не рендерит текст заново ♻️"""
+    cache = RenderCache()
+    first = cache.render(LESSON, MODE_MARKDOWN, content_hash='abc')
+
+    renderer = MagicMock(side_effect=AssertionError('rendered twice'))
+    with patch.dict('src.utils.render_cache.RENDERERS', {MODE_MARKDOWN: renderer}):
+        assert cache.render(LESSON, MODE_MARKDOWN, content_hash='abc') is first
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_changed_content_is_rendered_again():
+    """Файл изменился — новый хэш, новый рендер 🔄"""
+    cache = RenderCache()
+    cache.render('*старый*', MODE_MARKDOWN_V2)
+    assert cache.render('*новый*', MODE_MARKDOWN_V2) == process_markdown('*новый*')
+    assert cache.stats()['misses'] == 2
+
+
+def test_lru_eviction_bounds_memory():
+    """Память ограничена: самые старые записи вытесняются 🧹"""
+    cache = RenderCache(max_chars=10)
+    cache.render('aaaa', MODE_MARKDOWN, content_hash='a')
+    cache.render('bbbb', MODE_MARKDOWN, content_hash='b')
+    cache.render('aaaa', MODE_MARKDOWN, content_hash='a')  # a теперь свежее b
+    cache.render('cccc', MODE_MARKDOWN, content_hash='c')
+
+    assert cache.stats()['entries'] == 2
+    assert cache.stats()['chars'] <= 10
+    cache.render('aaaa', MODE_MARKDOWN, content_hash='a')
+    assert cache.stats()['hits'] == 2  # a пережило вытеснение, b — нет
+
+
+def test_entities_are_cached_per_content_hash():
+    """Скомпилированные entities тоже берутся из кэша 🧩"""
+    cache = RenderCache()
+    first = cache.render_messages('*Урок*', content_hash='h1')
+
+    assert first[0][0] == 'Урок'
+    assert cache.render_messages('*Урок*', content_hash='h1') is first
+    assert cache.stats()['chars'] == len('Урок')
+
+
+@pytest.mark.asyncio
+async def test_edited_lesson_file_is_rendered_again(tmp_path):
+    """Поправили .md — после сверки манифеста уходит новый текст ✏️"""
+    lesson = tmp_path / 'femininity' / 'lesson1'
+    lesson.mkdir(parents=True)
+    (lesson / 'intro.md').write_text('*Старый* текст', encoding='utf-8')
+    manifests = LessonManifests(tmp_path, check_interval=0)
+    cache = RenderCache()
+
+    def render(manifest):
+        intro = manifest.file('intro.md')
+        return cache.render_messages(intro.text, intro.content_hash)[0][0]
+
+    assert render(await manifests.get('femininity', 1)) == 'Старый текст'
+    (lesson / 'intro.md').write_text('*Новый* текст!', encoding='utf-8')
+    assert render(await manifests.get('femininity', 1)) == 'Новый текст!'
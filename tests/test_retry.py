@@ -0,0 +1,127 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from aiogram.exceptions import (
+    TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+)
+from aiogram.methods import GetFile, GetUpdates, SendMessage
+
+from src.utils.retry import RetryPolicy, classify_error, PERMANENT, TRANSIENT, RETRY_AFTER
+
+METHOD = SendMessage(chat_id=42, text="привет")
+SAFE_METHOD = GetFile(file_id="abc")
+
+
+def make_policy(**kwargs):
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+
+    kwargs.setdefault('budget_per_second', 100)
+    return RetryPolicy(sleep=fake_sleep, **kwargs), sleeps
+
+
+def test_classify_error():
+    """Разбираем ошибки Telegram по типам 🏷"""
+    assert classify_error(TelegramRetryAfter(METHOD, "flood", 3)) == RETRY_AFTER
+    assert classify_error(TelegramNetworkError(SAFE_METHOD, "timeout")) == TRANSIENT
+    assert classify_error(TelegramNetworkError(METHOD, "timeout")) == PERMANENT
+    assert classify_error(TelegramForbiddenError(METHOD, "bot was blocked by the user")) == PERMANENT
+    assert classify_error(ValueError("bug")) == PERMANENT
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_honored():
+    """Ждём ровно столько, сколько попросил Telegram ⏳"""
+    policy, sleeps = make_policy()
+    func = AsyncMock(side_effect=[TelegramRetryAfter(METHOD, "flood", 7), "ok"])
+
+    assert await policy.call(func) == "ok"
+    assert sleeps == [7.0]
+    assert policy.stats()['TelegramRetryAfter']['retried'] == 1
+
+
+@pytest.mark.asyncio
+async def test_network_errors_back_off_then_give_up():
+    """Сетевые ошибки: backoff с jitter, потом сдаёмся 📉"""
+    policy, sleeps = make_policy(max_attempts=3, base_delay=1, max_delay=10)
+    func = AsyncMock(side_effect=TelegramNetworkError(SAFE_METHOD, "timeout"))
+
+    with pytest.raises(TelegramNetworkError):
+        await policy.call(func)
+
+    assert func.await_count == 3
+    assert len(sleeps) == 2
+    assert 0 <= sleeps[0] <= 1 and 0 <= sleeps[1] <= 2
+    assert policy.stats()['TelegramNetworkError'] == {'retried': 2, 'gave_up': 1, 'permanent': 0}
+
+
+@pytest.mark.asyncio
+async def test_permanent_error_is_not_retried():
+    """Бот заблокирован — повторять бессмысленно 🚫"""
+    policy, sleeps = make_policy()
+    func = AsyncMock(side_effect=TelegramForbiddenError(METHOD, "bot was blocked by the user"))
+
+    with pytest.raises(TelegramForbiddenError):
+        await policy.call(func)
+
+    assert func.await_count == 1
+    assert sleeps == []
+    assert policy.stats()['TelegramForbiddenError']['permanent'] == 1
+
+
+@pytest.mark.asyncio
+async def test_budget_stops_retry_storm():
+    """Исчерпан бюджет повторов — не добиваем API во время инцидента 🧯"""
+    policy, sleeps = make_policy(budget_per_second=0.1)
+    policy._budget.tokens = 0
+    func = AsyncMock(side_effect=TelegramNetworkError(SAFE_METHOD, "timeout"))
+
+    with pytest.raises(TelegramNetworkError):
+        await policy.call(func)
+
+    assert func.await_count == 1
+    assert policy.stats()['TelegramNetworkError']['gave_up'] == 1
+
+
+@pytest.mark.asyncio
+async def test_middleware_does_not_nest_retries():
+    """Внутри call() middleware не повторяет запрос второй раз 🪆"""
+    policy, sleeps = make_policy(max_attempts=2)
+    make_request = AsyncMock(side_effect=TelegramNetworkError(SAFE_METHOD, "timeout"))
+
+    async def send():
+        return await policy(make_request, MagicMock(), SAFE_METHOD)
+
+    with pytest.raises(TelegramNetworkError):
+        await policy.call(send)
+
+    assert make_request.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_ambiguous_send_is_not_repeated():
+    """Сеть упала на отправке — сообщение могло уйти, второй раз не шлём 📨"""
+    policy, sleeps = make_policy()
+    func = AsyncMock(side_effect=TelegramNetworkError(METHOD, "timeout"))
+
+    with pytest.raises(TelegramNetworkError):
+        await policy.call(func)
+
+    assert func.await_count == 1
+    assert sleeps == []
+
+
+@pytest.mark.asyncio
+async def test_get_updates_is_passed_through():
+    """У поллинга свой backoff, middleware его не трогает 🔁"""
+    policy, sleeps = make_policy()
+    method = GetUpdates()
+    make_request = AsyncMock(side_effect=TelegramRetryAfter(method, "flood", 1))
+
+    with pytest.raises(TelegramRetryAfter):
+        await policy(make_request, MagicMock(), method)
+
+    assert make_request.await_count == 1
+    assert sleeps == []
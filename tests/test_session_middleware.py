@@ -0,0 +1,105 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.utils.engine import create_engine
+from src.utils.models import Base, User, UserCourse
+from src.utils.requests import add_user, register_user
+from src.utils.session import DbSessionMiddleware, current_session, session_scope
+from src.utils.write_queue import WriteQueue
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    engine = create_engine(f"sqlite+aiosqlite:///{tmp_path / 'update.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def factory(engine, monkeypatch):
+    factory = async_sessionmaker(engine, expire_on_commit=False)
+    monkeypatch.setattr('src.utils.session.AsyncSessionFactory', factory)
+    return factory
+
+
+def count_checkouts(engine) -> list:
+    checkouts = []
+    event.listen(engine.sync_engine, 'checkout', lambda *args: checkouts.append(1))
+    return checkouts
+
+
+async def fetch_users(factory) -> list:
+    async with factory() as session:
+        return (await session.execute(select(User.user_id))).scalars().all()
+
+
+@pytest.mark.asyncio
+async def test_one_session_and_commit_per_update(engine, factory):
+    """Хендлер и утилиты работают в одной сессии, commit — один в конце 🔗"""
+    middleware = DbSessionMiddleware(factory)
+    checkouts = count_checkouts(engine)
+
+    async def handler(event, data):
+        session = data['session']
+        assert await add_user(session, 7, 'Аня', 'femininity')
+        async with session_scope() as inner:
+            assert inner is session  # утилита получила сессию апдейта
+            assert await inner.scalar(select(UserCourse.course_id)) == 'femininity'
+        return 'ok'
+
+    assert await middleware(handler, object(), {}) == 'ok'
+    assert middleware.stats() == {'updates': 1, 'commits': 1, 'rollbacks': 0}
+    assert len(checkouts) == 1
+    assert current_session.get() is None
+    assert await fetch_users(factory) == [7]
+
+
+@pytest.mark.asyncio
+async def test_failed_update_rolls_back(factory):
+    """Исключение в хендлере — rollback всего апдейта 🧯"""
+    middleware = DbSessionMiddleware(factory)
+
+    async def handler(event, data):
+        await add_user(data['session'], 7, 'Аня')
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        await middleware(handler, object(), {})
+    assert middleware.stats()['rollbacks'] == 1
+    assert await fetch_users(factory) == []
+
+
+@pytest.mark.asyncio
+async def test_scope_outside_update_commits_itself(factory):
+    """Вне апдейта (планировщик) session_scope открывает свою сессию и коммитит 🗓"""
+    async with session_scope() as session:
+        await session.execute(text("INSERT INTO users (user_id, name) VALUES (8, 'Оля')"))
+    assert await fetch_users(factory) == [8]
+
+
+@pytest.mark.asyncio
+async def test_writer_commits_before_update_ends(engine, factory, monkeypatch):
+    """Запись из хендлера идёт через писателя и видна сразу: блокировка не ждёт конца апдейта 🔓"""
+    writer = WriteQueue(engine)
+    monkeypatch.setattr('src.utils.requests.write_queue', writer)
+    middleware = DbSessionMiddleware(factory)
+
+    async def handler(event, data):
+        assert await register_user(7, 'Аня', 'femininity')
+        # Здесь хендлер ждал бы Telegram — а запись уже закоммичена
+        assert await fetch_users(factory) == [7]
+        async with factory() as other:
+            await other.execute(text("INSERT INTO users (user_id, name) VALUES (8, 'Оля')"))
+            await other.commit()
+        return 'ok'
+
+    assert await middleware(handler, object(), {}) == 'ok'
+    await writer.stop()
+    assert current_session.get() is None
+    assert await fetch_users(factory) == [7, 8]
+    async with factory() as session:
+        assert await session.scalar(select(UserCourse.course_id)) == 'femininity'
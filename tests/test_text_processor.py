@@ -1,5 +1,11 @@
+import random
+import re
+from pathlib import Path
+
 import pytest
-from src.utils.text_processor import process_markdown_simple, process_markdown, format_datetime
+from src.utils.text_processor import (
+    process_markdown_simple, process_markdown, format_datetime, render_entities, utf16_len
+)
 from datetime import datetime
 
 def test_process_markdown_simple():
@@ -35,4 +41,91 @@ def test_process_markdown():
 def test_format_datetime():
     """Тестируем форматирование даты 📅"""
     dt = datetime(2024, 3, 14, 15, 9, 26)
-    assert format_datetime(dt) == "14.03.2024 15:09"
\ No newline at end of file
+    assert format_datetime(dt) == "14.03.2024 15:09"
+
+def _legacy_process_markdown(text: str) -> str:
+    """Прежняя реализация MarkdownV2 — эталон для проверки байт-в-байт"""
+    markdown_pairs = [('*', '※'), ('_', '¤'), ('~', '±'), ('__', '§')]
+    for md, temp in markdown_pairs:
+        for match in reversed(list(re.finditer(f'\\{md}(.*?)\\{md}', text))):
+            text = text[:match.start()] + temp + match.group(1) + temp + text[match.end():]
+    for char in r'_*[]()~`>#+-=|{}.!':
+        text = text.replace(char, f'\\{char}')
+    for md, temp in markdown_pairs:
+        text = text.replace(temp, md)
+    text = re.sub(r'(?m)^[-—•]\s', '\\- ', text)
+    text = re.sub(r'(?m)^(\d+)\.', r'\1\.', text)
+    return text.strip()
+
+
+def _legacy_process_markdown_simple(text: str) -> str:
+    for old, new in [('<p>', ''), ('</p>', '\n'), ('<br />', '\n'), ('<br>', '\n'),
+                     ('<b>', '*'), ('</b>', '*'), ('<strong>', '*'), ('</strong>', '*'),
+                     ('<i>', '_'), ('</i>', '_'), ('<em>', '_'), ('</em>', '_')]:
+        text = text.replace(old, new)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.replace('—', '-').strip()
+
+
+def test_renderers_match_legacy_output():
+    """Новый рендерер выдаёт байт-в-байт то же, что и старый 🔬"""
+    alphabet = list('аб *_~\n\r\t.!-—•1[]()※¤±§<>/\\') + ['<p>', '</p>', '<b>', '</i>', '<br />', '__']
+    rnd = random.Random(42)
+    samples = [''.join(rnd.choice(alphabet) for _ in range(rnd.randint(0, 40))) for _ in range(5000)]
+    samples += [p.read_text(encoding='utf-8') for p in (Path(__file__).parents[1] / 'data' / 'courses').glob('*/lesson*/*')
+                if p.suffix in ('.txt', '.md')]
+
+    for text in samples:
+        assert process_markdown(text) == _legacy_process_markdown(text), repr(text)
+        assert process_markdown_simple(text) == _legacy_process_markdown_simple(text), repr(text)
+
+
+def entity_tuples(entities):
+    return [(e.type, e.offset, e.length) for e in entities]
+
+
+def test_render_entities_basic():
+    """Разметка превращается в entities, маркеры из текста убираются 🏷"""
+    [(text, entities)] = render_entities("*Жирный _курсив_*\n__Подчёркнутый__ ~нет~")
+
+    assert text == "Жирный курсив\nПодчёркнутый нет"
+    assert entity_tuples(entities) == [
+        ('bold', 0, 13), ('italic', 7, 6), ('underline', 14, 12), ('strikethrough', 27, 3)
+    ]
+
+
+def test_render_entities_stray_marker_is_text():
+    """Одинокий _ не ломает отправку — остаётся обычным символом 🛡"""
+    [(text, entities)] = render_entities("файл_урока.txt и *жирный*\nещё *один")
+
+    assert text == "файл_урока.txt и жирный\nещё *один"
+    assert entity_tuples(entities) == [('bold', 17, 6)]
+
+
+def test_render_entities_utf16_offsets():
+    """Смещения считаются в UTF-16: эмодзи занимает две единицы 💖"""
+    [(text, entities)] = render_entities("💖 *сердце*")
+
+    assert text == "💖 сердце"
+    assert entity_tuples(entities) == [('bold', 3, 6)]
+
+
+def test_render_entities_splits_long_lessons():
+    """Длинный урок режется по абзацам, сущности переносятся в свои куски ✂️"""
+    paragraph = "*Абзац* " + "слово " * 100
+    messages = render_entities("\n\n".join([paragraph.strip()] * 30), limit=1000)
+
+    assert len(messages) > 1
+    for text, entities in messages:
+        assert utf16_len(text) <= 1000
+        assert not text.startswith("\n")
+        for entity in entities:
+            assert text[entity.offset:entity.offset + entity.length] == "Абзац"
+
+
+def test_render_entities_clips_entity_across_split():
+    """Жирный фрагмент на границе сообщений делится на два 🔪"""
+    messages = render_entities("*" + "а" * 30 + "*", limit=20)
+
+    assert [t for t, _ in messages] == ["а" * 20, "а" * 10]
+    assert [entity_tuples(e) for _, e in messages] == [[('bold', 0, 20)], [('bold', 0, 10)]]
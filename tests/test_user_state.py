@@ -0,0 +1,53 @@
+import pytest
+import pytest_asyncio
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.utils.engine import create_engine
+from src.utils.fsm_storage import SQLiteStorage
+from src.utils.models import Base
+from src.utils.user_state import UserStateRecord, UserStates
+from src.utils.write_queue import WriteQueue
+
+
+@pytest_asyncio.fixture
+async def storage(tmp_path):
+    engine = create_engine(f"sqlite+aiosqlite:///{tmp_path / 'states.db'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    writer = WriteQueue(engine)
+    yield SQLiteStorage(max_entries=2, session_factory=async_sessionmaker(engine), writer=writer)
+    await writer.stop()
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_read_through_then_hits(storage):
+    """Первое сообщение читает БД, дальше состояние берётся из памяти 🧠"""
+    states = UserStates(storage)
+    assert await states.get(7) is None
+    assert await states.get(7) is None  # «состояния нет» тоже кэшируется
+    await states.set(7, 'femininity', 'waiting_homework', 2)
+    assert await states.get(7) == UserStateRecord('waiting_homework', 'femininity', 2)
+    assert storage.stats()['misses'] == 1
+
+
+@pytest.mark.asyncio
+async def test_durable_set_survives_restart(storage):
+    """set(durable=True) дожидается commit — новый процесс видит состояние 💾"""
+    await UserStates(storage).set(7, 'femininity', 'waiting_approval', 2, durable=True)
+    restarted = SQLiteStorage(session_factory=storage.session_factory, writer=storage.writer)
+    assert await UserStates(restarted).get(7) == UserStateRecord('waiting_approval', 'femininity', 2)
+
+
+@pytest.mark.asyncio
+async def test_dialog_clear_keeps_course_progress(storage):
+    """state.clear() в диалоге не сбрасывает прогресс по курсу 🎯"""
+    states = UserStates(storage)
+    await states.set(7, 'femininity', 'waiting_homework', 2)
+    dialog = StorageKey(bot_id=1, chat_id=7, user_id=7)
+    await storage.set_state(dialog, 'waiting_name')
+    await storage.set_state(dialog, None)
+    await storage.set_data(dialog, {})
+
+    assert (await states.get(7)).lesson == 2
@@ -0,0 +1,81 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import text
+
+from src.utils.lesson_queue import LessonQueue
+from src.utils.worker_leases import POLLING, WorkerLeases, shard_of
+
+NOW = datetime(2026, 10, 18, 12, 0, 0)
+
+# Чтение аренд идёт через session_scope() — в ту же тестовую БД
+pytestmark = pytest.mark.usefixtures('session_factory')
+
+
+def worker(name, writer):
+    return WorkerLeases(shards=4, owner=name, lease=30, writer=writer)
+
+
+@pytest.mark.asyncio
+async def test_shards_are_split_between_workers(writer):
+    """Второй процесс получает свою половину шардов, пересечений нет ⚖️"""
+    first, second = worker('w1', writer), worker('w2', writer)
+    await first.start(NOW)
+    await first.rebalance(NOW)
+    assert first.owned == {0, 1, 2, 3}
+
+    await second.start(NOW)
+    await second.rebalance(NOW)  # всё занято — ждём, пока первый отдаст лишнее
+    assert second.owned == set()
+
+    gained, lost, _ = await first.rebalance(NOW + timedelta(seconds=10))
+    assert first.owned == {0, 1} and lost == {2, 3}
+    await second.rebalance(NOW + timedelta(seconds=10))
+    assert second.owned == {2, 3}
+    assert first.owns(4) and second.owns(6) and not first.owns(6)
+
+
+@pytest.mark.asyncio
+async def test_dead_worker_shards_are_taken_over(writer):
+    """Воркер умер — после истечения аренды его шарды забирает живой 🪦"""
+    dead, alive = worker('w1', writer), worker('w2', writer)
+    await dead.start(NOW)
+    await dead.rebalance(NOW)
+    await alive.start(NOW)
+
+    await alive.rebalance(NOW + timedelta(seconds=10))
+    assert alive.owned == set()
+    await alive.rebalance(NOW + timedelta(seconds=31))
+    assert alive.owned == {0, 1, 2, 3} and alive.peers == 0
+
+
+@pytest.mark.asyncio
+async def test_polling_has_one_owner(writer):
+    """Поллит только один процесс, роль переходит после его остановки 📡"""
+    first, second = worker('w1', writer), worker('w2', writer)
+    await first.start(NOW)
+    await second.start(NOW)
+
+    assert await first.acquire(POLLING, NOW)
+    assert not await second.acquire(POLLING, NOW)
+
+    await first.release_all()
+    assert await second.acquire(POLLING, NOW)
+    _, _, lost_roles = await second.rebalance(NOW)
+    assert lost_roles == set() and POLLING in second.roles
+
+
+@pytest.mark.asyncio
+async def test_queue_loads_only_owned_shards(writer):
+    """Очередь дедлайнов грузит только уроки своих шардов 🧩"""
+    async with writer.engine.begin() as conn:
+        for user_id in range(1, 9):
+            await conn.execute(text(
+                "INSERT INTO lesson_deliveries (user_id, course_id, lesson, starts_at, next_file, next_send_at) "
+                "VALUES (:user_id, 'femininity', 2, '2026-10-18 12:00:00', 0, '2026-10-18 12:00:00')"
+            ), {'user_id': user_id})
+    leases = worker('w1', writer)
+    leases.owned = frozenset({1, 3})
+
+    queue = LessonQueue(shards=leases)
+    assert await queue.load() == 4
+    assert sorted(shard_of(user_id, 4) for user_id, _, _ in queue.pop_due(NOW)) == [1, 1, 3, 3]
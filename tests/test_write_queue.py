@@ -0,0 +1,118 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from src.utils.engine import create_engine
+from src.utils.write_queue import WriteQueue
+
+UPSERT = '''
+    INSERT INTO user_states (user_id, current_state) VALUES (:user_id, :state)
+    ON CONFLICT(user_id) DO UPDATE SET current_state = excluded.current_state
+'''
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path):
+    engine = create_engine(f"sqlite+aiosqlite:///{tmp_path / 'writes.db'}")
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE TABLE user_states (user_id INTEGER PRIMARY KEY, current_state TEXT NOT NULL)"))
+    yield engine
+    await engine.dispose()
+
+
+async def fetch_states(engine) -> dict:
+    async with engine.connect() as conn:
+        return dict((await conn.execute(text("SELECT user_id, current_state FROM user_states"))).all())
+
+
+@pytest.mark.asyncio
+async def test_concurrent_writes_share_commits(engine):
+    """50 параллельных записей — несколько commit'ов, а не 50 ✍️"""
+    queue = WriteQueue(engine, max_batch=100, max_delay=0.05)
+    results = await asyncio.gather(*(
+        queue.execute(UPSERT, {'user_id': i, 'state': 'waiting_homework'}) for i in range(50)
+    ))
+    await queue.stop()
+
+    assert results == [1] * 50
+    assert queue.stats()['writes'] == 50
+    assert queue.stats()['commits'] < 5
+    assert len(await fetch_states(engine)) == 50
+
+
+@pytest.mark.asyncio
+async def test_write_is_visible_when_awaited(engine):
+    """После await запись уже закоммичена и видна другому соединению 💾"""
+    queue = WriteQueue(engine, max_delay=0.01)
+    await queue.execute(UPSERT, {'user_id': 7, 'state': 'waiting_approval'})
+    assert await fetch_states(engine) == {7: 'waiting_approval'}
+    await queue.stop()
+
+
+@pytest.mark.asyncio
+async def test_bad_write_fails_alone(engine):
+    """Ошибочная запись откатывает пачку, но остальные записи проходят 🧯"""
+    queue = WriteQueue(engine, max_delay=0.05)
+    good = queue.submit(UPSERT, {'user_id': 1, 'state': 'ok'})
+    bad = queue.submit(UPSERT, {'user_id': 2, 'state': None})  # NOT NULL
+    other = queue.submit(UPSERT, {'user_id': 3, 'state': 'ok'})
+
+    assert await good == 1 and await other == 1
+    with pytest.raises(IntegrityError):
+        await bad
+    await queue.stop()
+
+    assert await fetch_states(engine) == {1: 'ok', 3: 'ok'}
+    assert queue.stats()['failed'] == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_size_is_bounded_and_stop_drains(engine):
+    """Пачка не больше max_batch, stop() дописывает очередь 📦"""
+    queue = WriteQueue(engine, max_batch=4, max_delay=1)
+    futures = [queue.submit(UPSERT, {'user_id': i, 'state': 's'}) for i in range(10)]
+    await queue.stop()
+
+    assert all(f.done() for f in futures)
+    assert queue.stats()['commits'] == 3
+    assert len(await fetch_states(engine)) == 10
+
+
+@pytest.mark.asyncio
+async def test_fetch_returns_rows_after_commit(engine):
+    """RETURNING-запись отдаёт строки, уже закоммиченные 🔙"""
+    queue = WriteQueue(engine)
+    rows = await queue.fetch(UPSERT + ' RETURNING user_id, current_state', {'user_id': 1, 'state': 'active'})
+    await queue.stop()
+
+    assert [tuple(row) for row in rows] == [(1, 'active')]
+    assert await fetch_states(engine) == {1: 'active'}
+
+
+@pytest.mark.asyncio
+async def test_transaction_is_atomic_within_batch(engine):
+    """transaction(): несколько операторов — всё или ничего, соседи по пачке не страдают 🔗"""
+    queue = WriteQueue(engine, max_delay=0.05)
+
+    async def move(conn):
+        await conn.execute(text(UPSERT), {'user_id': 1, 'state': 'moved'})
+        current = (await conn.execute(text("SELECT current_state FROM user_states WHERE user_id = 1"))).scalar()
+        return current
+
+    async def broken(conn):
+        await conn.execute(text(UPSERT), {'user_id': 2, 'state': 'half'})
+        await conn.execute(text(UPSERT), {'user_id': 3, 'state': None})  # NOT NULL
+
+    good = asyncio.ensure_future(queue.transaction(move))
+    bad = asyncio.ensure_future(queue.transaction(broken))
+    other = queue.submit(UPSERT, {'user_id': 4, 'state': 'ok'})
+
+    assert await good == 'moved'
+    with pytest.raises(IntegrityError):
+        await bad
+    assert await other == 1
+    await queue.stop()
+
+    assert await fetch_states(engine) == {1: 'moved', 4: 'ok'}  # от broken не осталось и половины